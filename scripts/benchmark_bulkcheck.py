@@ -0,0 +1,57 @@
+"""Compare the cost of reconciling Blossom's bulkcheck answer with the candidate posts.
+
+Run with `python scripts/benchmark_bulkcheck.py [amount of posts]`.
+"""
+import sys
+import timeit
+from typing import List
+
+from tor.helpers.bulkcheck import DuplicateFilter, posts_by_url, unseen_posts
+from tor.helpers.post_summary import PostSummary
+from tor.strings import translation
+
+i18n = translation()
+
+
+def make_posts(count: int) -> List[PostSummary]:
+    """Create candidate posts, where every tenth one links the same media as another."""
+    return [
+        PostSummary(
+            f"t3_{i:x}",
+            permalink=f"/r/sub{i % 50}/comments/{i:x}/title/",
+            url=f"https://i.redd.it/{i - i % 10 if i % 10 == 9 else i}.png",
+            created_utc=float(i),
+        )
+        for i in range(count)
+    ]
+
+
+def list_reconciliation(candidates: List[PostSummary], unseen_post_urls: List[str]) -> int:
+    """Reconcile like threaded_check_submissions used to, scanning the list of URLs."""
+    return len(
+        [
+            post
+            for post in candidates
+            if i18n["urls"]["reddit_url"].format(post.permalink) in unseen_post_urls
+        ]
+    )
+
+
+def map_reconciliation(candidates: List[PostSummary], unseen_post_urls: List[str]) -> int:
+    """Reconcile like threaded_check_submissions does now, through the URL map."""
+    unique, _ = DuplicateFilter(seen_posts=set()).split(candidates)
+    return len(unseen_posts(posts_by_url(unique), unseen_post_urls))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    candidates = make_posts(count)
+    # Blossom doesn't know half of the posts
+    unseen_post_urls = [
+        i18n["urls"]["reddit_url"].format(post.permalink) for post in candidates[::2]
+    ]
+
+    for reconcile in (list_reconciliation, map_reconciliation):
+        runs = 1 if reconcile is list_reconciliation else 10
+        seconds = timeit.timeit(lambda: reconcile(candidates, unseen_post_urls), number=runs)
+        print(f"{reconcile.__name__}: {count} posts in {seconds / runs * 1000:.1f}ms")
@@ -4,6 +4,7 @@ import os
 import pathlib
 import sys
 import time
+from datetime import datetime, timezone
 from typing import Any
 
 import beeline
@@ -18,11 +19,13 @@ from shiv.bootstrap import current_zipfile  # type: ignore
 import tor
 from tor import __version__
 from tor.core.config import config
-from tor.core.helpers import run_until_dead
+from tor.core.helpers import run_until_dead, sweep_partner_status
 from tor.core.inbox import check_inbox
 from tor.core.initialize import initialize
+from tor.core.posts import recheck_upvote_watchlist, retry_outbox
+from tor.helpers.backfill import BACKFILL_RATE
 from tor.helpers.flair import set_meta_flair_on_other_posts
-from tor.helpers.threaded_worker import threaded_check_submissions
+from tor.helpers.threaded_worker import backfill_subreddit, threaded_check_submissions
 
 ##############################
 NOOP_MODE = bool(os.getenv("NOOP_MODE", ""))
@@ -113,6 +116,12 @@ def run(cfg: Any) -> None:
     """
     check_inbox(cfg)
 
+    retry_outbox(cfg)
+
+    sweep_partner_status(cfg)
+
+    recheck_upvote_watchlist(cfg)
+
     threaded_check_submissions(cfg)
 
     set_meta_flair_on_other_posts(cfg)
@@ -121,6 +130,31 @@ def run(cfg: Any) -> None:
         time.sleep(15)
 
 
+def connect(cfg: Any) -> None:
+    """Log in to Reddit and load everything the bot needs to know about the partners."""
+    if cfg.debug_mode:
+        bot_name = "debug"
+    else:
+        bot_name = os.environ.get("BOT_NAME", "bot")
+
+    log.info(f"Connecting to Reddit as {bot_name}.")
+    cfg.reddit_settings = dict(
+        user_agent=bot_name,
+        client_id=os.environ.get("REDDIT_CLIENT_ID", ""),
+        client_secret=os.environ.get("REDDIT_SECRET", ""),
+        username=os.environ.get("REDDIT_USERNAME", ""),
+        password=os.environ.get("REDDIT_PASSWORD", ""),
+    )
+    cfg.r = Reddit(**cfg.reddit_settings)
+    initialize(cfg)
+    cfg.perform_header_check = True
+    log.info("Bot built and initialized")
+
+    tor.__SELF_NAME__ = cfg.r.user.me().name
+    if tor.__SELF_NAME__ not in tor.__BOT_NAMES__:
+        tor.__BOT_NAMES__.append(tor.__SELF_NAME__)
+
+
 @click.group(
     context_settings=dict(help_option_names=["-h", "--help", "--halp"]),
     invoke_without_command=True,
@@ -142,9 +176,42 @@ def run(cfg: Any) -> None:
     default=NOOP_MODE,
     help="Just run the daemon, but take no action (helpful for testing infrastructure changes)",
 )
+@click.option(
+    "--scanner-mode",
+    "scanner_mode",
+    type=click.Choice(["threaded", "asyncio"]),
+    default=config.scanner_mode,
+    help="Fetch the partner subreddits with a thread pool or on a single event loop",
+)
+@click.option(
+    "--scanner-concurrency",
+    "scanner_concurrency",
+    type=int,
+    default=config.scanner_concurrency,
+    help="The maximum amount of subreddit listings fetched at once in asyncio mode",
+)
+@click.option(
+    "--scanner-auth",
+    "scanner_auth",
+    type=click.Choice(["anonymous", "oauth"]),
+    default=config.scanner_auth,
+    help="Fetch the partner subreddits anonymously or through the OAuth API",
+)
 @click.version_option(version=__version__, prog_name=tor.__SELF_NAME__)
-def main(ctx: Context, debug: bool, noop: bool) -> None:
+def main(
+    ctx: Context,
+    debug: bool,
+    noop: bool,
+    scanner_mode: str,
+    scanner_concurrency: int,
+    scanner_auth: str,
+) -> None:
     """Run ToR."""
+    config.debug_mode = debug
+    config.scanner_mode = scanner_mode
+    config.scanner_concurrency = scanner_concurrency
+    config.scanner_auth = scanner_auth
+
     if ctx.invoked_subcommand:
         # If we asked for a specific command, don't run the bot. Instead, pass control
         # directly to the subcommand.
@@ -170,28 +237,7 @@ def main(ctx: Context, debug: bool, noop: bool) -> None:
     beeline.init(**args)
     atexit.register(beeline.close)
 
-    config.debug_mode = debug
-
-    if config.debug_mode:
-        bot_name = "debug"
-    else:
-        bot_name = os.environ.get("BOT_NAME", "bot")
-
-    log.info(f"Connecting to Reddit as {bot_name}.")
-    config.r = Reddit(
-        user_agent=bot_name,
-        client_id=os.environ.get("REDDIT_CLIENT_ID", ""),
-        client_secret=os.environ.get("REDDIT_SECRET", ""),
-        username=os.environ.get("REDDIT_USERNAME", ""),
-        password=os.environ.get("REDDIT_PASSWORD", ""),
-    )
-    initialize(config)
-    config.perform_header_check = True
-    log.info("Bot built and initialized")
-
-    tor.__SELF_NAME__ = config.r.user.me().name
-    if tor.__SELF_NAME__ not in tor.__BOT_NAMES__:
-        tor.__BOT_NAMES__.append(tor.__SELF_NAME__)
+    connect(config)
 
     if noop:
         run_until_dead(run_noop)
@@ -227,6 +273,78 @@ def selfcheck(verbose: bool) -> None:
     sys.exit(pytest.main(args))
 
 
+@main.command()
+@click.option(
+    "--requeue",
+    "requeue",
+    is_flag=True,
+    default=False,
+    help="Move the dead letters back into the outbox to be retried.",
+)
+def outbox(requeue: bool) -> None:
+    """Show the posts that still have to be put into the queue, and the ones we gave up on."""
+    # Including the ones the bot is working on right now
+    pending = sorted(config.outbox.jobs.values(), key=lambda job: job.post.created_utc)
+    for title, jobs in (("Pending", pending), ("Dead letters", config.outbox.dead_letters)):
+        click.echo(f"{title}: {len(jobs)}")
+        for job in jobs:
+            click.echo(
+                f"  {job.name} r/{job.post.subreddit} {job.post.title!r}\n"
+                f"    attempts: {job.attempts}, done: {', '.join(job.completed) or 'nothing'}\n"
+                f"    last error: {job.last_error or '-'}"
+            )
+
+    if requeue:
+        config.outbox.requeue_dead_letters()
+        click.echo("Moved the dead letters back into the outbox, the bot picks them up from there.")
+
+
+@main.command()
+@click.option("--sub", "subreddit", required=True, help="The partner subreddit to backfill.")
+@click.option(
+    "--since",
+    "since",
+    type=click.DateTime(),
+    required=True,
+    help="Put the posts since this time (UTC) into the queue.",
+)
+@click.option(
+    "--rate",
+    "rate",
+    type=float,
+    default=BACKFILL_RATE,
+    show_default=True,
+    help="How many posts are put into the queue per second at most.",
+)
+def backfill(subreddit: str, since: datetime, rate: float) -> None:
+    """Put the older posts of a partner subreddit into the queue.
+
+    For catching up after onboarding a new partner or after an outage. An
+    interrupted backfill continues where it stopped when it's started again
+    with the same arguments.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(levelname)s | %(funcName)s | %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S",
+    )
+    connect(config)
+
+    checkpoint = backfill_subreddit(
+        subreddit, since.replace(tzinfo=timezone.utc).timestamp(), config, rate=rate
+    )
+    if not checkpoint.done:
+        click.echo(
+            f"Stopped the backfill of r/{subreddit} after {checkpoint.pages} pages, run it"
+            " again with the same arguments to continue."
+        )
+        return
+    click.echo(
+        f"Backfilled r/{subreddit} since {since:%Y-%m-%d %H:%M}: {checkpoint.pages} pages,"
+        f" {checkpoint.published} posts put into the queue."
+    )
+
+
 BANNER = r"""
 ___________   __________
 \__    ___/___\______   \
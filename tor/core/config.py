@@ -1,6 +1,8 @@
 import os
+import threading
+from collections import Counter
 from datetime import datetime, timezone
-from typing import Dict, List, Union
+from typing import Any, Dict, List, Optional, Set, Union, cast
 
 import bugsnag
 from blossom_wrapper import BlossomAPI
@@ -12,6 +14,27 @@ from slackclient import SlackClient
 
 from tor import __root__, __version__
 from tor.core import cached_property
+from tor.helpers.async_scanner import AsyncScanner
+from tor.helpers.batching import ListingPlanner
+from tor.helpers.cursors import ListingCursors
+from tor.helpers.domains import DomainIndex
+from tor.helpers.inbox_lanes import INBOX_WORKERS as DEFAULT_INBOX_WORKERS
+from tor.helpers.inbox_lanes import LaneExecutor
+from tor.helpers.inbox_priority import InboxLatency
+from tor.helpers.inbox_stream import InboxCheckpoint
+from tor.helpers.intake import INTAKE_QUOTA as DEFAULT_INTAKE_QUOTA
+from tor.helpers.intake import INTAKE_WINDOW as DEFAULT_INTAKE_WINDOW
+from tor.helpers.intake import TARGET_BACKLOG as DEFAULT_TARGET_BACKLOG
+from tor.helpers.intake import IntakeController, IntakeScheduler
+from tor.helpers.journal import InboxJournal
+from tor.helpers.oauth import AppOnlyToken
+from tor.helpers.outbox import Outbox
+from tor.helpers.poll_scheduler import PollScheduler
+from tor.helpers.rate_limit import WRITE_BURST, WRITE_RATE, CircuitBreaker, RequestBudget
+from tor.helpers.read_marker import ReadMarker
+from tor.helpers.scanner import ScannerEngine, generate_user_agent
+from tor.helpers.seen_index import SeenPostIndex
+from tor.helpers.watchlist import UpvoteWatchlist
 
 load_dotenv()
 
@@ -21,11 +44,62 @@ SLACK_COC_ACCEPTED_CHANNEL_ID = os.getenv("SLACK_COC_ACCEPTED_CHANNEL_ID", "")
 SLACK_REMOVED_POST_CHANNEL_ID = os.getenv("SLACK_REMOVED_POST_CHANNEL_ID", "")
 SLACK_FORMATTING_ISSUE_CHANNEL_ID = os.getenv("SLACK_FORMATTING_ISSUE_CHANNEL_ID", "")
 
+# Where the bot keeps the state that has to survive a restart
+DATA_DIRECTORY = os.getenv("DATA_DIRECTORY", "data")
+
+# The amount of workers (and kept-alive connections) used to scan the partner subreddits.
+# Leave empty to derive it from the CPU count.
+SCANNER_WORKERS = int(os.getenv("SCANNER_WORKERS", "0")) or None
+
+# Either "threaded" (a pool of worker threads) or "asyncio" (a single event loop)
+SCANNER_MODE = os.getenv("SCANNER_MODE", "threaded")
+# The maximum amount of listing requests in flight at once in asyncio mode
+SCANNER_CONCURRENCY = int(os.getenv("SCANNER_CONCURRENCY", "50"))
+# Either "anonymous" (the public JSON listings) or "oauth" (the OAuth API, with an
+# app-only token minted from REDDIT_CLIENT_ID and REDDIT_SECRET)
+SCANNER_AUTH = os.getenv("SCANNER_AUTH", "anonymous")
+# How many new posts are put into the queue at the same time
+POSTING_WORKERS = int(os.getenv("POSTING_WORKERS", "4"))
+# How many inbox items are handled at the same time
+INBOX_WORKERS = int(os.getenv("INBOX_WORKERS", DEFAULT_INBOX_WORKERS))
+# How many seconds a scan of the partner subreddits may take at most
+SCAN_BUDGET = float(os.getenv("SCAN_BUDGET", "30"))
+# How many new posts of one partner subreddit may go into the queue per window of
+# INTAKE_WINDOW seconds; the rest waits for a later scan
+INTAKE_QUOTA = int(os.getenv("INTAKE_QUOTA", DEFAULT_INTAKE_QUOTA))
+INTAKE_WINDOW = float(os.getenv("INTAKE_WINDOW", DEFAULT_INTAKE_WINDOW))
+# How many unclaimed posts we aim to keep in the queue; the amount of new posts let
+# in per scan is adjusted to it
+INTAKE_TARGET_BACKLOG = int(os.getenv("INTAKE_TARGET_BACKLOG", DEFAULT_TARGET_BACKLOG))
+
+# The helpers that the worker threads share with the main thread. They are created
+# lazily, which isn't safe to do from several threads at once, so `prepare_workers`
+# creates them before any worker starts.
+SHARED_HELPERS = (
+    "tor",
+    "blossom",
+    "modchat",
+    "write_budget",
+    "seen_posts",
+    "outbox",
+    "intake",
+    "upvote_watchlist",
+    "inbox_journal",
+    "read_marker",
+    "inbox_latency",
+)
+
+# The configs of the worker threads, by the name of the thread
+_worker_configs: Dict[str, "WorkerConfig"] = {}
+_worker_lock = threading.Lock()
+
 
 class Config(object):
     """A singleton object for checking global config from anywhere in the application."""
 
     r: Reddit
+    # How we log in to Reddit; every worker thread logs in with these as well
+    reddit_settings: Dict[str, str] = {}
 
     # List of mods of ToR, fetched later using PRAW
     tor_mods: Union[List[str], ModeratorRelationship] = []
@@ -33,7 +107,7 @@ class Config(object):
     # A collection of Subreddit objects, injected later based on
     # subreddit-specific rules
     subreddits_to_check: List[str] = []
-    subreddits_domain_filter_bypass: List[str] = []
+    subreddits_domain_filter_bypass: Set[str] = set()
 
     # API keys for later overwriting based on contents of filesystem
     bugsnag_api_key = ""
@@ -46,8 +120,15 @@ class Config(object):
     perform_header_check = True
     debug_mode = False
 
+    scanner_mode = SCANNER_MODE
+    scanner_concurrency = SCANNER_CONCURRENCY
+    scanner_auth = SCANNER_AUTH
+    scan_budget = SCAN_BUDGET
+    posting_workers = POSTING_WORKERS
+
     last_post_scan_time = datetime(1970, 1, 1, 1, 1, 1, tzinfo=timezone.utc)
     last_set_meta_flair_time = datetime(1970, 1, 1, 1, 1, 1, tzinfo=timezone.utc)
+    last_status_sweep_time = datetime(1970, 1, 1, 1, 1, 1, tzinfo=timezone.utc)
 
     @cached_property
     def blossom(self) -> BlossomAPI:
@@ -67,16 +148,143 @@ class Config(object):
         else:
             return self.r.subreddit("transcribersofreddit")
 
+    @cached_property
+    def scanner(self) -> ScannerEngine:
+        """Get the long-lived worker pool and HTTP session of the subreddit scanner."""
+        return ScannerEngine(max_workers=SCANNER_WORKERS)
+
+    @cached_property
+    def async_scanner(self) -> AsyncScanner:
+        """Get the event loop based subreddit scanner."""
+        return AsyncScanner(concurrency=self.scanner_concurrency)
+
+    @cached_property
+    def scanner_token(self) -> Optional[AppOnlyToken]:
+        """Get the OAuth token shared by all scanner workers, if the scanner uses OAuth."""
+        if self.scanner_auth != "oauth":
+            return None
+        return AppOnlyToken(
+            os.getenv("REDDIT_CLIENT_ID", ""),
+            os.getenv("REDDIT_SECRET", ""),
+            user_agent=generate_user_agent(),
+        )
+
+    @cached_property
+    def listing_planner(self) -> ListingPlanner:
+        """Get the planner that groups the partner subreddits into combined listings."""
+        return ListingPlanner()
+
+    @cached_property
+    def listing_cursors(self) -> ListingCursors:
+        """Get the high-water marks of the posts we have seen per partner subreddit."""
+        return ListingCursors()
+
+    @cached_property
+    def poll_scheduler(self) -> PollScheduler:
+        """Get the scheduler deciding which partner subreddits are due to be polled."""
+        return PollScheduler()
+
+    @cached_property
+    def deadline_misses(self) -> Counter:
+        """Get how often every partner subreddit didn't make it within the scan budget."""
+        return Counter()
+
+    @cached_property
+    def request_budget(self) -> RequestBudget:
+        """Get the rate limit budget shared by all scanner workers."""
+        return RequestBudget()
+
+    @cached_property
+    def write_budget(self) -> RequestBudget:
+        """Get the rate limit budget shared by everything that posts to Reddit."""
+        return RequestBudget(rate=WRITE_RATE, burst=WRITE_BURST, reserve=0)
+
+    @cached_property
+    def subreddit_breaker(self) -> CircuitBreaker:
+        """Get the circuit breaker for partner subreddits that keep erroring."""
+        return CircuitBreaker()
+
+    @cached_property
+    def seen_posts(self) -> SeenPostIndex:
+        """Get the index of the partner posts that Blossom already knows about."""
+        return SeenPostIndex(os.path.join(DATA_DIRECTORY, "seen_posts.idx"))
+
+    @cached_property
+    def outbox(self) -> Outbox:
+        """Get the posts that still have to be put into the queue."""
+        return Outbox(os.path.join(DATA_DIRECTORY, "outbox.json"))
+
+    @cached_property
+    def intake(self) -> IntakeScheduler:
+        """Get the scheduler sharing the intake of new posts between the partner subreddits."""
+        return IntakeScheduler(quota=INTAKE_QUOTA, window=INTAKE_WINDOW)
+
+    @cached_property
+    def intake_controller(self) -> IntakeController:
+        """Get the controller adjusting the intake of new posts to the backlog of the queue."""
+        return IntakeController(target=INTAKE_TARGET_BACKLOG)
+
+    @cached_property
+    def upvote_watchlist(self) -> UpvoteWatchlist:
+        """Get the posts that are waiting to reach the upvote threshold of their subreddit."""
+        return UpvoteWatchlist()
+
+    @cached_property
+    def inbox_checkpoint(self) -> InboxCheckpoint:
+        """Get the newest inbox item that we are done with."""
+        return InboxCheckpoint(os.path.join(DATA_DIRECTORY, "inbox_checkpoint.json"))
+
+    @cached_property
+    def read_marker(self) -> ReadMarker:
+        """Get the inbox items that still have to be marked as read."""
+        return ReadMarker(os.path.join(DATA_DIRECTORY, "pending_reads.json"))
+
+    @cached_property
+    def inbox_journal(self) -> InboxJournal:
+        """Get the record of the inbox items we handled and what we did for them."""
+        return InboxJournal(os.path.join(DATA_DIRECTORY, "inbox_journal.log"))
+
+    @cached_property
+    def inbox_lanes(self) -> LaneExecutor:
+        """Get the pool of workers handling the inbox, with a lane per post."""
+        return LaneExecutor(max_workers=INBOX_WORKERS)
+
+    @cached_property
+    def inbox_latency(self) -> InboxLatency:
+        """Get how long the inbox items of every priority class waited to be handled."""
+        return InboxLatency()
+
     @cached_property
     def modchat(self) -> SlackClient:
         """Get the SLack client for the mod chat."""
         return SlackClient(os.getenv("SLACK_API_KEY", None))
 
+    def prepare_workers(self) -> None:
+        """Create the helpers that the worker threads share, before any of them starts."""
+        for name in SHARED_HELPERS:
+            getattr(self, name)
+
+    def for_thread(self) -> "Config":
+        """Get the config for the current worker thread, with a Reddit client of its own.
+
+        PRAW doesn't support sharing a Reddit client (or its session, rate
+        limiter and authorizer) between threads. The clients are kept by the
+        name of the thread, so the workers of consecutive scans (which have the
+        same names) don't have to log in again every time.
+        """
+        name = threading.current_thread().name
+        with _worker_lock:
+            if (worker := _worker_configs.get(name)) is None:
+                worker = _worker_configs[name] = WorkerConfig(self, Reddit(**self.reddit_settings))
+        return cast(Config, worker)
+
     # Compatibility
     core_version = __version__
     video_domains: List[str] = []
     audio_domains: List[str] = []
     image_domains: List[str] = []
+    # All of the above, indexed by domain
+    domain_index = DomainIndex()
     video_formatting = ""
     audio_formatting = ""
     image_formatting = ""
@@ -84,6 +292,27 @@ class Config(object):
     no_link_header_subs: List[str] = []
 
 
+class WorkerConfig(object):
+    """The config as seen from a worker thread, see `Config.for_thread`.
+
+    Only the Reddit client (and the subreddit objects made from it) belong to
+    the worker. Everything else is looked up on (and written to) the config of
+    the main thread, so the workers share its helpers and see its changes.
+    """
+
+    def __init__(self, cfg: Config, reddit: Reddit) -> None:
+        """Create the config of a worker with the given Reddit client."""
+        object.__setattr__(self, "_cfg", cfg)
+        object.__setattr__(self, "r", reddit)
+        object.__setattr__(self, "tor", reddit.subreddit(cfg.tor.display_name))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cfg, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._cfg, name, value)
+
+
 try:
     Config.bugsnag_api_key = open("bugsnag.key").readline().strip()
 except OSError:
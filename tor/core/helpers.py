@@ -4,9 +4,11 @@ import re
 import signal
 import sys
 import time
+from datetime import datetime, timedelta, timezone
 from typing import Any, Callable, Dict, List
 
 import beeline
+from blossom_wrapper import BlossomStatus
 from dotenv import load_dotenv
 from praw.exceptions import APIException
 from praw.models import Comment, Submission, Subreddit
@@ -20,6 +22,7 @@ from tor.core.config import (
     Config,
     config,
 )
+from tor.helpers.status_sweep import SWEEP_INTERVAL, SWEEP_SIZE, chunked, partner_fullname
 from tor.strings import translation
 
 load_dotenv()
@@ -294,21 +297,24 @@ def _nsfw_on_blossom(cfg: Config, b_submission: Dict) -> None:
         )
 
 
-@beeline.traced(name="remove_if_required")
-def remove_if_required(cfg: Config, r_submission: Submission, b_submission: Dict) -> bool:
-    """Automatically handle the post if it has been unclaimed.
+def _needs_status_sync(r_submission: Submission, partner_submission: Submission) -> bool:
+    """Check whether the partner post was marked as NSFW or removed, but our post wasn't."""
+    return (not r_submission.over_18 and partner_submission.over_18) or (
+        not r_submission.removed_by_category and bool(partner_submission.removed_by_category)
+    )
 
-    We can handle the following scenarios automatically:
-    - The post has been removed on the partner sub. We can just delete remove
-      it from the queue too.
-    - The post has been reported as NSFW. We can check if the post has
-      been marked as NSFW on the partner sub. If yes, we mark it as
-      NSFW on both Reddit and Blossom.
+
+def sync_partner_status(
+    cfg: Config, r_submission: Submission, partner_submission: Submission, b_submission: Dict
+) -> bool:
+    """Bring our post in line with the current state of the partner post.
+
+    - If the partner post has been removed, we remove it from the queue too.
+    - If the partner post has been marked as NSFW, we mark it as NSFW on
+      both Reddit and Blossom.
 
     :returns: True, if the post has been removed, else False.
     """
-    partner_submission = cfg.r.submission(url=r_submission.url)
-
     # Check if the post is marked as NSFW on the partner sub, but not on ToR
     if not r_submission.over_18 and partner_submission.over_18:
         # Mark NSFW on ToR and Blossom too
@@ -332,6 +338,72 @@ def remove_if_required(cfg: Config, r_submission: Submission, b_submission: Dict
     return False
 
 
+@beeline.traced(name="remove_if_required")
+def remove_if_required(cfg: Config, r_submission: Submission, b_submission: Dict) -> bool:
+    """Automatically handle the post if it has been unclaimed.
+
+    We can handle the following scenarios automatically:
+    - The post has been removed on the partner sub. We can just delete remove
+      it from the queue too.
+    - The post has been reported as NSFW. We can check if the post has
+      been marked as NSFW on the partner sub. If yes, we mark it as
+      NSFW on both Reddit and Blossom.
+
+    :returns: True, if the post has been removed, else False.
+    """
+    partner_submission = cfg.r.submission(url=r_submission.url)
+    return sync_partner_status(cfg, r_submission, partner_submission, b_submission)
+
+
+@beeline.traced(name="sweep_partner_status")
+def sweep_partner_status(cfg: Config) -> None:
+    """Check the partner posts of the whole open queue for removals and NSFW.
+
+    `remove_if_required` only looks at a post when somebody unclaims it, so a
+    post that was removed on the partner sub can sit in the queue for a long
+    time. Every few minutes, we look up the partner posts of all unclaimed
+    posts in bulk through /api/info (PRAW asks for 100 posts per request) and
+    apply the same changes to the ones that need it.
+    """
+    now = datetime.now(tz=timezone.utc)
+    if now < cfg.last_status_sweep_time + timedelta(seconds=SWEEP_INTERVAL):
+        return
+    cfg.last_status_sweep_time = now
+
+    queue_posts: Dict[str, Submission] = {}
+    for r_submission in cfg.tor.new(limit=SWEEP_SIZE):
+        if r_submission.link_flair_template_id != flair.unclaimed:
+            continue
+        if r_submission.removed_by_category:
+            continue
+        if fullname := partner_fullname(r_submission.url):
+            queue_posts[fullname] = r_submission
+
+    synced = removed = 0
+    for fullnames in chunked(list(queue_posts)):
+        for partner_submission in cfg.r.info(fullnames=fullnames):
+            r_submission = queue_posts[partner_submission.fullname]
+            if not _needs_status_sync(r_submission, partner_submission):
+                continue
+
+            # Only the few posts that need a change are looked up in Blossom
+            response = cfg.blossom.get_submission(url=r_submission.url)
+            if response.status != BlossomStatus.ok:
+                log.warning(f"Could not find {r_submission.fullname} in Blossom, skipping it.")
+                continue
+            synced += 1
+            if sync_partner_status(cfg, r_submission, partner_submission, response.data[0]):
+                removed += 1
+
+    beeline.add_context(
+        {"sweep_queue_posts": len(queue_posts), "sweep_synced": synced, "sweep_removed": removed}
+    )
+    log.info(
+        f"Swept {len(queue_posts)} queue posts: {synced} synced with their partner post,"
+        f" {removed} removed."
+    )
+
+
 def cleanup_post_title(title: str) -> str:
     """Clean up the given post title.
 
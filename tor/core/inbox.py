@@ -1,8 +1,13 @@
+import copy
 import logging
 import random
-from typing import Optional
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
 
 import beeline
+from praw import Reddit
+from praw.endpoints import API_PATH
 from praw.exceptions import ClientException
 from praw.models import Comment, Message
 from praw.models.reddit.mixins import InboxableMixin
@@ -32,6 +37,10 @@ from tor.core.user_interaction import (
     process_unclaim,
 )
 from tor.helpers.flair import flair_post
+from tor.helpers.inbox_lanes import MESSAGE_LANE
+from tor.helpers.inbox_priority import COMMAND, MOD_SUPPORT, OTHER, prioritize
+from tor.helpers.inbox_stream import INBOX_PAGE_SIZE, InboxStream
+from tor.helpers.journal import DONE, FLAIR, HANDLED, REPLY
 from tor.strings import translation
 from tor.validation.transcription_validation import is_comment_transcription
 
@@ -63,85 +72,107 @@ def forward_to_slack(item: InboxableMixin, cfg: Config) -> None:
     )
 
 
+def respond_to_reply(reply: Comment, cfg: Config) -> Tuple[Optional[str], Optional[str]]:
+    """Act on a reply to the bots messages and posts.
+
+    :return: the message to reply with and the flair to set on the post, if any.
+    """
+    log.debug(f"Received reply from {reply.author.name}: {reply.body}")
+    message: Optional[str] = ""
+    flair: Optional[str] = None
+    r_body = reply.body.lower()  # cache that thing
+
+    if "image transcription" in r_body or is_comment_transcription(reply, cfg):
+        post_link = reply.submission.url
+        sub_name = extract_sub_from_url(post_link)
+        message = i18n["responses"]["general"]["transcript_on_tor_post"].format(
+            sub_name=sub_name,
+            post_link=post_link,
+        )
+    elif matches := [
+        match.group()
+        for match in [regex.search(reply.body) for regex in MOD_SUPPORT_PHRASES]
+        if match
+    ]:
+        phrases = '"' + '", "'.join(matches) + '"'
+        send_to_modchat(
+            i18n["mod"]["intervention_needed"].format(
+                phrases=phrases,
+                link=reply.submission.shortlink,
+                author=reply.author.name,
+                text=reply.body,
+            ),
+            cfg,
+        )
+        message = i18n["responses"]["general"]["getting_help"]
+    elif "thank" in r_body:  # trigger on "thanks" and "thank you"
+        thumbs_up_gifs = i18n["urls"]["thumbs_up_gifs"]
+        youre_welcome = i18n["responses"]["general"]["youre_welcome"]
+        message = youre_welcome.format(random.choice(thumbs_up_gifs))
+    else:
+        submission = reply.submission
+        username = reply.author.name
+        if submission.author.name not in __BOT_NAMES__:
+            log.debug("Received 'command' on post we do not own. Ignoring.")
+            return None, None
+
+        blossom_submission = get_blossom_submission(submission, cfg)
+
+        if blossom_submission is None:
+            log.error(f"Failed to get Blossom submission {submission}!")
+            return None, None
+
+        if "i accept" in r_body:
+            message, flair = process_coc(username, reply.context, blossom_submission, cfg)
+        elif check_for_phrase(r_body, UNCLAIM_PHRASES):
+            message, flair = process_unclaim(username, blossom_submission, submission, cfg)
+        elif check_for_phrase(r_body, CLAIM_PHRASES):
+            message, flair = process_claim(username, blossom_submission, cfg)
+        elif check_for_phrase(r_body, DONE_PHRASES):
+            alt_text = "done" not in r_body
+            message, flair = process_done(
+                reply.author,
+                blossom_submission,
+                reply,
+                cfg,
+                alt_text_trigger=alt_text,
+            )
+        elif "!override" in r_body:
+            message, flair = process_override(
+                reply.author, blossom_submission, reply.parent_id, cfg
+            )
+        elif "!debug" in r_body:
+            message, flair = process_debug(reply.author, blossom_submission, cfg)
+        elif "!comment" in r_body:
+            message, flair = None, None
+        else:
+            # If we made it this far, it's something we can't process automatically
+            forward_to_slack(reply, cfg)
+    return message, flair
+
+
 @beeline.traced(name="process_reply")
 def process_reply(reply: Comment, cfg: Config) -> None:
-    """Process a reply to the bots messages and posts."""
+    """Process a reply to the bots messages and posts.
+
+    Every step is written down in the inbox journal as soon as it's done, so
+    if we handle the same reply again after a crash, we don't talk to Blossom,
+    reply or set the flair a second time.
+    """
+    journal = cfg.inbox_journal
     try:
-        log.debug(f"Received reply from {reply.author.name}: {reply.body}")
-        message: Optional[str] = ""
-        flair: Optional[str] = None
-        r_body = reply.body.lower()  # cache that thing
-
-        if "image transcription" in r_body or is_comment_transcription(reply, cfg):
-            post_link = reply.submission.url
-            sub_name = extract_sub_from_url(post_link)
-            message = i18n["responses"]["general"]["transcript_on_tor_post"].format(
-                sub_name=sub_name,
-                post_link=post_link,
-            )
-        elif matches := [
-            match.group()
-            for match in [regex.search(reply.body) for regex in MOD_SUPPORT_PHRASES]
-            if match
-        ]:
-            phrases = '"' + '", "'.join(matches) + '"'
-            send_to_modchat(
-                i18n["mod"]["intervention_needed"].format(
-                    phrases=phrases,
-                    link=reply.submission.shortlink,
-                    author=reply.author.name,
-                    text=reply.body,
-                ),
-                cfg,
-            )
-            message = i18n["responses"]["general"]["getting_help"]
-        elif "thank" in r_body:  # trigger on "thanks" and "thank you"
-            thumbs_up_gifs = i18n["urls"]["thumbs_up_gifs"]
-            youre_welcome = i18n["responses"]["general"]["youre_welcome"]
-            message = youre_welcome.format(random.choice(thumbs_up_gifs))
+        steps = journal.steps(reply.fullname)
+        if HANDLED in steps:
+            message, flair = steps[HANDLED]
         else:
-            submission = reply.submission
-            username = reply.author.name
-            if submission.author.name not in __BOT_NAMES__:
-                log.debug("Received 'command' on post we do not own. Ignoring.")
-                return
-
-            blossom_submission = get_blossom_submission(submission, cfg)
-
-            if blossom_submission is None:
-                log.error(f"Failed to get Blossom submission {submission}!")
-                return None
-
-            if "i accept" in r_body:
-                message, flair = process_coc(username, reply.context, blossom_submission, cfg)
-            elif check_for_phrase(r_body, UNCLAIM_PHRASES):
-                message, flair = process_unclaim(username, blossom_submission, submission, cfg)
-            elif check_for_phrase(r_body, CLAIM_PHRASES):
-                message, flair = process_claim(username, blossom_submission, cfg)
-            elif check_for_phrase(r_body, DONE_PHRASES):
-                alt_text = "done" not in r_body
-                message, flair = process_done(
-                    reply.author,
-                    blossom_submission,
-                    reply,
-                    cfg,
-                    alt_text_trigger=alt_text,
-                )
-            elif "!override" in r_body:
-                message, flair = process_override(
-                    reply.author, blossom_submission, reply.parent_id, cfg
-                )
-            elif "!debug" in r_body:
-                message, flair = process_debug(reply.author, blossom_submission, cfg)
-            elif "!comment" in r_body:
-                message, flair = None, None
-            else:
-                # If we made it this far, it's something we can't process automatically
-                forward_to_slack(reply, cfg)
-        if message:
+            message, flair = respond_to_reply(reply, cfg)
+            journal.record(reply.fullname, HANDLED, [message, flair])
+        if message and REPLY not in steps:
             send_reddit_reply(reply, message)
-        if flair:
+            journal.record(reply.fullname, REPLY)
+        if flair and FLAIR not in steps:
             flair_post(reply.submission, flair)
+            journal.record(reply.fullname, FLAIR)
 
     except (ClientException, AttributeError) as e:
         # the only way we should hit this is if somebody comments and then
@@ -172,47 +203,264 @@ def process_mention(mention: Comment) -> None:
         pass
 
 
+def handle_inbox_item(item: InboxableMixin, cfg: Config) -> None:
+    """Act on a single item of the inbox."""
+    # Very rarely we may actually get a message from Reddit itself.
+    # In this case, there will be no author attribute.
+    author_name = item.author.name if item.author else None
+
+    if author_name is None:
+        send_to_modchat(
+            f"We received a message without an author -- " f"*{item.subject}*:\n{item.body}",
+            cfg,
+        )
+    elif author_name == "transcribot":
+        # bot responses shouldn't trigger workflows in other bots
+        log.info("Skipping response from our OCR bot")
+    elif author_name == "blossom-app":
+        log.info("Skipping response from Blossom")
+    else:
+        if isinstance(item, Comment):
+            if is_our_subreddit(item.subreddit.name, cfg):
+                process_reply(item, cfg)
+            else:
+                log.info(f"Received username mention! ID {item}")
+                process_mention(item)
+        elif isinstance(item, Message):
+            if item.subject[0] == "!":
+                process_command(item, cfg)
+            else:
+                process_message(item, cfg)
+        else:
+            # We don't know what the heck this is, so just send it onto
+            # slack for manual triage.
+            forward_to_slack(item, cfg)
+
+
+def fetch_inbox_page(before: Optional[str], cfg: Config) -> List[Dict[str, Any]]:
+    """Get the page of inbox items right after the given one, newest first.
+
+    Without a checkpoint to start from (the very first run, or after the item
+    of the checkpoint disappeared), this falls back to all unread items. Reddit
+    lists them newest first, so the whole list is paged through once to find
+    the oldest one; after that, the inbox is paged from the checkpoint again.
+
+    The items are returned as the JSON that Reddit sent, so every worker can
+    turn them into PRAW objects of its own (see `parse_inbox_item`).
+    """
+    if before is not None:
+        listing = cfg.r.request(
+            method="GET",
+            path=API_PATH["inbox"],
+            params={"limit": INBOX_PAGE_SIZE, "before": before},
+        )
+        return listing["data"]["children"]
+
+    items: List[Dict[str, Any]] = []
+    params = {"limit": INBOX_PAGE_SIZE, "mark": "false"}
+    while True:
+        listing = cfg.r.request(method="GET", path=API_PATH["unread"], params=params)
+        items += listing["data"]["children"]
+        if not listing["data"]["after"]:
+            return items
+        params["after"] = listing["data"]["after"]
+
+
+def parse_inbox_item(data: Dict[str, Any], reddit: Reddit) -> InboxableMixin:
+    """Turn the JSON of an inbox item into a Comment or Message of the given client.
+
+    PRAW changes the data while it parses it, so it's parsed from a copy.
+    """
+    return reddit._objector.objectify(copy.deepcopy(data))
+
+
+def flush_read_marks(cfg: Config) -> None:
+    """Mark the handled inbox items as read on Reddit, 25 per request."""
+
+    def mark_read(fullnames: List[str]) -> None:
+        cfg.write_budget.wait()
+        cfg.r.post(API_PATH["read_message"], data={"id": ",".join(fullnames)})
+        # Reddit won't show them to us again, so there's nothing to replay anymore
+        cfg.inbox_journal.forget(fullnames)
+
+    if marked := cfg.read_marker.flush(mark_read):
+        log.debug(f"Marked {marked} inbox items as read")
+
+
+def classify_inbox_item(item: InboxableMixin) -> int:
+    """Tell how urgent an inbox item is, from its kind and text alone.
+
+    This follows the order in which `respond_to_reply` looks at a reply, but
+    without any requests, so the whole page can be classified up front.
+    """
+    if isinstance(item, Message):
+        # Mod commands go before the private messages of users
+        return MOD_SUPPORT if item.subject.startswith("!") else OTHER
+    if not isinstance(item, Comment) or getattr(item, "type", None) == "username_mention":
+        return OTHER
+
+    r_body = item.body.lower()
+    if "image transcription" in r_body:
+        return OTHER
+    if any(regex.search(item.body) for regex in MOD_SUPPORT_PHRASES):
+        return MOD_SUPPORT
+    if "thank" in r_body:
+        return OTHER
+    if (
+        "i accept" in r_body
+        or "!override" in r_body
+        or check_for_phrase(r_body, UNCLAIM_PHRASES + CLAIM_PHRASES + DONE_PHRASES)
+    ):
+        return COMMAND
+    return OTHER
+
+
+def inbox_lane(item: InboxableMixin) -> str:
+    """Return the lane in which the given inbox item is handled.
+
+    The replies on our posts are handled in the order they came in per post,
+    so a claim and a done on the same post can't overtake each other. The post
+    is known from the link of the reply, so this doesn't cost a request.
+    Private messages and username mentions share a lane of their own.
+    """
+    if isinstance(item, Comment) and getattr(item, "type", None) != "username_mention":
+        return item.submission.id
+    return MESSAGE_LANE
+
+
+@beeline.traced_thread
+def consume_inbox_item(item: InboxableMixin, cfg: Config) -> bool:
+    """Handle the given inbox item, unless that happened already.
+
+    :return: True if the item was handled now.
+    """
+    # Items that were read in the meantime (e.g. by a mod) are left alone
+    if not item.new or item.fullname in cfg.read_marker:
+        return False
+    handled = False
+    # After a crash, the journal knows whether we got to the end already
+    if DONE not in cfg.inbox_journal.steps(item.fullname):
+        handle_inbox_item(item, cfg)
+        cfg.inbox_journal.record(item.fullname, DONE)
+        handled = True
+    # No matter what, we want to mark this as read so we don't re-process it.
+    cfg.read_marker.add(item.fullname)
+    return handled
+
+
 @beeline.traced(name="check_inbox")
 def check_inbox(cfg: Config) -> None:
-    """Go through all the unread messages in the inbox.
+    """Go through the unread messages in the inbox, oldest first.
 
     It deliberately leaves mail which does not fit into either category so that it can
     be read manually at a later point.
 
+    The inbox is read page by page after the checkpoint of the last item we
+    handled, so the first reply is answered right away instead of after
+    downloading the whole backlog. At most MAX_INBOX_ITEMS items are handled
+    per loop; the rest waits for the next one.
+
+    The items of a page are handled by a pool of workers, in a lane per post
+    (see `inbox_lane`). Claims and dones go to the workers before requests for
+    help, and those before thanks, mentions and private messages (see
+    `classify_inbox_item`); items that have been waiting for a while move up.
+    Once all items of the page are done, the checkpoint is moved past them, so
+    it never skips an item that isn't handled yet. PRAW clients can't be shared
+    between threads, so every worker makes its own copy of an item with its own
+    client (see `Config.for_thread`).
+
     :return: None.
     """
-    # Sort inbox, then act on it
-    # Invert the inbox so we're processing oldest first!
-    for item in reversed(list(cfg.r.inbox.unread(limit=None))):
-        # Very rarely we may actually get a message from Reddit itself.
-        # In this case, there will be no author attribute.
-        author_name = item.author.name if item.author else None
-
-        if author_name is None:
-            send_to_modchat(
-                f"We received a message without an author -- " f"*{item.subject}*:\n{item.body}",
-                cfg,
+    checkpoint = cfg.inbox_checkpoint
+    loop_started = time.time()
+    # Whatever a crashed loop didn't get to mark as read yet goes first
+    flush_read_marks(cfg)
+
+    page: List[InboxableMixin] = []
+    # The JSON of the items on the page, by their fullname
+    page_data: Dict[str, Dict[str, Any]] = {}
+    handled = 0
+
+    def fetch_page(before: Optional[str]) -> List[InboxableMixin]:
+        items = fetch_inbox_page(before, cfg)
+        page_data.update((data["data"]["name"], data) for data in items)
+        return [parse_inbox_item(data, cfg.r) for data in items]
+
+    def handle(data: Dict[str, Any], priority_class: int) -> bool:
+        worker = cfg.for_thread()
+        item = parse_inbox_item(data, worker.r)
+        if handled_now := consume_inbox_item(item, worker):
+            cfg.inbox_latency.add(priority_class, time.time() - item.created_utc)
+        return handled_now
+
+    def settle() -> None:
+        # Hand the items of the page to the workers, most urgent first. Then wait
+        # for them and move the checkpoint past the ones that are done, in the
+        # order they came in. If one of them failed, it's handled again next loop.
+        nonlocal handled
+        now = time.time()
+        classes = {item.fullname: classify_inbox_item(item) for item in page}
+        futures: Dict[str, Future] = {}
+        for item in prioritize(
+            page,
+            classify=lambda item: classes[item.fullname],
+            lane=inbox_lane,
+            waiting=lambda item: now - item.created_utc,
+        ):
+            futures[item.fullname] = cfg.inbox_lanes.submit(
+                inbox_lane(item), handle, page_data[item.fullname], classes[item.fullname]
             )
-        elif author_name == "transcribot":
-            # bot responses shouldn't trigger workflows in other bots
-            log.info("Skipping response from our OCR bot")
-        elif author_name == "blossom-app":
-            log.info("Skipping response from Blossom")
-        else:
-            if isinstance(item, Comment):
-                if is_our_subreddit(item.subreddit.name, cfg):
-                    process_reply(item, cfg)
-                else:
-                    log.info(f"Received username mention! ID {item}")
-                    process_mention(item)
-            elif isinstance(item, Message):
-                if item.subject[0] == "!":
-                    process_command(item, cfg)
-                else:
-                    process_message(item, cfg)
-            else:
-                # We don't know what the heck this is, so just send it onto
-                # slack for manual triage.
-                forward_to_slack(item, cfg)
-        # No matter what, we want to mark this as read so we don't re-process it.
-        item.mark_read()
+
+        error: Optional[Exception] = None
+        for item in page:
+            try:
+                handled += futures[item.fullname].result()
+            except Exception as e:
+                error = error or e
+                continue
+            if error is None:
+                checkpoint.advance(item.fullname, item.created_utc)
+        page.clear()
+        page_data.clear()
+        flush_read_marks(cfg)
+        if error is not None:
+            raise error
+
+    cfg.prepare_workers()
+    stream = InboxStream(fetch_page, checkpoint, on_page_end=settle)
+    try:
+        for item in stream:
+            page.append(item)
+    finally:
+        settle()
+
+    if stream.handed_out == 0 and checkpoint.fullname is not None:
+        # Reddit only pages from items it still lists. If there are unread items
+        # newer than the checkpoint, its item is gone and we have to start over.
+        # Items that came in while this loop ran were simply too late for it.
+        newest_unread = next(iter(cfg.r.inbox.unread(limit=1)), None)
+        if (
+            newest_unread is not None
+            and checkpoint.created_utc < newest_unread.created_utc < loop_started
+        ):
+            log.warning(f"Inbox checkpoint {checkpoint.fullname} is stale, starting over")
+            checkpoint.reset()
+
+    backlog_age = stream.oldest_pending_age()
+    latency = cfg.inbox_latency.report()
+    beeline.add_context(
+        {
+            "inbox_handled": handled,
+            "inbox_pages": stream.pages,
+            "inbox_page_backlog": stream.page_backlog,
+            "inbox_oldest_pending_age": backlog_age,
+            **{f"inbox_latency_{key}": value for key, value in latency.items()},
+        }
+    )
+    if stream.page_backlog:
+        log.info(
+            f"Handled {handled} inbox items, at least {stream.page_backlog} left for the"
+            f" next loop; the oldest is waiting for {backlog_age:.0f}s"
+        )
+    if handled:
+        log.debug(f"Inbox latency per class: {latency}")
@@ -5,6 +5,7 @@ from bugsnag.handlers import BugsnagHandler
 
 from tor.core.config import Config
 from tor.core.helpers import clean_list, get_wiki_page
+from tor.helpers.domains import DomainIndex
 
 # Use a logger local to this module
 log = logging.getLogger()
@@ -56,6 +57,9 @@ def populate_formatting(cfg: Config) -> None:
 def populate_domain_lists(cfg: Config) -> None:
     """Load the approved content domains into the config object from the wiki page.
 
+    Besides the plain lists, the domains are put into an index that maps them to
+    their content type, which is what the scanner uses to classify posts.
+
     :return: None.
     """
     domain_string = get_wiki_page("domains", cfg)
@@ -75,6 +79,16 @@ def populate_domain_lists(cfg: Config) -> None:
         # [current_domain_list.append(x) for x in domain_list]
         log.debug(f"Domain list populated: {current_domain_list}")
 
+    # The order matters: a domain that is in multiple lists counts as an image domain first
+    cfg.domain_index = DomainIndex(
+        {
+            "image": cfg.image_domains,
+            "audio": cfg.audio_domains,
+            "video": cfg.video_domains,
+        }
+    )
+    log.debug(f"Domain index built with {len(cfg.domain_index)} domains")
+
 
 @beeline.traced("populate_subreddit_lists")
 def populate_subreddit_lists(cfg: Config) -> None:
@@ -93,8 +107,8 @@ def populate_subreddit_lists(cfg: Config) -> None:
 
     log.debug(f"Retrieved subreddits subject to the upvote filter: {cfg.upvote_filter_subs}")
 
-    cfg.subreddits_domain_filter_bypass = clean_list(
-        get_wiki_page("subreddits/domain-filter-bypass", cfg).splitlines()
+    cfg.subreddits_domain_filter_bypass = set(
+        clean_list(get_wiki_page("subreddits/domain-filter-bypass", cfg).splitlines())
     )
     log.debug(
         f"Retrieved subreddits that bypass the domain filter: {cfg.subreddits_domain_filter_bypass}"
@@ -1,13 +1,17 @@
 import logging
-from typing import Dict, Optional, Union
+import time
+from typing import Dict, Optional
 
 import beeline
 from blossom_wrapper import BlossomResponse, BlossomStatus
 from praw.models import Submission
 
 from tor.core.config import Config
-from tor.core.helpers import _, cleanup_post_title
+from tor.core.helpers import _, clean_id, cleanup_post_title
 from tor.helpers.flair import flair
+from tor.helpers.outbox import BLOSSOM, REPLY, SUBMIT, PostingJob
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.status_sweep import chunked
 from tor.helpers.youtube import (
     is_transcribable_youtube_video,
     is_youtube_url,
@@ -17,11 +21,13 @@ from tor.strings import translation
 i18n = translation()
 log = logging.getLogger(__name__)
 
-PostSummary = Dict[str, Union[str, int, bool, None]]
+
+class BlossomError(Exception):
+    """Blossom did not do what we asked it to."""
 
 
 @beeline.traced(name="process_post")
-def process_post(new_post: PostSummary, cfg: Config) -> None:
+def process_post(new_post: PostSummary, cfg: Config) -> bool:
     """Process the given Reddit post.
 
     After a valid post has been discovered, this handles the formatting
@@ -29,68 +35,147 @@ def process_post(new_post: PostSummary, cfg: Config) -> None:
 
     :param new_post: Submission object that needs to be posted.
     :param cfg: the config object.
-    :return: None.
+    :return: True if the post has been put into the queue (or will be, by a
+        retry from the outbox), False otherwise.
     """
-    if not should_process_post(new_post, cfg):
-        return
-
-    log.info(
-        f'Posting call for transcription on ID {new_post["name"]} posted by {new_post["author"]}'
-    )
+    if not accept_post(new_post, cfg):
+        return False
 
-    if new_post["is_gallery"]:
-        content_type = "gallery"
-        content_format = cfg.image_formatting
+    log.info(f"Posting call for transcription on ID {new_post.name} posted by {new_post.author}")
 
-    elif new_post["domain"] in cfg.image_domains:
-        content_type = "image"
-        content_format = cfg.image_formatting
+    # The job is written down before anything is posted, so the post isn't lost
+    # if one of the steps fails; the outbox retries it later.
+    job = cfg.outbox.add(new_post, get_content_type(new_post, cfg))
+    run_posting_job(job, cfg)
+    return True
 
-    elif new_post["domain"] in cfg.audio_domains:
-        content_type = "audio"
-        content_format = cfg.audio_formatting
 
-    elif new_post["domain"] in cfg.video_domains:
-        content_type = "video"
-        content_format = cfg.video_formatting
+def run_posting_job(job: PostingJob, cfg: Config) -> bool:
+    """Put the post of the given job into the queue, continuing where it stopped before.
 
-    else:
-        # This means we pulled from a subreddit bypassing the filters.
-        content_type = "Other"
-        content_format = cfg.image_formatting
+    :return: True if the post is in the queue now, False if the job failed.
+    """
+    content_format = {
+        "audio": cfg.audio_formatting,
+        "video": cfg.video_formatting,
+    }.get(job.content_type, cfg.image_formatting)
 
     try:
-        request_transcription(new_post, content_type, content_format, cfg)
-    # The only errors that happen here are on Reddit's side -- pretty much
-    # exclusively 503s and 403s that arbitrarily resolve themselves. A missed
-    # post or two is not the end of the world.
+        request_transcription(job, content_format, cfg)
+    # The errors that happen here are pretty much exclusively 503s and 403s on
+    # Reddit's side that arbitrarily resolve themselves, so we try again later.
     except Exception as e:
+        gave_up = cfg.outbox.fail(job, e)
         log.error(
-            f"{e} - unable to post content.\n"
-            f'ID: {new_post["name"]}\n'
-            f'Title: {new_post["title"]}\n'
-            f'Subreddit: {new_post["subreddit"]}'
+            f"{e} - unable to post content"
+            f"{', giving up' if gave_up else ', will retry'}.\n"
+            f"ID: {job.post.name}\n"
+            f"Title: {job.post.title}\n"
+            f"Subreddit: {job.post.subreddit}\n"
+            f"Completed steps: {list(job.completed)}"
         )
+        return False
+
+    cfg.outbox.finish(job)
+    return True
+
+
+@beeline.traced(name="retry_outbox")
+def retry_outbox(cfg: Config) -> None:
+    """Retry the posts that could not be put into the queue earlier, if it's time to."""
+    for job in cfg.outbox.due():
+        log.info(f"Retrying {job.name} (attempt {job.attempts + 1}), done: {list(job.completed)}")
+        run_posting_job(job, cfg)
+
+
+@beeline.traced(name="recheck_upvote_watchlist")
+def recheck_upvote_watchlist(cfg: Config) -> None:
+    """Put the watched posts that have enough upvotes by now into the queue.
+
+    The watched posts are looked up in bulk, 100 per /api/info request, which
+    is a lot cheaper than polling the listings of their subreddits again. The
+    ones that made it are handed to the intake for the next scan.
+    """
+    watchlist = cfg.upvote_watchlist
+    if not watchlist.due():
         return
 
+    names = watchlist.start_recheck()
+    qualified = []
+    for fullnames in chunked(names):
+        found = set()
+        for submission in cfg.r.info(fullnames=fullnames):
+            post = watchlist.get(submission.fullname)
+            if post is None:
+                continue
+            found.add(post.name)
+            post.ups = submission.ups
+            post.archived = submission.archived
+            post.author = submission.author.name if submission.author else None
+            if submission.removed_by_category or not post.author or post.archived:
+                # It's not going to make it into the queue anymore
+                watchlist.remove(post.name)
+            elif has_enough_upvotes(post, cfg):
+                watchlist.remove(post.name)
+                qualified.append(post)
+        # Reddit leaves out the posts that don't exist anymore
+        for name in set(fullnames) - found:
+            watchlist.remove(name)
+
+    # The posts join the intake backlog instead of going into the queue right away.
+    # That way the next scan puts them in within its share of the intake, like
+    # any carried over post, and not at all once the queue is closed.
+    cfg.intake.defer(qualified)
+
+    beeline.add_context({"watchlist_checked": len(names), "watchlist_qualified": len(qualified)})
+    log.info(
+        f"Rechecked {len(names)} watched posts, {len(qualified)} have enough upvotes now,"
+        f" {len(watchlist)} still watched."
+    )
+
+
+def get_content_type(post: PostSummary, cfg: Config) -> str:
+    """Determine what kind of content the post is, based on its domain.
+
+    The scanner already classifies every post in the domain filter, so this
+    only has to look at the domain index for posts that didn't go through it.
+    """
+    if post.is_gallery:
+        return "gallery"
+    if post.content_type is None:
+        post.content_type = cfg.domain_index.content_type(post.domain)
+    # Without a content type we pulled from a subreddit bypassing the filters.
+    return post.content_type or "Other"
+
 
 def has_enough_upvotes(post: PostSummary, cfg: Config) -> bool:
     """Check if the post meets the minimum threshold for karma."""
-    subreddit = str(post["subreddit"])
-    upvotes = int(str(post["ups"]))
-
     # If the subreddit is not in the upvote filter, this would mean no threshold.
-    return upvotes >= cfg.upvote_filter_subs.get(subreddit, float("-inf"))
+    return post.ups >= cfg.upvote_filter_subs.get(post.subreddit, float("-inf"))
+
+
+def accept_post(post: PostSummary, cfg: Config) -> bool:
+    """Check whether the post can go into the queue, watching it if it lacks upvotes.
+
+    The scan does this before the intake hands out its room, so posts that are
+    turned down anyway don't use up the share of their subreddit.
+    """
+    if should_process_post(post, cfg):
+        return True
+    if not has_enough_upvotes(post, cfg):
+        # It might still get there; we'll look at it again later
+        cfg.upvote_watchlist.add(post)
+    return False
 
 
 def should_process_post(post: PostSummary, cfg: Config) -> bool:
     """Determine whether the provided post should be processed."""
-    url = str(post["url"])
+    url = post.url
     return all(
         [
             has_enough_upvotes(post, cfg),
-            not post["archived"],
-            post["author"],
+            not post.archived,
+            post.author,
             is_transcribable_youtube_video(url) if is_youtube_url(url) else True,
         ]
     )
@@ -107,24 +192,54 @@ def truncate_title(title: str) -> str:
 
 
 @beeline.traced(name="request_transcription")
-def request_transcription(
-    post: PostSummary, content_type: str, content_format: str, cfg: Config
-) -> None:
-    """Request a transcription by posting the provided post to our subreddit."""
+def request_transcription(job: PostingJob, content_format: str, cfg: Config) -> None:
+    """Request a transcription by posting the post of the job to our subreddit.
+
+    Every step is written down in the outbox as soon as it's done, and steps that
+    are done already (from an earlier, failed attempt) are skipped.
+    """
+    post = job.post
     title = i18n["posts"]["discovered_submit_title"].format(
-        sub=str(post["subreddit"]),
-        type=content_type.title(),
-        title=truncate_title(cleanup_post_title(str(post["title"]))),
+        sub=post.subreddit,
+        type=job.content_type.title(),
+        title=truncate_title(cleanup_post_title(post.title)),
     )
-    permalink = i18n["urls"]["reddit_url"].format(str(post["permalink"]))
-    submission = cfg.tor.submit(title=title, url=permalink, flair_id=flair.unclaimed)
+    permalink = i18n["urls"]["reddit_url"].format(post.permalink)
     intro = i18n["posts"]["rules_comment"].format(
-        post_type=content_type,
+        post_type=job.content_type,
         formatting=content_format,
         header=cfg.header,
     )
-    submission.reply(_(intro))
-    create_blossom_submission(post, submission, cfg)
+    # Posts can be put into the queue concurrently, so every write to Reddit takes
+    # its turn in the shared write budget
+    timings: Dict[str, float] = {}
+    started = time.monotonic()
+    if SUBMIT in job.completed:
+        submission = cfg.r.submission(id=clean_id(job.completed[SUBMIT]))
+    else:
+        with beeline.tracer(name="submit_to_tor"):
+            cfg.write_budget.wait()
+            submission = cfg.tor.submit(title=title, url=permalink, flair_id=flair.unclaimed)
+        cfg.outbox.complete(job, SUBMIT, submission.fullname)
+    timings["submit"] = time.monotonic() - started
+
+    started = time.monotonic()
+    if REPLY not in job.completed:
+        with beeline.tracer(name="post_rules_comment"):
+            cfg.write_budget.wait()
+            submission.reply(_(intro))
+        cfg.outbox.complete(job, REPLY)
+    timings["reply"] = time.monotonic() - started
+
+    started = time.monotonic()
+    if BLOSSOM not in job.completed:
+        with beeline.tracer(name="create_blossom_submission"):
+            response = create_blossom_submission(post, submission, cfg)
+        if response.status != BlossomStatus.ok:
+            raise BlossomError(f"Could not create the Blossom submission: {response.status}")
+        cfg.outbox.complete(job, BLOSSOM)
+    timings["blossom"] = time.monotonic() - started
+    log.debug(f"Posted {post.name} to the queue, took {timings}")
 
 
 def create_blossom_submission(
@@ -133,17 +248,17 @@ def create_blossom_submission(
     cfg: Config,
 ) -> BlossomResponse:
     """Create a new submission object in Blossom."""
-    if (content_url := str(original_post["url"])) is None:
+    if not (content_url := original_post.url):
         content_url = cfg.r.submission(url=tor_post.url).url
     tor_url = i18n["urls"]["reddit_url"].format(str(tor_post.permalink))
-    original_url = i18n["urls"]["reddit_url"].format(str(original_post["permalink"]))
+    original_url = i18n["urls"]["reddit_url"].format(original_post.permalink)
     return cfg.blossom.create_submission(
-        original_post["name"],
+        original_post.name,
         tor_url,
         original_url,
         content_url,
-        post_title=cleanup_post_title(str(original_post["title"])),
-        nsfw=original_post["is_nsfw"],
+        post_title=cleanup_post_title(original_post.title),
+        nsfw=original_post.is_nsfw,
     )
 
 
@@ -156,13 +271,14 @@ def get_blossom_submission(submission: Submission, cfg: Config) -> Optional[Dict
         # If we are here, this means that the current submission is not yet in Blossom.
         # Mock up a Blossom object, since this will only be used when Blossom doesn't
         # know about it
-        post_summary = {}
         linked_post = cfg.r.submission(url=submission.url)
-        post_summary["url"] = linked_post.url
-        post_summary["permalink"] = linked_post.permalink
-        post_summary["name"] = linked_post.fullname
-        post_summary["title"] = linked_post.title
-        post_summary["is_nsfw"] = linked_post.over_18
+        post_summary = PostSummary(
+            name=linked_post.fullname,
+            url=linked_post.url,
+            permalink=linked_post.permalink,
+            title=linked_post.title,
+            is_nsfw=linked_post.over_18,
+        )
 
         new_submission_response = create_blossom_submission(post_summary, submission, cfg)
 
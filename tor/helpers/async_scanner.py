@@ -0,0 +1,327 @@
+import asyncio
+import gzip
+import logging
+import ssl
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from tor.helpers.batching import ListingPlanner
+from tor.helpers.cursors import ListingCursors
+from tor.helpers.deadlines import CONNECT_TIMEOUT, READ_TIMEOUT, LatencyTracker
+from tor.helpers.oauth import AppOnlyToken
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.rate_limit import CircuitBreaker, RequestBudget
+from tor.helpers.scanner import (
+    ANONYMOUS,
+    ListingAccess,
+    ListingError,
+    ListingRequest,
+    generate_user_agent,
+    handle_listing_error,
+    posts_from_listing,
+    read_listing,
+)
+
+if TYPE_CHECKING:
+    from tor.core.config import Config
+
+log = logging.getLogger(__name__)
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+ConnectionKey = Tuple[str, str, int]
+
+
+class AsyncScanner(object):
+    """Fetch the listings of all partner subreddits on a single event loop.
+
+    Instead of one OS thread per in-flight request, every subreddit is fetched as
+    a coroutine on one event loop, with at most `concurrency` requests in flight
+    at the same time. The event loop (and with it the kept-alive connections to
+    Reddit) is reused for every scan.
+
+    There is no asynchronous HTTP client in our dependencies, so this speaks just
+    enough HTTP/1.1 over asyncio streams to GET a JSON listing: keep-alive,
+    gzip and chunked transfer encoding.
+
+    Like the threaded scanner, every request has a connect and a read deadline,
+    stragglers are hedged with a second request, and a scan can be given an
+    overall budget, after which the listings that are still loading are dropped
+    so they can be fetched during the next scan.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 50,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+    ) -> None:
+        """Create the event loop used for all scans."""
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.latency = LatencyTracker()
+        self.hedged = 0
+        # The subreddits that didn't make it within the budget of the last scan
+        self.missed_subreddits: List[str] = []
+        self.loop = asyncio.new_event_loop()
+        self.requests_sent = 0
+        self.connections_opened = 0
+        self._idle: Dict[ConnectionKey, List[Connection]] = defaultdict(list)
+        self._ssl_context = ssl.create_default_context()
+
+    def scan(
+        self,
+        batches: List[List[str]],
+        cfg: "Config",
+        on_posts: Optional[Callable[[List[PostSummary]], None]] = None,
+        deadline: Optional[float] = None,
+        access: ListingAccess = ANONYMOUS,
+    ) -> List[PostSummary]:
+        """Fetch the new posts of all the given batches of subreddits.
+
+        If given, `on_posts` is called with the posts of every batch as soon as
+        that batch is done. Batches that aren't done within `deadline` seconds
+        are given up on and end up in `missed_subreddits`. The listings are
+        fetched as described by `access`, see `listing_access`.
+        """
+        return self.loop.run_until_complete(
+            self.fetch_all(
+                batches,
+                cfg.listing_planner,
+                cfg.listing_cursors,
+                cfg.request_budget,
+                cfg.subreddit_breaker,
+                on_posts,
+                deadline,
+                access,
+                cfg.scanner_token,
+            )
+        )
+
+    async def fetch_all(
+        self,
+        batches: List[List[str]],
+        planner: ListingPlanner,
+        cursors: ListingCursors,
+        budget: RequestBudget,
+        breaker: CircuitBreaker,
+        on_posts: Optional[Callable[[List[PostSummary]], None]] = None,
+        deadline: Optional[float] = None,
+        access: ListingAccess = ANONYMOUS,
+        token: Optional[AppOnlyToken] = None,
+    ) -> List[PostSummary]:
+        """Fetch all batches concurrently, limited by the concurrency setting."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(subreddits: List[str]) -> List[PostSummary]:
+            async with semaphore:
+                posts = await self.get_subreddit_posts(
+                    subreddits, planner, cursors, budget, breaker, access, token
+                )
+            if posts is None:
+                # The combined listing was saturated or failed; fetch the subreddits
+                # one by one instead
+                posts = []
+                for result in await asyncio.gather(*[limited([sub]) for sub in subreddits]):
+                    posts += result
+            elif on_posts is not None:
+                on_posts(posts)
+            return posts
+
+        tasks = {asyncio.ensure_future(limited(batch)): batch for batch in batches}
+        self.missed_subreddits = []
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            # Nothing has been recorded for a listing before it's completely in, so
+            # these subreddits will simply be fetched again during the next scan
+            task.cancel()
+            self.missed_subreddits += tasks[task]
+        if pending:
+            await asyncio.wait(pending)
+
+        total_posts: List[PostSummary] = []
+        for task in done:
+            if (error := task.exception()) is not None:
+                log.warning("an exception was generated: {}".format(error))
+            else:
+                total_posts += task.result()
+        return total_posts
+
+    async def get_subreddit_posts(
+        self,
+        subreddits: List[str],
+        planner: ListingPlanner,
+        cursors: ListingCursors,
+        budget: RequestBudget,
+        breaker: CircuitBreaker,
+        access: ListingAccess = ANONYMOUS,
+        token: Optional[AppOnlyToken] = None,
+    ) -> Optional[List[PostSummary]]:
+        """Get new posts from the combined listing of the given subreddits.
+
+        Returns None if the subreddits have to be fetched one by one instead.
+        """
+        headers = {"User-Agent": generate_user_agent(), **access.headers}
+        request = ListingRequest(subreddits, cursors, base_url=access.base_url)
+        try:
+            while url := request.next_url():
+                await asyncio.sleep(budget.reserve_request())
+                try:
+                    status, response_headers, body = await self.hedged_get(
+                        url, budget, headers=headers
+                    )
+                except (OSError, EOFError, asyncio.TimeoutError) as e:
+                    raise ListingError(None, str(e) or type(e).__name__)
+                budget.update(response_headers)
+                request.add_page(read_listing(status, body))
+        except ListingError as e:
+            if handle_listing_error(e, subreddits, budget, breaker, token):
+                return None
+            return []
+        breaker.success(subreddits)
+        return posts_from_listing(request, planner, cursors)
+
+    async def hedged_get(
+        self, url: str, budget: RequestBudget, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Perform a GET request, hedged with a second one if the first is a straggler.
+
+        If the request takes longer than the 95th percentile of the recent ones,
+        a second request is sent (if the rate limit budget allows for it), and
+        the response that arrives first is returned.
+        """
+        first = asyncio.ensure_future(self.get(url, headers))
+        hedge_after = self.latency.hedge_after()
+        if hedge_after is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done or not budget.try_reserve():
+            return await first
+
+        self.hedged += 1
+        second = asyncio.ensure_future(self.get(url, headers))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for request in done:
+                    if request.exception() is None:
+                        return request.result()
+            # Both failed
+            return first.result()
+        finally:
+            # Cancel the slower request and wait for it to let go of its connection
+            for request in pending:
+                request.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    async def get(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Perform a GET request, reusing an idle connection to the host if there is one."""
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        host = parts.hostname or ""
+        key = (parts.scheme, host, parts.port or (443 if secure else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        request_lines = [
+            f"GET {path} HTTP/1.1",
+            f"Host: {parts.netloc}",
+            "Accept-Encoding: gzip",
+            "Connection: keep-alive",
+        ]
+        request_lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        request = ("\r\n".join(request_lines) + "\r\n\r\n").encode()
+
+        # An idle connection might have been closed by the server in the meantime,
+        # in which case we retry once on a fresh one.
+        started = time.monotonic()
+        while True:
+            reused = bool(self._idle[key])
+            if reused:
+                reader, writer = self._idle[key].pop()
+            else:
+                reader, writer = await asyncio.wait_for(self._connect(key), self.connect_timeout)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, response_headers, body = await asyncio.wait_for(
+                    self._read_response(reader), self.read_timeout
+                )
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused:
+                    raise
+            except BaseException:
+                # Timed out or cancelled halfway through a response; the connection
+                # can't be used for anything else anymore
+                writer.close()
+                raise
+
+        self.latency.add(time.monotonic() - started)
+        self.requests_sent += 1
+        if response_headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self._idle[key].append((reader, writer))
+
+        if response_headers.get("content-encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return status, response_headers, body
+
+    async def _connect(self, key: ConnectionKey) -> Connection:
+        scheme, host, port = key
+        self.connections_opened += 1
+        return await asyncio.open_connection(
+            host, port, ssl=self._ssl_context if scheme == "https" else None
+        )
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str], bytes]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        status = int(status_line.split()[1])
+
+        headers: Dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while size := int((await reader.readline()).split(b";")[0], 16):
+                body += await reader.readexactly(size)
+                await reader.readline()  # the CRLF after every chunk
+            await reader.readline()  # the CRLF after the last chunk
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            headers["connection"] = "close"
+        return status, headers, body
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Return how many requests were served over how many connections."""
+        return {
+            "requests": self.requests_sent,
+            "connections": self.connections_opened,
+            "reused": max(self.requests_sent - self.connections_opened, 0),
+        }
+
+    def close(self) -> None:
+        """Close all idle connections and the event loop."""
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+        self.loop.close()
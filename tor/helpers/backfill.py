@@ -0,0 +1,83 @@
+import json
+import os
+from typing import List, Optional, Tuple
+
+from tor.helpers.batching import BATCH_LIMIT
+from tor.helpers.files import atomic_write
+from tor.helpers.post_summary import PostSummary
+
+# How many posts a backfill puts into the queue per second at most
+BACKFILL_RATE = 0.2
+
+# How often a page is tried before the backfill stops, and how long to wait
+# (times the number of failures so far) before trying it again
+MAX_PAGE_ATTEMPTS = 5
+RETRY_DELAY = 10
+
+
+class BackfillCheckpoint(object):
+    """How far a backfill of a partner subreddit got, kept on disk.
+
+    A backfill pages backwards through the listing of the subreddit, from the
+    newest post to the first one older than `since`. After every page the
+    cursor of the next page is written down, so an interrupted backfill picks
+    up where it stopped instead of starting over.
+    """
+
+    def __init__(self, path: Optional[str], subreddit: str, since: float) -> None:
+        """Create the checkpoint, resuming the backfill in the file if it is the same one."""
+        self.path = path
+        self.subreddit = subreddit
+        self.since = since
+        self.after: Optional[str] = None
+        self.done = False
+        self.pages = 0
+        self.published = 0
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                data = json.load(checkpoint_file)
+            # A backfill of a different window starts from the top again
+            if data["subreddit"] == subreddit and data["since"] == since:
+                self.after = data["after"]
+                self.done = data["done"]
+                self.pages = data["pages"]
+                self.published = data["published"]
+
+    @property
+    def resumed(self) -> bool:
+        """Check whether this backfill continues an earlier one."""
+        return self.pages > 0
+
+    def read_page(self, page: List[PostSummary]) -> Tuple[List[PostSummary], Optional[str], bool]:
+        """Return the posts of a page within the window, the next cursor and if it was the last.
+
+        This doesn't move the checkpoint yet, that happens with `advance` once
+        the posts of the page are taken care of.
+        """
+        posts = [post for post in page if post.created_utc >= self.since]
+        last = len(posts) < len(page) or len(page) < BATCH_LIMIT
+        return posts, None if last else page[-1].name, last
+
+    def advance(self, after: Optional[str], done: bool, published: int = 0) -> None:
+        """Move the checkpoint past a page and write it down."""
+        self.after = after
+        self.done = done
+        self.pages += 1
+        self.published += published
+        self.save()
+
+    def save(self) -> None:
+        """Write the checkpoint to its file."""
+        if not self.path:
+            return
+        data = json.dumps(
+            {
+                "subreddit": self.subreddit,
+                "since": self.since,
+                "after": self.after,
+                "done": self.done,
+                "pages": self.pages,
+                "published": self.published,
+            }
+        )
+        atomic_write(self.path, data)
@@ -0,0 +1,130 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from tor.helpers.post_summary import PostSummary
+
+# The most posts Reddit will return in a single listing page
+BATCH_LIMIT = 100
+# Subreddit names can be 21 characters long; this keeps the URL at a sane length
+MAX_SUBREDDITS_PER_BATCH = 50
+# Only fill batches up to this fraction of a page, so a burst doesn't saturate them
+TARGET_FILL = 0.5
+
+
+def demultiplex(posts: List[PostSummary], subreddits: List[str]) -> Dict[str, List[PostSummary]]:
+    """Split the posts of a combined listing (r/a+b+c) back up per subreddit."""
+    names = {sub.casefold(): sub for sub in subreddits}
+    split: Dict[str, List[PostSummary]] = {sub: [] for sub in subreddits}
+    for post in posts:
+        sub = names.get(post.subreddit.casefold())
+        if sub is not None:
+            split[sub].append(post)
+    return split
+
+
+class ListingPlanner(object):
+    """Group the subreddits to scan into combined listing requests.
+
+    Reddit serves combined listings like /r/a+b+c/new.json?limit=100, so quiet
+    subreddits can share one request. To not lose posts, the expected amount of
+    new posts of a batch within one scan interval has to fit comfortably into a
+    single page. The post rate of every subreddit is learned from the listings
+    that we fetch; subreddits we know nothing about yet are fetched on their own.
+    """
+
+    def __init__(self, interval: float = 45, smoothing: float = 0.3) -> None:
+        """Create a planner for scans that happen every `interval` seconds."""
+        self.interval = interval
+        self.smoothing = smoothing
+        # Posts per second, smoothed over the listings we have seen
+        self.rates: Dict[str, float] = {}
+        # When we last successfully fetched the listing of every subreddit
+        self.last_fetched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def expected_posts(self, sub: str, now: Optional[float] = None) -> Optional[float]:
+        """Return how many new posts the subreddit is expected to have by now.
+
+        That is at least one scan interval worth of posts, or more if we haven't
+        looked at the subreddit for longer than that.
+        """
+        rate = self.rates.get(sub)
+        if rate is None:
+            return None
+        now = time.time() if now is None else now
+        window = max(now - self.last_fetched.get(sub, now), self.interval)
+        return rate * window
+
+    def plan(self, subreddits: List[str], now: Optional[float] = None) -> List[List[str]]:
+        """Group the given subreddits into batches that can be fetched together."""
+        capacity = BATCH_LIMIT * TARGET_FILL
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_load = 0.0
+
+        by_rate = sorted(subreddits, key=lambda sub: self.rates.get(sub, float("inf")))
+        for sub in by_rate:
+            expected = self.expected_posts(sub, now)
+            if expected is None or expected >= capacity:
+                # Unknown or too busy to share a page with anyone else
+                batches.append([sub])
+                continue
+            if current_load + expected > capacity or len(current) >= MAX_SUBREDDITS_PER_BATCH:
+                batches.append(current)
+                current, current_load = [], 0.0
+            current.append(sub)
+            current_load += expected
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def is_saturated(
+        self, posts: List[PostSummary], subreddits: List[str], limit: int = BATCH_LIMIT
+    ) -> bool:
+        """Check if a combined listing might have cut off new posts of its subreddits.
+
+        That is the case if the page is full and even its oldest post is newer
+        than the last time we looked at one of the subreddits.
+        """
+        if len(posts) < limit:
+            return False
+        with self._lock:
+            since = [self.last_fetched[sub] for sub in subreddits if sub in self.last_fetched]
+        if len(since) < len(subreddits):
+            return True
+        oldest = min(post.created_utc for post in posts)
+        return oldest > min(since)
+
+    def record(
+        self,
+        posts: List[PostSummary],
+        subreddits: List[str],
+        incremental: bool = False,
+        now: Optional[float] = None,
+    ) -> None:
+        """Learn the post rate of the given subreddits from a listing we fetched.
+
+        An incremental listing (fetched with a cursor) contains all posts since
+        we last fetched the subreddit, a full listing only tells us about the
+        time since its oldest post.
+        """
+        now = time.time() if now is None else now
+        per_sub = demultiplex(posts, subreddits)
+
+        if posts:
+            covered = now - min(post.created_utc for post in posts)
+        else:
+            covered = self.interval
+
+        with self._lock:
+            for sub in subreddits:
+                window = now - self.last_fetched.get(sub, now) if incremental else covered
+                observed = len(per_sub[sub]) / max(window, self.interval)
+                previous = self.rates.get(sub)
+                if previous is None:
+                    self.rates[sub] = observed
+                else:
+                    self.rates[sub] = previous + self.smoothing * (observed - previous)
+                self.last_fetched[sub] = now
@@ -0,0 +1,97 @@
+import threading
+from typing import Container, Dict, Iterable, List, Set, Tuple
+
+from tor.helpers.post_summary import PostSummary
+from tor.strings import translation
+
+i18n = translation()
+
+
+def post_url(post: PostSummary) -> str:
+    """Return the URL under which Blossom knows the given post."""
+    return i18n["urls"]["reddit_url"].format(post.permalink)
+
+
+def content_key(url: str) -> str:
+    """Normalize the content URL of a post, so the same media is recognized across posts."""
+    url = url.strip()
+    if "://" in url:
+        url = url.split("://", 1)[1]
+    host, slash, path = url.partition("/")
+    if host.startswith("www."):
+        host = host[len("www.") :]
+    return f"{host.lower()}{slash}{path}".rstrip("/")
+
+
+class DuplicateFilter(object):
+    """Drop the posts that are duplicates of other posts of the same scan.
+
+    When two partner subreddits link the same media, or one post is a crosspost
+    of another, only the oldest post is kept so we don't end up with two posts
+    in the queue for the same content. Crossposts of posts that we've already
+    taken care of during an earlier scan are dropped as well.
+
+    The duplicates of a post of this scan are held until that post is taken
+    care of (see `release`): if it never makes it into the queue, its
+    duplicates aren't written off with it.
+
+    The posts of a scan can be fed in several parts, as they come in.
+    """
+
+    def __init__(self, seen_posts: Container[str]) -> None:
+        """Create a filter that hasn't seen any posts of this scan yet."""
+        self.seen_posts = seen_posts
+        self.names: Set[str] = set()
+        # The kept post for every piece of media
+        self.keys: Dict[str, str] = {}
+        # The names of the duplicates of every kept post
+        self.held: Dict[str, List[str]] = {}
+        # The kept post that every post of this scan stands for, itself if it was kept
+        self._owners: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def split(self, posts: List[PostSummary]) -> Tuple[List[PostSummary], List[PostSummary]]:
+        """Split the posts into the ones to check with Blossom and the duplicates of others."""
+        unique = []
+        duplicates = []
+        with self._lock:
+            self.names.update(post.name for post in posts)
+            for post in sorted(posts, key=lambda post: post.created_utc):
+                parent = post.crosspost_parent
+                if parent is not None and parent in self.seen_posts:
+                    duplicates.append(post)
+                    continue
+                key = content_key(post.url) if post.url else post.name
+                if parent is not None and parent in self.names:
+                    owner = self._owners.get(parent, parent)
+                elif key in self.keys:
+                    owner = self.keys[key]
+                else:
+                    self.keys[key] = post.name
+                    self._owners[post.name] = post.name
+                    unique.append(post)
+                    continue
+                self._owners[post.name] = owner
+                self.held.setdefault(owner, []).append(post.name)
+                duplicates.append(post)
+        return unique, duplicates
+
+    def release(self, names: Iterable[str]) -> List[str]:
+        """Return the given posts that are taken care of, together with their duplicates."""
+        released = []
+        with self._lock:
+            for name in names:
+                released.append(name)
+                released += self.held.pop(name, [])
+        return released
+
+
+def posts_by_url(posts: Iterable[PostSummary]) -> Dict[str, PostSummary]:
+    """Map the URL of every post to the post, formatting each URL only once."""
+    return {post_url(post): post for post in posts}
+
+
+def unseen_posts(posts: Dict[str, PostSummary], unseen_urls: Iterable[str]) -> List[PostSummary]:
+    """Return the posts whose URL Blossom's bulkcheck told us it doesn't know yet."""
+    unseen = set(unseen_urls)
+    return [post for url, post in posts.items() if url in unseen]
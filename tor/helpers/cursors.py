@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from tor.helpers.post_summary import PostSummary
+
+# Reddit answers a `before=` cursor pointing at a post that has since been removed
+# with an empty page, which would make us blind to the subreddit. Because of that,
+# cursors are only trusted for this long before we double-check with a full listing.
+CURSOR_REFRESH_SECONDS = 30 * 60
+# An empty page from a cursor this old might just as well mean that the cursor post
+# is gone, so it's double-checked right away, but at most once per this many seconds
+EMPTY_RECHECK_SECONDS = 5 * 60
+# A refresh pages back a little further than the last one, in case a post showed up
+# in the listing later than its creation time says
+REFRESH_OVERLAP = 60
+# The most pages we'll walk forward through in a single scan
+MAX_PAGES = 10
+
+
+class HighWaterMark(NamedTuple):
+    """The newest post we have seen in a subreddit."""
+
+    name: str  # the fullname of the post, e.g. t3_8swl2n
+    created_utc: float
+
+
+class ListingCursors(object):
+    """Keep track of the newest post we have seen in every subreddit.
+
+    With those high-water marks we can ask Reddit for only the posts that are
+    newer (`before=`), instead of fetching the same newest posts every scan.
+    """
+
+    def __init__(
+        self,
+        refresh_after: float = CURSOR_REFRESH_SECONDS,
+        recheck_after: float = EMPTY_RECHECK_SECONDS,
+    ) -> None:
+        """Create an empty set of cursors."""
+        self.refresh_after = refresh_after
+        self.recheck_after = recheck_after
+        self.marks: Dict[str, HighWaterMark] = {}
+        # When we last fetched a full listing (without cursor) for the subreddit
+        self.verified: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def cursor(self, subreddits: List[str], now: Optional[float] = None) -> Optional[str]:
+        """Return the `before` cursor to use for a listing of the given subreddits.
+
+        The oldest high-water mark of the subreddits is used, so that the listing
+        contains the new posts of all of them. None means that a full listing
+        has to be fetched, either because we don't know a subreddit yet or
+        because it's time to double-check the cursor.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            marks = [self.marks[sub] for sub in subreddits if sub in self.marks]
+            verified = [self.verified.get(sub, 0.0) for sub in subreddits]
+        if not marks or len(marks) < len(subreddits):
+            return None
+        if now - min(verified) > self.refresh_after:
+            return None
+        return min(marks, key=lambda mark: mark.created_utc).name
+
+    def refresh_floor(self, subreddits: List[str]) -> Optional[float]:
+        """Return how far back a full listing of the subreddits has to page.
+
+        Everything that was created before the last full listing of a subreddit
+        was in that listing, and everything up to its high-water mark was seen,
+        so a refresh only has to reach back to the older of the two. None means
+        that we don't know one of the subreddits yet, and its newest posts are enough.
+        """
+        with self._lock:
+            if not subreddits or any(sub not in self.marks for sub in subreddits):
+                return None
+            return min(
+                max(self.marks[sub].created_utc, self.verified.get(sub, 0.0) - REFRESH_OVERLAP)
+                for sub in subreddits
+            )
+
+    def suspect_empty(self, subreddits: List[str], now: Optional[float] = None) -> bool:
+        """Check if an empty page for the cursor of the subreddits calls for a refresh.
+
+        A cursor that points at a removed post gives empty pages for good. When
+        the cursor post is older than `recheck_after` and the subreddits weren't
+        refreshed for that long either, an empty page is double-checked with a
+        full listing instead of waiting for the next regular refresh.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            marks = [self.marks[sub] for sub in subreddits if sub in self.marks]
+            verified = [self.verified.get(sub, 0.0) for sub in subreddits]
+        if not marks:
+            return False
+        oldest = min(mark.created_utc for mark in marks)
+        return now - oldest > self.recheck_after and now - min(verified) > self.recheck_after
+
+    def new_posts(self, sub: str, posts: List[PostSummary]) -> List[PostSummary]:
+        """Drop the posts of the subreddit that are not newer than its high-water mark."""
+        with self._lock:
+            mark = self.marks.get(sub)
+        if mark is None:
+            return posts
+        return [
+            post for post in posts if post.created_utc > mark.created_utc and post.name != mark.name
+        ]
+
+    def advance(
+        self, sub: str, posts: List[PostSummary], full_listing: bool, now: Optional[float] = None
+    ) -> None:
+        """Move the high-water mark of the subreddit to the newest of the given posts."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if full_listing:
+                self.verified[sub] = now
+            for post in posts:
+                mark = self.marks.get(sub)
+                if mark is None or post.created_utc > mark.created_utc:
+                    self.marks[sub] = HighWaterMark(post.name, post.created_utc)
@@ -0,0 +1,46 @@
+import threading
+from collections import deque
+from typing import Deque, Optional
+
+# How long we wait for a connection to Reddit, and then for every read from it
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+# Requests slower than this share of all recent requests get a second, hedged request
+HEDGE_PERCENTILE = 0.95
+# Don't start hedging before we know what a normal request looks like
+MIN_LATENCY_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class LatencyTracker(object):
+    """Keep track of how long the recent listing requests took.
+
+    Used to decide when a request is a straggler that is worth hedging: if it
+    takes longer than the 95th percentile of the recent requests, a second
+    request for the same listing is sent and whichever answers first wins.
+    """
+
+    def __init__(
+        self,
+        window: int = LATENCY_WINDOW,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = MIN_LATENCY_SAMPLES,
+    ) -> None:
+        """Create a tracker without any samples."""
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        """Record how long a request took."""
+        with self._lock:
+            self.samples.append(seconds)
+
+    def hedge_after(self) -> Optional[float]:
+        """Return after how many seconds a request should be hedged, None to not hedge."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            samples = sorted(self.samples)
+        return samples[min(int(len(samples) * self.percentile), len(samples) - 1)]
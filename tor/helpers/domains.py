@@ -0,0 +1,58 @@
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+# Rules starting with this match every subdomain of the rest, e.g. *.imgur.com
+WILDCARD = "*."
+
+
+def _reversed_labels(domain: str) -> Tuple[str, ...]:
+    """Split i.imgur.com into ("com", "imgur", "i")."""
+    return tuple(reversed(domain.strip().strip(".").lower().split(".")))
+
+
+class DomainIndex(object):
+    """Map the domain of a post to the type of content we expect behind it.
+
+    The approved domains are read once from the wiki, so instead of scanning
+    the lists of image, audio and video domains for every post, they are
+    indexed by their labels in reverse order. A lookup is then one dictionary
+    access for the exact domain plus one per parent domain for wildcard rules
+    like `*.imgur.com`, no matter how many domains we know about.
+    """
+
+    __slots__ = ("_exact", "_wildcards")
+
+    def __init__(self, rules: Optional[Mapping[str, Iterable[str]]] = None) -> None:
+        """Build the index from the domains of every content type.
+
+        If a domain shows up for several content types, the first one wins.
+        """
+        exact: Dict[Tuple[str, ...], str] = {}
+        wildcards: Dict[Tuple[str, ...], str] = {}
+        for content_type, domains in (rules or {}).items():
+            for domain in domains:
+                domain = domain.strip()
+                if domain.startswith(WILDCARD):
+                    wildcards.setdefault(_reversed_labels(domain[len(WILDCARD) :]), content_type)
+                elif domain:
+                    exact.setdefault(_reversed_labels(domain), content_type)
+        self._exact = exact
+        self._wildcards = wildcards
+
+    def __len__(self) -> int:
+        return len(self._exact) + len(self._wildcards)
+
+    def __contains__(self, domain: object) -> bool:
+        return self.content_type(str(domain)) is not None
+
+    def content_type(self, domain: str) -> Optional[str]:
+        """Return the content type of the given domain, None if it's not an approved one."""
+        if not domain:
+            return None
+        labels = _reversed_labels(domain)
+        if (content_type := self._exact.get(labels)) is not None:
+            return content_type
+        # The most specific wildcard rule wins
+        for length in range(len(labels) - 1, 0, -1):
+            if (content_type := self._wildcards.get(labels[:length])) is not None:
+                return content_type
+        return None
@@ -0,0 +1,51 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+
+def atomic_write(path: str, data: Union[str, bytes]) -> None:
+    """Replace the file at the given path with the data, all or nothing.
+
+    The data is written to a temporary file next to it first, which is flushed
+    to disk before it's renamed over the old file. A crash at any point leaves
+    either the old or the new file behind, never a truncated one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb" if isinstance(data, bytes) else "w") as temporary_file:
+        temporary_file.write(data)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+    # Make the rename itself stick as well
+    if hasattr(os, "O_DIRECTORY"):
+        directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Keep other processes away from the given file while the block runs.
+
+    This locks a `.lock` file next to it, which all processes of the bot that
+    change the file (e.g. the bot and `tor backfill`) take turns on. The lock
+    is advisory, and a no-op where the platform doesn't support it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,62 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Tuple
+
+# How many inbox items are handled at the same time
+INBOX_WORKERS = 4
+# The lane of the private messages and username mentions
+MESSAGE_LANE = "messages"
+
+_Task = Tuple[Future, Callable[..., Any], Tuple[Any, ...]]
+
+
+class LaneExecutor(object):
+    """Run tasks in parallel, except the tasks of the same lane.
+
+    The tasks of one lane run one after the other, in the order they were
+    submitted, while the tasks of different lanes share a pool of workers.
+    For the inbox, every post on r/TranscribersOfReddit is a lane: a claim and
+    a done on the same post are always handled in that order, while the
+    claims on other posts don't have to wait for a slow done.
+    """
+
+    def __init__(self, max_workers: int = INBOX_WORKERS) -> None:
+        """Create the executor with its pool of workers."""
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inbox")
+        # The tasks waiting for the running task of their lane, per busy lane
+        self._lanes: Dict[str, Deque[_Task]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, lane: str, fn: Callable[..., Any], *args: Any) -> Future:
+        """Run `fn(*args)` once the earlier tasks of the lane are done."""
+        future: Future = Future()
+        with self._lock:
+            if lane in self._lanes:
+                self._lanes[lane].append((future, fn, args))
+                return future
+            self._lanes[lane] = deque()
+        self.executor.submit(self._run_lane, lane, (future, fn, args))
+        return future
+
+    def _run_lane(self, lane: str, task: _Task) -> None:
+        # The worker sticks with the lane until it's empty
+        while True:
+            future, fn, args = task
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            with self._lock:
+                waiting = self._lanes[lane]
+                if not waiting:
+                    del self._lanes[lane]
+                    return
+                task = waiting.popleft()
+
+    def shutdown(self) -> None:
+        """Stop the workers after the submitted tasks are done."""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,80 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, TypeVar
+
+# The priority classes of inbox items, most urgent first
+COMMAND = 0  # claim, unclaim, done, override and friends on our posts
+MOD_SUPPORT = 1  # replies asking the mods for help, and mod commands
+OTHER = 2  # thanks, username mentions, private messages and everything else
+CLASS_NAMES = {COMMAND: "command", MOD_SUPPORT: "mod_support", OTHER: "other"}
+
+# An item moves up one class for every this many seconds it has been waiting,
+# so a steady stream of claims can't hold back everything else forever
+PROMOTE_AFTER = 2 * 60
+# How many of the latest items per class the latency statistics are based on
+LATENCY_WINDOW = 200
+
+Item = TypeVar("Item")
+
+
+def effective_class(
+    priority_class: int, waiting: float, promote_after: float = PROMOTE_AFTER
+) -> int:
+    """Return the class of an item after promoting it for the time it has been waiting."""
+    return max(priority_class - int(max(waiting, 0) // promote_after), COMMAND)
+
+
+def prioritize(
+    items: List[Item],
+    classify: Callable[[Item], int],
+    lane: Callable[[Item], str],
+    waiting: Callable[[Item], float],
+    promote_after: float = PROMOTE_AFTER,
+) -> List[Item]:
+    """Order the items (oldest first) by priority, without reordering any lane.
+
+    Within a lane, an item can't be handled before the ones that came in
+    earlier, so an item gets at least the priority of the most urgent item
+    after it in its lane. A "thanks" before a "done" on the same post goes
+    with the "done", instead of the "done" waiting for the "thanks". Items of
+    the same priority stay oldest first.
+    """
+    urgency: Dict[int, int] = {}
+    most_urgent_after: Dict[str, int] = {}
+    for position in range(len(items) - 1, -1, -1):
+        item = items[position]
+        own = effective_class(classify(item), waiting(item), promote_after)
+        key = lane(item)
+        urgency[position] = min(own, most_urgent_after.get(key, own))
+        most_urgent_after[key] = urgency[position]
+    order = sorted(range(len(items)), key=lambda position: urgency[position])
+    return [items[position] for position in order]
+
+
+class InboxLatency(object):
+    """How long the inbox items of every priority class waited until they were handled."""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        """Create the statistics without any samples."""
+        self.samples: Dict[int, Deque[float]] = {
+            priority_class: deque(maxlen=window) for priority_class in CLASS_NAMES
+        }
+        self._lock = threading.Lock()
+
+    def add(self, priority_class: int, seconds: float) -> None:
+        """Record how long an item of the given class waited."""
+        with self._lock:
+            self.samples[priority_class].append(seconds)
+
+    def report(self) -> Dict[str, float]:
+        """Return the median and 95th percentile latency per class, for logging and tracing."""
+        report: Dict[str, float] = {}
+        with self._lock:
+            for priority_class, samples in self.samples.items():
+                if not samples:
+                    continue
+                ordered = sorted(samples)
+                name = CLASS_NAMES[priority_class]
+                report[f"{name}_p50"] = ordered[len(ordered) // 2]
+                report[f"{name}_p95"] = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+        return report
@@ -0,0 +1,115 @@
+import json
+import os
+import time
+from typing import Any, Callable, Iterator, List, Optional
+
+from tor.helpers.files import atomic_write
+
+# The most items Reddit returns per listing page
+INBOX_PAGE_SIZE = 100
+# How many inbox items are handled per loop at most, so a backlog in the inbox
+# doesn't hold up the scan for new posts
+MAX_INBOX_ITEMS = 200
+
+
+class InboxCheckpoint(object):
+    """The newest inbox item that we are done with, kept on disk.
+
+    Reddit only lists the inbox newest first. Starting from this item, the
+    items after it can be requested page by page (with the `before` cursor of
+    the listing), so the inbox is worked through oldest first without
+    downloading all of it beforehand.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """Create the checkpoint, loading it from the given file if it exists."""
+        self.path = path
+        self.fullname: Optional[str] = None
+        self.created_utc = 0.0
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                data = json.load(checkpoint_file)
+            self.fullname = data["fullname"]
+            self.created_utc = data["created_utc"]
+
+    def advance(self, fullname: str, created_utc: float) -> None:
+        """Move the checkpoint to the given item and write it down."""
+        self.fullname = fullname
+        self.created_utc = created_utc
+        self.save()
+
+    def reset(self) -> None:
+        """Forget the checkpoint, e.g. when Reddit doesn't list its item anymore."""
+        self.fullname = None
+        self.created_utc = 0.0
+        self.save()
+
+    def save(self) -> None:
+        """Write the checkpoint to its file."""
+        if not self.path:
+            return
+        atomic_write(
+            self.path, json.dumps({"fullname": self.fullname, "created_utc": self.created_utc})
+        )
+
+
+class InboxStream(object):
+    """The inbox items after the checkpoint, oldest first, as the pages come in.
+
+    `fetch_page(before)` returns the page of items right after the item with
+    the fullname `before` (or the first page without it), newest first like
+    Reddit lists them. At most `max_items` items are handed out per loop.
+    `on_page_end` is called after the last item of every page was handed out,
+    before the next page is requested; that's where a consumer that handles
+    the items in the background can wait for them and move the checkpoint.
+
+    After going through the stream, `page_backlog` is the amount of items left
+    for later on the page we stopped at, and `oldest_pending` the creation time
+    of the oldest one of them (if any). The pages after it aren't fetched, so
+    this is a lower bound of what is waiting in the inbox, not its depth.
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[Optional[str]], List[Any]],
+        checkpoint: InboxCheckpoint,
+        max_items: int = MAX_INBOX_ITEMS,
+        on_page_end: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Create the stream; nothing is fetched until it's iterated over."""
+        self.fetch_page = fetch_page
+        self.on_page_end = on_page_end
+        self.checkpoint = checkpoint
+        self.max_items = max_items
+        self.handed_out = 0
+        self.pages = 0
+        self.page_backlog = 0
+        self.oldest_pending: Optional[float] = None
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            page = self.fetch_page(self.checkpoint.fullname)
+            self.pages += 1
+            if not page:
+                return
+            # Reddit lists the newest items first
+            oldest_first = list(reversed(page))
+            for position, item in enumerate(oldest_first):
+                if self.handed_out >= self.max_items:
+                    self.page_backlog = len(oldest_first) - position
+                    self.oldest_pending = item.created_utc
+                    return
+                self.handed_out += 1
+                yield item
+            if self.on_page_end is not None:
+                self.on_page_end()
+            if self.checkpoint.fullname != oldest_first[-1].fullname:
+                # The consumer didn't move the checkpoint along; don't fetch the same page again
+                return
+
+    def oldest_pending_age(self, now: Optional[float] = None) -> float:
+        """Return how long the oldest item that is left for later has been waiting."""
+        if self.oldest_pending is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return max(now - self.oldest_pending, 0.0)
@@ -0,0 +1,202 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from tor.helpers.post_summary import PostSummary
+
+log = logging.getLogger(__name__)
+
+# How many posts of one subreddit are put into the queue per window at most
+INTAKE_QUOTA = 10
+INTAKE_WINDOW = 15 * 60
+# How many posts are kept for later when their subreddit used up its quota
+MAX_BACKLOG = 500
+# How many minutes of waiting a post gains per tenfold of upvotes
+UPVOTE_WEIGHT = 10.0
+
+# How many unclaimed posts we'd like to have in the queue of r/TranscribersOfReddit
+TARGET_BACKLOG = 100
+# How many new posts are let in per scan at least and at most
+MIN_ADMIT = 1
+MAX_ADMIT = 30
+# How strongly the intake follows the distance to the target backlog
+GAIN = 0.5
+# How often the backlog of the queue is looked at, in seconds
+SAMPLE_INTERVAL = 5 * 60
+
+
+def intake_priority(post: PostSummary, now: float) -> float:
+    """Return how urgently a post should go into the queue; higher goes first.
+
+    Posts that have been waiting longer go first, so every partner sees its
+    posts show up in a predictable time. Upvotes give a post a head start: a
+    post with a thousand upvotes counts as half an hour older than one with none.
+    """
+    waiting = max(now - post.created_utc, 0) / 60
+    return waiting + UPVOTE_WEIGHT * math.log10(1 + max(post.ups, 0))
+
+
+class IntakeScheduler(object):
+    """Share the intake of new posts fairly between the partner subreddits.
+
+    Without a limit, one partner that floods (a big subreddit on a busy day)
+    uses up our write budget and pushes the posts of small partners back. Here
+    every subreddit may put `quota` posts into the queue per `window` seconds.
+    Within that quota the most urgent posts go first (see `intake_priority`),
+    and the rest are carried over to later scans in a backlog.
+
+    The backlog is bounded: when it is full, the least urgent posts are dropped.
+    """
+
+    def __init__(
+        self,
+        quota: int = INTAKE_QUOTA,
+        window: float = INTAKE_WINDOW,
+        max_backlog: int = MAX_BACKLOG,
+    ) -> None:
+        """Create a scheduler with an empty backlog."""
+        self.quota = quota
+        self.window = window
+        self.max_backlog = max_backlog
+        self.backlog: Dict[str, PostSummary] = {}
+        self.dropped = 0
+        # How many more posts may be let in during the current scan; None is unlimited
+        self.cycle_room: Optional[int] = None
+        # When the posts that were let in during the current window were let in, per subreddit
+        self._admitted: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.backlog)
+
+    def _used(self, subreddit: str, now: float) -> int:
+        admitted = self._admitted.get(subreddit)
+        if admitted is None:
+            return 0
+        while admitted and admitted[0] <= now - self.window:
+            admitted.popleft()
+        if not admitted:
+            del self._admitted[subreddit]
+            return 0
+        return len(admitted)
+
+    def start_cycle(self, limit: Optional[int]) -> None:
+        """Start a new scan in which at most `limit` posts are let in, over all subreddits."""
+        with self._lock:
+            self.cycle_room = limit
+
+    def defer(self, posts: List[PostSummary]) -> None:
+        """Add posts to the backlog, for the next scan to let in like the carried over ones."""
+        with self._lock:
+            for post in posts:
+                self.backlog.setdefault(post.name, post)
+
+    def schedule(self, posts: List[PostSummary], now: Optional[float] = None) -> List[PostSummary]:
+        """Add new posts to the backlog and return the ones to put into the queue now.
+
+        The returned posts are ordered by priority, most urgent first. Call this
+        with an empty list to only let in the carried over posts whose
+        subreddit has room again.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for post in posts:
+                self.backlog.setdefault(post.name, post)
+
+            ranked = sorted(
+                self.backlog.values(), key=lambda post: intake_priority(post, now), reverse=True
+            )
+            admitted: List[PostSummary] = []
+            room: Dict[str, int] = {}
+            for post in ranked:
+                if self.cycle_room is not None and self.cycle_room <= 0:
+                    break
+                sub = post.subreddit.lower()
+                if sub not in room:
+                    room[sub] = self.quota - self._used(sub, now)
+                if room[sub] > 0:
+                    room[sub] -= 1
+                    admitted.append(post)
+                    self._admitted.setdefault(sub, deque()).append(now)
+                    del self.backlog[post.name]
+                    if self.cycle_room is not None:
+                        self.cycle_room -= 1
+
+            overflow = len(self.backlog) - self.max_backlog
+            if overflow > 0:
+                # The ranking is still in order, so the least urgent ones are at the end
+                leftovers = [post for post in ranked if post.name in self.backlog]
+                for post in leftovers[-overflow:]:
+                    del self.backlog[post.name]
+                self.dropped += overflow
+                log.warning(f"Intake backlog is full, dropped {overflow} posts")
+        return admitted
+
+    def report(self) -> Dict[str, object]:
+        """Return the state of the backlog, for logging and tracing."""
+        with self._lock:
+            waiting: Dict[str, int] = {}
+            for post in self.backlog.values():
+                waiting[post.subreddit] = waiting.get(post.subreddit, 0) + 1
+            busiest: List[Tuple[str, int]] = sorted(
+                waiting.items(), key=lambda item: item[1], reverse=True
+            )[:5]
+            return {"backlog": len(self.backlog), "dropped": self.dropped, "busiest": busiest}
+
+
+class IntakeController(object):
+    """Let in as many new posts as the queue of r/TranscribersOfReddit can use.
+
+    With 20 unclaimed posts in the queue the volunteers run out of work, with
+    2,000 they can't find anything in it and we waste our write budget on posts
+    nobody will get to. Every `interval` seconds the controller gets the current
+    backlog of unclaimed posts and moves the amount of posts let in per scan
+    towards what keeps the backlog at `target`.
+
+    The step is relative: a backlog at twice the target halves the intake (with
+    the default gain of 0.5, at four times the target), so the controller reacts
+    the same way to a backlog of 200 as to one of 2,000 and never overshoots wildly.
+    """
+
+    def __init__(
+        self,
+        target: int = TARGET_BACKLOG,
+        min_limit: int = MIN_ADMIT,
+        max_limit: int = MAX_ADMIT,
+        gain: float = GAIN,
+        interval: float = SAMPLE_INTERVAL,
+    ) -> None:
+        """Create a controller that starts halfway between the minimum and maximum intake."""
+        self.target = target
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.gain = gain
+        self.interval = interval
+        self.limit = (min_limit + max_limit) / 2
+        self.backlog: Optional[int] = None
+        self.sampled_at: Optional[float] = None
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """Check whether it is time to look at the backlog of the queue again."""
+        now = time.time() if now is None else now
+        return self.sampled_at is None or now >= self.sampled_at + self.interval
+
+    def update(self, backlog: int, now: Optional[float] = None) -> int:
+        """Adjust the intake to the current backlog of the queue and return the new limit."""
+        self.sampled_at = time.time() if now is None else now
+        self.backlog = backlog
+        factor = (self.target / max(backlog, 1)) ** self.gain
+        self.limit = min(max(self.limit * factor, self.min_limit), self.max_limit)
+        return self.admit
+
+    @property
+    def admit(self) -> int:
+        """Return how many new posts may be let in per scan."""
+        return round(self.limit)
+
+    def report(self) -> Dict[str, Optional[float]]:
+        """Return the decision of the controller, for logging and tracing."""
+        return {"backlog": self.backlog, "target": self.target, "admit": self.admit}
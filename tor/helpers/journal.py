@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from tor.helpers.files import atomic_write
+
+log = logging.getLogger(__name__)
+
+# The side effects of handling an inbox item, in the order they happen
+HANDLED = "handled"  # the Blossom calls are made; the result is the reply and the flair
+REPLY = "reply"  # the reply is sent
+FLAIR = "flair"  # the flair of the post is set
+DONE = "done"  # everything is done, only marking it as read is left
+# Written when an item is marked as read and doesn't have to be remembered anymore
+_FORGET = "forget"
+
+# Compact the journal once it has this many records that are no longer needed
+COMPACT_AFTER = 1000
+# Items that were never marked as read are forgotten after a week
+MAX_AGE = 7 * 24 * 60 * 60
+
+
+class InboxJournal(object):
+    """An append-only record of the inbox items we handled and what we did for them.
+
+    If the bot dies between handling an item and marking it as read, it finds
+    the item again after the restart. Without the journal, a claim or done
+    would then be sent to Blossom again and the volunteer would get a second
+    reply. With it, every side effect is written down the moment it happened,
+    so a replay skips whatever was done already.
+
+    Every record is a line of JSON appended to the file, so a crash can at most
+    lose the record that was being written. Once items are marked as read they
+    are forgotten, and from time to time the file is rewritten with only the
+    items that are still needed, in a background thread.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        compact_after: int = COMPACT_AFTER,
+        max_age: float = MAX_AGE,
+    ) -> None:
+        """Create the journal, replaying the records in the given file if it exists."""
+        self.path = path
+        self.compact_after = compact_after
+        self.max_age = max_age
+        # The steps that are done per item, with their results
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # When we first wrote something down about every item
+        self.started: Dict[str, float] = {}
+        self.compaction: Optional[threading.Thread] = None
+        self._obsolete = 0
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __contains__(self, fullname: object) -> bool:
+        return fullname in self.entries
+
+    def steps(self, fullname: str) -> Dict[str, Any]:
+        """Return the steps that are done for the given item, with their results."""
+        with self._lock:
+            return dict(self.entries.get(fullname, {}))
+
+    def record(
+        self, fullname: str, step: str, result: Any = True, now: Optional[float] = None
+    ) -> None:
+        """Write down that a step is done for the given item."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._apply({"item": fullname, "step": step, "result": result, "at": now})
+            self._append({"item": fullname, "step": step, "result": result, "at": now})
+
+    def forget(self, fullnames: Iterable[str]) -> None:
+        """Forget the given items, after they were marked as read."""
+        with self._lock:
+            for fullname in fullnames:
+                if fullname in self.entries:
+                    record = {"item": fullname, "step": _FORGET}
+                    self._apply(record)
+                    self._append(record)
+            if self._obsolete >= self.compact_after and self.compaction is None:
+                self.compaction = threading.Thread(
+                    target=self.compact, name="inbox-journal-compaction", daemon=True
+                )
+                self.compaction.start()
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        fullname = record["item"]
+        if record["step"] == _FORGET:
+            self._obsolete += len(self.entries.pop(fullname, {})) + 1
+            self.started.pop(fullname, None)
+            return
+        self.entries.setdefault(fullname, {})[record["step"]] = record["result"]
+        self.started.setdefault(fullname, record["at"])
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a") as journal_file:
+            journal_file.write(json.dumps(record) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def load(self) -> None:
+        """Replay the records in the file."""
+        if not self.path:
+            return
+        with open(self.path) as journal_file, self._lock:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last record of a crash might be cut off
+                    log.warning(f"Skipping a broken record in the inbox journal: {line!r}")
+                    continue
+                self._apply(record)
+
+    def compact(self, now: Optional[float] = None) -> None:
+        """Rewrite the file with only the items that are still needed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for fullname, started in list(self.started.items()):
+                if started <= now - self.max_age:
+                    self._apply({"item": fullname, "step": _FORGET})
+            if self.path:
+                records = [
+                    {"item": fullname, "step": step, "result": result, "at": self.started[fullname]}
+                    for fullname, steps in self.entries.items()
+                    for step, result in steps.items()
+                ]
+                atomic_write(self.path, "".join(json.dumps(record) + "\n" for record in records))
+            self._obsolete = 0
+            self.compaction = None
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+import requests
+
+log = logging.getLogger(__name__)
+
+TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
+OAUTH_URL = "https://oauth.reddit.com"
+# Mint a new token this long before the current one expires, so that it never
+# runs out in the middle of a scan
+REFRESH_MARGIN = 5 * 60
+# Reddit throttles or turns away the default User-Agent of requests, so the
+# token is minted in the name of the bot
+USER_AGENT = "0.1.0.ToR.Client.OAuth (contact u/itsthejoker)"
+
+
+class TokenError(Exception):
+    """Reddit did not give us an access token."""
+
+
+class AppOnlyToken(object):
+    """An application-only OAuth token for reading public listings.
+
+    Anonymous requests to www.reddit.com are throttled hard, while requests to
+    oauth.reddit.com with a bearer token get the much higher rate limit of
+    authenticated clients. The token is minted with the client credentials of
+    the bot's Reddit app (no user involved), shared by all scanner workers and
+    replaced shortly before it expires.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        token_url: str = TOKEN_URL,
+        api_url: str = OAUTH_URL,
+        refresh_margin: float = REFRESH_MARGIN,
+        user_agent: str = USER_AGENT,
+    ) -> None:
+        """Prepare the token; it is only minted on first use."""
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.api_url = api_url
+        self.refresh_margin = refresh_margin
+        self.user_agent = user_agent
+        self.access_token: Optional[str] = None
+        self.expires_at = 0.0
+        self.minted = 0
+        self._lock = threading.Lock()
+
+    def authorization(
+        self, session: Optional[requests.Session] = None, now: Optional[float] = None
+    ) -> str:
+        """Return the value of the Authorization header, minting a new token if needed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.access_token is None or now >= self.expires_at - self.refresh_margin:
+                self._mint(session or requests.Session(), now)
+            return f"bearer {self.access_token}"
+
+    def invalidate(self) -> None:
+        """Forget the current token, after Reddit refused it."""
+        with self._lock:
+            self.access_token = None
+
+    def _mint(self, session: requests.Session, now: float) -> None:
+        response = session.post(
+            self.token_url,
+            auth=(self.client_id, self.client_secret),
+            data={"grant_type": "client_credentials"},
+            headers={"User-Agent": self.user_agent},
+            timeout=10,
+        )
+        try:
+            result = response.json()
+        except ValueError:
+            raise TokenError(f"{response.status_code} invalid JSON")
+        if response.status_code >= 400 or "access_token" not in result:
+            raise TokenError(f"{response.status_code} {result.get('error', '')}".strip())
+
+        self.access_token = result["access_token"]
+        self.expires_at = now + float(result.get("expires_in", 3600))
+        self.minted += 1
+        log.info(f"Minted a new app-only token, valid for {result.get('expires_in')}s")
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Type
+
+from tor.helpers.files import atomic_write, file_lock
+from tor.helpers.post_summary import PostSummary
+
+log = logging.getLogger(__name__)
+
+# The steps of putting a post into the queue, in order
+SUBMIT = "submit"  # the post on r/TranscribersOfReddit
+REPLY = "reply"  # the rules comment on that post
+BLOSSOM = "blossom"  # the submission in Blossom
+STEPS = (SUBMIT, REPLY, BLOSSOM)
+
+MAX_ATTEMPTS = 8
+BASE_BACKOFF = 60
+MAX_BACKOFF = 60 * 60
+
+
+class PostingJob(object):
+    """A partner post on its way into the queue, with the steps that are done already."""
+
+    def __init__(
+        self,
+        post: PostSummary,
+        content_type: str,
+        completed: Optional[Dict[str, Any]] = None,
+        attempts: int = 0,
+        next_attempt: float = 0.0,
+        last_error: str = "",
+        owner: Optional[int] = None,
+    ) -> None:
+        """Create a job for the given post."""
+        self.post = post
+        self.content_type = content_type
+        # The result of every step that is done, e.g. the fullname of our post for SUBMIT
+        self.completed: Dict[str, Any] = completed or {}
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+        self.last_error = last_error
+        # The process that is putting the post into the queue right now, if any
+        self.owner = owner
+
+    @property
+    def name(self) -> str:
+        """Return the fullname of the partner post."""
+        return self.post.name
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the job as something that can be written to JSON."""
+        return {
+            "post": self.post.to_dict(),
+            "content_type": self.content_type,
+            "completed": self.completed,
+            "attempts": self.attempts,
+            "next_attempt": self.next_attempt,
+            "last_error": self.last_error,
+            "owner": self.owner,
+        }
+
+    @classmethod
+    def from_dict(cls: Type["PostingJob"], data: Dict[str, Any]) -> "PostingJob":
+        """Create the job from what `to_dict` returned."""
+        return cls(
+            PostSummary(**data["post"]),
+            data["content_type"],
+            completed=data["completed"],
+            attempts=data["attempts"],
+            next_attempt=data["next_attempt"],
+            last_error=data["last_error"],
+            owner=data.get("owner"),
+        )
+
+
+class Outbox(object):
+    """The posts that we still have to put into the queue, kept on disk.
+
+    Putting a post into the queue takes three steps (see STEPS), each of which
+    can fail when Reddit or Blossom have a bad moment. Every post gets a job in
+    the outbox before the first step, and every completed step is written down
+    right away. A job that fails is retried later from where it stopped, with an
+    exponential backoff, so a failure neither loses the post nor leaves a post
+    on r/TranscribersOfReddit without its rules comment or Blossom submission.
+
+    Jobs that keep failing end up in the dead letters, for the mods to look at.
+
+    The bot and `tor backfill` run as separate processes that share the outbox
+    file, and `tor outbox --requeue` changes it while the bot is running. So
+    every change happens under a lock on the file and starts from what is in
+    it, instead of overwriting it with what one process has in memory. A job
+    that another live process is working on is never due here.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        base_backoff: float = BASE_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+    ) -> None:
+        """Create the outbox, loading it from the given file if it exists."""
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jobs: Dict[str, PostingJob] = {}
+        self.dead_letters: List[PostingJob] = []
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            with file_lock(path):
+                self.load()
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.jobs
+
+    @contextmanager
+    def _shared(self, save: bool = True) -> Iterator[None]:
+        # Other processes may have changed the file since we last looked at it
+        with self._lock:
+            if not self.path:
+                yield
+                return
+            with file_lock(self.path):
+                if os.path.exists(self.path):
+                    self.load()
+                yield
+                if save:
+                    self.save()
+
+    def add(self, post: PostSummary, content_type: str) -> PostingJob:
+        """Create the job for the given post, or return the one it already has.
+
+        The job belongs to this process until it's finished or failed.
+        """
+        with self._shared():
+            if (job := self.jobs.get(post.name)) is None:
+                job = self.jobs[post.name] = PostingJob(post, content_type)
+            job.owner = os.getpid()
+            return job
+
+    def due(self, now: Optional[float] = None) -> List[PostingJob]:
+        """Return the jobs that should be retried now, oldest post first."""
+        now = time.time() if now is None else now
+        with self._shared(save=False):
+            jobs = [
+                job
+                for job in self.jobs.values()
+                if job.next_attempt <= now and not _owned_elsewhere(job)
+            ]
+        return sorted(jobs, key=lambda job: job.post.created_utc)
+
+    def complete(self, job: PostingJob, step: str, result: Any = True) -> None:
+        """Write down that a step of the job is done."""
+        with self._shared():
+            job.completed[step] = result
+            self._keep(job)
+
+    def finish(self, job: PostingJob) -> None:
+        """Remove a job of which all steps are done."""
+        with self._shared():
+            self.jobs.pop(job.name, None)
+
+    def fail(self, job: PostingJob, error: Exception, now: Optional[float] = None) -> bool:
+        """Schedule the retry of a failed job.
+
+        Returns True if the job has failed too often and was moved to the dead letters.
+        """
+        now = time.time() if now is None else now
+        with self._shared():
+            self._keep(job)
+            job.attempts += 1
+            job.last_error = f"{type(error).__name__}: {error}"
+            job.owner = None
+            dead = job.attempts >= self.max_attempts
+            if dead:
+                self.jobs.pop(job.name, None)
+                self.dead_letters.append(job)
+                log.error(f"Giving up on {job.name} after {job.attempts} attempts")
+            else:
+                backoff = min(self.base_backoff * 2 ** (job.attempts - 1), self.max_backoff)
+                job.next_attempt = now + backoff
+        return dead
+
+    def _keep(self, job: PostingJob) -> None:
+        # The process working on a job has the latest state of it
+        if job.name in self.jobs:
+            self.jobs[job.name] = job
+
+    def requeue_dead_letters(self) -> None:
+        """Give all dead letters a fresh set of attempts, e.g. after a mod fixed the cause."""
+        with self._shared():
+            for job in self.dead_letters:
+                job.attempts = 0
+                job.next_attempt = 0.0
+                self.jobs[job.name] = job
+            self.dead_letters = []
+
+    def load(self) -> None:
+        """Load the outbox from its file."""
+        if not self.path:
+            return
+        with open(self.path) as outbox_file:
+            data = json.load(outbox_file)
+        with self._lock:
+            self.jobs = {
+                job.name: job for job in (PostingJob.from_dict(item) for item in data["jobs"])
+            }
+            self.dead_letters = [PostingJob.from_dict(item) for item in data["dead_letters"]]
+
+    def save(self) -> None:
+        """Write the outbox to its file."""
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(
+                {
+                    "jobs": [job.to_dict() for job in self.jobs.values()],
+                    "dead_letters": [job.to_dict() for job in self.dead_letters],
+                },
+                indent=2,
+            )
+            atomic_write(self.path, data)
+
+
+def _owned_elsewhere(job: PostingJob) -> bool:
+    # Jobs of processes that are gone (e.g. after a crash) are up for grabs again
+    if job.owner is None or job.owner == os.getpid():
+        return False
+    try:
+        os.kill(job.owner, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,214 @@
+import itertools
+import logging
+import math
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from tor.helpers.post_summary import PostSummary
+
+log = logging.getLogger(__name__)
+
+# Send the posts to Blossom's bulkcheck in batches of this size...
+BULKCHECK_BATCH_SIZE = 25
+# ... or after waiting this long for a batch to fill up, whichever comes first
+BULKCHECK_MAX_WAIT = 1.0
+# How many items can wait between two stages before the earlier stage has to wait
+QUEUE_SIZE = 50
+# How many posts are put into the queue at the same time
+PUBLISH_WORKERS = 1
+
+# Marks the end of the scan in the queues between the stages
+_DONE = object()
+
+
+class ScanPipeline(object):
+    """Move the posts of a scan through its stages while the rest is still loading.
+
+    Every stage runs in its own thread, connected to the next one by a bounded
+    queue:
+
+    1. `select` gets the posts of every listing as soon as it is fetched and
+       returns the ones that are worth a look (domain filter, deduplication).
+    2. The selected posts are collected into small batches for `check`, which
+       returns the posts that Blossom doesn't know about yet.
+    3. If there is a `schedule` stage, it gets the posts that passed the check
+       and returns the ones that may go into the queue now (see `IntakeScheduler`).
+    4. `publish` puts every one of those into the queue, with up to
+       `publish_workers` posts at the same time. The posts with the lowest
+       `priority` go first; by default, that's the oldest post.
+
+    That way the posts of quick subreddits are in the queue while slow ones are
+    still loading, instead of everything waiting for the slowest listing. If a
+    stage falls behind, the bounded queues make the stages before it wait.
+    """
+
+    def __init__(
+        self,
+        select: Callable[[List[PostSummary]], List[PostSummary]],
+        check: Callable[[List[PostSummary]], List[PostSummary]],
+        publish: Callable[[PostSummary], bool],
+        batch_size: int = BULKCHECK_BATCH_SIZE,
+        max_wait: float = BULKCHECK_MAX_WAIT,
+        queue_size: int = QUEUE_SIZE,
+        publish_workers: int = PUBLISH_WORKERS,
+        schedule: Optional[Callable[[List[PostSummary]], List[PostSummary]]] = None,
+        priority: Callable[[PostSummary], float] = lambda post: post.created_utc,
+    ) -> None:
+        """Create the pipeline; the stages are started with `start`."""
+        self.select = select
+        self.check = check
+        self.publish = publish
+        self.schedule = schedule
+        self.priority = priority
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.fetched: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.selected: queue.Queue = queue.Queue(maxsize=queue_size)
+        # Ordered by the priority of the posts
+        self.checked: queue.PriorityQueue = queue.PriorityQueue(maxsize=queue_size)
+        self.publish_workers = publish_workers
+        self.stats: Dict[str, float] = {
+            "fetched": 0,
+            "selected": 0,
+            "bulkchecks": 0,
+            "unseen": 0,
+            "scheduled": 0,
+            "published": 0,
+            "errors": 0,
+            # How long every stage was busy, in seconds
+            "select_time": 0,
+            "check_time": 0,
+            "publish_time": 0,
+        }
+        self._started = time.monotonic()
+        self._first_published: Optional[float] = None
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._select_stage, name="pipeline-select", daemon=True),
+            threading.Thread(target=self._check_stage, name="pipeline-check", daemon=True),
+        ] + [
+            threading.Thread(
+                target=self._publish_stage, name=f"pipeline-publish-{number}", daemon=True
+            )
+            for number in range(publish_workers)
+        ]
+
+    def start(self) -> "ScanPipeline":
+        """Start the threads of all stages."""
+        self._started = time.monotonic()
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def put(self, posts: List[PostSummary]) -> None:
+        """Feed the posts of a fetched listing into the pipeline.
+
+        This blocks while the pipeline is full.
+        """
+        self.fetched.put(posts)
+
+    def close(self) -> Dict[str, float]:
+        """Wait until all posts fed so far went through every stage and return the stats."""
+        self.fetched.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        stats = dict(self.stats)
+        stats["duration"] = time.monotonic() - self._started
+        if self._first_published is not None:
+            stats["first_published_after"] = self._first_published - self._started
+        return stats
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    def _select_stage(self) -> None:
+        batch: List[PostSummary] = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                posts = self.fetched.get(timeout=timeout)
+            except queue.Empty:
+                # Nothing new came in for a while; don't keep the batch waiting
+                self.selected.put(batch)
+                batch, deadline = [], None
+                continue
+            if posts is _DONE:
+                break
+
+            self._count("fetched", len(posts))
+            started = time.monotonic()
+            try:
+                selection = self.select(posts)
+            except Exception as e:
+                self._count("errors")
+                log.warning(f"Could not select from {len(posts)} posts: {e}")
+                continue
+            finally:
+                self._count("select_time", time.monotonic() - started)
+            self._count("selected", len(selection))
+            if selection and not batch:
+                deadline = time.monotonic() + self.max_wait
+            batch += selection
+            while len(batch) >= self.batch_size:
+                self.selected.put(batch[: self.batch_size])
+                batch = batch[self.batch_size :]
+            if not batch:
+                deadline = None
+
+        if batch:
+            self.selected.put(batch)
+        self.selected.put(_DONE)
+
+    def _check_stage(self) -> None:
+        while (batch := self.selected.get()) is not _DONE:
+            self._count("bulkchecks")
+            started = time.monotonic()
+            try:
+                unseen = self.check(batch)
+            except Exception as e:
+                self._count("errors")
+                log.warning(f"Could not check a batch of {len(batch)} posts: {e}")
+                continue
+            finally:
+                self._count("check_time", time.monotonic() - started)
+            self._count("unseen", len(unseen))
+            self._enqueue(unseen)
+        if self.schedule is not None:
+            # Let in the posts of earlier scans that are allowed to go now
+            self._enqueue([])
+        for _ in range(self.publish_workers):
+            self.checked.put((math.inf, next(self._order), _DONE))
+
+    def _enqueue(self, posts: List[PostSummary]) -> None:
+        if self.schedule is not None:
+            try:
+                posts = self.schedule(posts)
+            except Exception as e:
+                self._count("errors")
+                log.warning(f"Could not schedule {len(posts)} posts: {e}")
+                return
+            self._count("scheduled", len(posts))
+        for post in posts:
+            self.checked.put((self.priority(post), next(self._order), post))
+
+    def _publish_stage(self) -> None:
+        while (post := self.checked.get()[2]) is not _DONE:
+            started = time.monotonic()
+            try:
+                published = self.publish(post)
+            except Exception as e:
+                self._count("errors")
+                log.warning(f"Could not publish {post.name}: {e}")
+                continue
+            finally:
+                self._count("publish_time", time.monotonic() - started)
+            if published:
+                with self._lock:
+                    self.stats["published"] += 1
+                    if self._first_published is None:
+                        self._first_published = time.monotonic()
@@ -0,0 +1,61 @@
+import random
+import time
+from typing import Dict, List, Optional
+
+from tor.helpers.batching import ListingPlanner
+
+# Never poll a subreddit more often than the scan cycle itself...
+MIN_POLL_INTERVAL = 45
+# ... and never let a subreddit go unchecked for longer than this
+MAX_POLL_INTERVAL = 15 * 60
+# How many new posts we'd like to find in a subreddit on every poll
+TARGET_POSTS_PER_POLL = 1
+# Spread the polls of subreddits with the same rate out a bit
+JITTER = 0.1
+
+
+class PollScheduler(object):
+    """Decide which partner subreddits are due to be polled.
+
+    Most partner subreddits only get a handful of posts per day, so polling all
+    of them on every scan wastes most of our request budget. Every subreddit
+    gets its own next due time instead, based on the post rate that the listing
+    planner has learned for it: the busier it is, the more often we look.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = MIN_POLL_INTERVAL,
+        max_interval: float = MAX_POLL_INTERVAL,
+        jitter: float = JITTER,
+    ) -> None:
+        """Create a scheduler where every subreddit is immediately due."""
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.next_due: Dict[str, float] = {}
+
+    def interval(self, rate: Optional[float]) -> float:
+        """Return how long to wait between two polls of a subreddit with the given rate."""
+        if not rate:
+            return self.max_interval
+        return min(max(TARGET_POSTS_PER_POLL / rate, self.min_interval), self.max_interval)
+
+    def due(self, subreddits: List[str], now: Optional[float] = None) -> List[str]:
+        """Return the subreddits that should be polled now."""
+        now = time.time() if now is None else now
+        return [sub for sub in subreddits if self.next_due.get(sub, 0) <= now]
+
+    def reschedule(self, subreddits: List[str], planner: ListingPlanner, since: float) -> None:
+        """Set the next due time of the subreddits that were polled successfully since `since`.
+
+        Subreddits that could not be fetched stay due, so they are retried on
+        the next scan.
+        """
+        for sub in subreddits:
+            fetched = planner.last_fetched.get(sub)
+            if fetched is None or fetched < since:
+                continue
+            spread = random.uniform(1 - self.jitter, 1 + self.jitter)
+            interval = self.interval(planner.rates.get(sub)) * spread
+            self.next_due[sub] = fetched + min(max(interval, self.min_interval), self.max_interval)
@@ -0,0 +1,104 @@
+from typing import Any, Dict, Optional, Type
+
+
+class PostSummary(object):
+    """The parts of a partner post that we need to decide whether to put it into the queue.
+
+    A listing page holds around a hundred fields per post, of which we need
+    about a dozen. Decoding every post straight into this compact record right
+    after parsing the listing keeps the scanner from holding on to (and copying
+    around) the rest.
+    """
+
+    __slots__ = (
+        "subreddit",
+        "name",
+        "title",
+        "permalink",
+        "is_nsfw",
+        "is_gallery",
+        "is_self",
+        "domain",
+        "ups",
+        "locked",
+        "archived",
+        "author",
+        "url",
+        "created_utc",
+        "crosspost_parent",
+        "content_type",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        subreddit: str = "",
+        title: str = "",
+        permalink: str = "",
+        is_nsfw: bool = False,
+        is_gallery: bool = False,
+        is_self: bool = False,
+        domain: str = "",
+        ups: int = 0,
+        locked: bool = False,
+        archived: bool = False,
+        author: Optional[str] = None,
+        url: str = "",
+        created_utc: float = 0.0,
+        crosspost_parent: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> None:
+        """Create the summary of a post."""
+        self.name = name  # remember, this is the ID: t3_8swl2n
+        self.subreddit = subreddit
+        self.title = title
+        self.permalink = permalink
+        self.is_nsfw = is_nsfw
+        self.is_gallery = is_gallery
+        self.is_self = is_self
+        self.domain = domain
+        self.ups = ups
+        self.locked = locked
+        self.archived = archived
+        self.author = author
+        self.url = url
+        self.created_utc = created_utc
+        self.crosspost_parent = crosspost_parent  # the fullname of the original post
+        # Filled in by the domain filter, so we only have to classify the post once
+        self.content_type = content_type
+
+    @classmethod
+    def from_listing(cls: Type["PostSummary"], item: Dict[str, Any]) -> "PostSummary":
+        """Create the summary from the data of a post in a listing."""
+        return cls(
+            name=item["name"],
+            subreddit=item["subreddit"],
+            title=item["title"],
+            permalink=item["permalink"],
+            is_nsfw=item["over_18"],
+            is_gallery="is_gallery" in item,
+            is_self=item["is_self"],
+            domain=item["domain"],
+            ups=item["ups"],
+            locked=item["locked"],
+            archived=item["archived"],
+            author=item.get("author", None),
+            url=item["url"],
+            created_utc=float(item["created_utc"]),
+            crosspost_parent=item.get("crosspost_parent", None),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the summary as keyword arguments for creating it again."""
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PostSummary):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __hash__(self) -> int:
+        return hash(self.name)
+
+    def __repr__(self) -> str:
+        return f"<PostSummary {self.name} r/{self.subreddit}>"
@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Mapping, Optional
+
+log = logging.getLogger(__name__)
+
+# What we allow ourselves until Reddit tells us what our actual budget is
+DEFAULT_RATE = 1.0  # requests per second
+DEFAULT_BURST = 10
+# Keep a few requests of every rate limit window in reserve
+RESERVE = 5
+# What we allow ourselves for writes to Reddit (submissions and comments) through PRAW,
+# which shares the rate limit of the bot's account with everything else it does
+WRITE_RATE = 1.0  # requests per second
+WRITE_BURST = 4
+
+
+class RequestBudget(object):
+    """A token bucket shared by all scanner workers, fed by Reddit's rate limit headers.
+
+    Reddit tells us on every response how many requests we have left
+    (X-Ratelimit-Remaining) and in how many seconds that budget is reset
+    (X-Ratelimit-Reset). The remaining requests are spread evenly over the rest
+    of the window, so we slow down before running into a 429 instead of after.
+    """
+
+    def __init__(
+        self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST, reserve: int = RESERVE
+    ) -> None:
+        """Create a full bucket."""
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.tokens = float(burst)
+        self.remaining: Optional[float] = None
+        self.reset_at: Optional[float] = None
+        self.throttled = 0
+        self._default_rate = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if self.reset_at is not None and now >= self.reset_at:
+            # A new rate limit window has started
+            self.rate = self._default_rate
+            self.reset_at = None
+            self.remaining = None
+            self.tokens = max(self.tokens, float(self.burst))
+        self.tokens = min(self.tokens + (now - self._updated) * self.rate, float(self.burst))
+        self._updated = now
+
+    def reserve_request(self, now: Optional[float] = None) -> float:
+        """Take a token for a request and return how long to wait before sending it."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._refill(now)
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            self.throttled += 1
+            if self.rate > 0:
+                return -self.tokens / self.rate
+            # Nothing left in this window; wait for the reset
+            return max((self.reset_at or now) - now, 0.0)
+
+    def try_reserve(self, now: Optional[float] = None) -> bool:
+        """Take a token for an optional request, but only if that doesn't mean waiting."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._refill(now)
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def wait(self) -> None:
+        """Block until a request may be sent."""
+        delay = self.reserve_request()
+        if delay:
+            time.sleep(delay)
+
+    def update(self, headers: Mapping[str, str], now: Optional[float] = None) -> None:
+        """Adjust the budget to the rate limit headers of a response."""
+        now = time.monotonic() if now is None else now
+        try:
+            remaining = float(headers["x-ratelimit-remaining"])
+            reset = float(headers["x-ratelimit-reset"])
+        except (KeyError, ValueError):
+            return
+
+        with self._lock:
+            self._refill(now)
+            self.remaining = remaining
+            self.reset_at = now + reset
+            allowed = max(remaining - self.reserve, 0)
+            self.rate = allowed / max(reset, 1)
+            self.tokens = min(self.tokens, allowed)
+
+    def exhausted(self, retry_after: float = 60, now: Optional[float] = None) -> None:
+        """Stop sending requests for a while after Reddit answered with a 429."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._refill(now)
+            self.remaining = 0
+            self.reset_at = max(self.reset_at or now, now + retry_after)
+            self.rate = 0
+            self.tokens = min(self.tokens, 0)
+
+    def report(self) -> Dict[str, Optional[float]]:
+        """Return the current state of the budget, for logging and tracing."""
+        now = time.monotonic()
+        with self._lock:
+            self._refill(now)
+            return {
+                "remaining": self.remaining,
+                "reset_in": None if self.reset_at is None else self.reset_at - now,
+                "rate": self.rate,
+                "throttled": self.throttled,
+            }
+
+
+class CircuitBreaker(object):
+    """Stop polling subreddits that keep erroring for a while.
+
+    After `threshold` consecutive failures the circuit of a subreddit opens:
+    it won't be polled for `base_backoff` seconds, doubling with every further
+    failure up to `max_backoff`. One successful fetch closes it again.
+    """
+
+    def __init__(
+        self, threshold: int = 3, base_backoff: float = 60, max_backoff: float = 60 * 60
+    ) -> None:
+        """Create a breaker with all circuits closed."""
+        self.threshold = threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures: Dict[str, int] = {}
+        self.open_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        """Check whether the given subreddit may be polled."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self.open_until.get(key, 0) <= now
+
+    def success(self, keys: Iterable[str]) -> None:
+        """Close the circuits of the given subreddits."""
+        with self._lock:
+            for key in keys:
+                self.failures.pop(key, None)
+                self.open_until.pop(key, None)
+
+    def failure(self, key: str, now: Optional[float] = None) -> None:
+        """Record a failed fetch of the given subreddit."""
+        now = time.time() if now is None else now
+        with self._lock:
+            failures = self.failures.get(key, 0) + 1
+            self.failures[key] = failures
+            if failures >= self.threshold:
+                backoff = min(
+                    self.base_backoff * 2 ** (failures - self.threshold), self.max_backoff
+                )
+                self.open_until[key] = now + backoff
+                log.warning(f"r/{key} failed {failures} times in a row, pausing for {backoff}s")
@@ -0,0 +1,66 @@
+import json
+import os
+import threading
+from typing import Callable, List, Optional
+
+from tor.helpers.files import atomic_write
+
+# The most fullnames Reddit marks as read in a single request
+READ_BATCH_SIZE = 25
+
+
+class ReadMarker(object):
+    """The inbox items that we handled, but didn't mark as read on Reddit yet.
+
+    Marking every item as read on its own costs one request per item, which
+    adds up during a claim rush. Instead, the fullnames of the handled items are
+    collected and marked as read 25 at a time. The collected fullnames are kept
+    on disk until Reddit confirmed them, so after a crash they are still marked
+    as read, and not handled a second time in the meantime.
+    """
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = READ_BATCH_SIZE) -> None:
+        """Create the marker, loading the pending fullnames from the given file if it exists."""
+        self.path = path
+        self.batch_size = batch_size
+        self.pending: List[str] = []
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as pending_file:
+                self.pending = json.load(pending_file)
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def __contains__(self, fullname: object) -> bool:
+        return fullname in self.pending
+
+    def add(self, fullname: str) -> None:
+        """Remember that the given item has to be marked as read."""
+        with self._lock:
+            if fullname not in self.pending:
+                self.pending.append(fullname)
+                self.save()
+
+    def flush(self, mark_read: Callable[[List[str]], None]) -> int:
+        """Mark all pending items as read with `mark_read`, a batch at a time.
+
+        Every batch is only forgotten once `mark_read` returned, so if it
+        raises, the rest is kept for the next flush. Returns how many items were
+        marked as read.
+        """
+        marked = 0
+        with self._lock:
+            while self.pending:
+                batch = self.pending[: self.batch_size]
+                mark_read(batch)
+                self.pending = self.pending[len(batch) :]
+                self.save()
+                marked += len(batch)
+        return marked
+
+    def save(self) -> None:
+        """Write the pending fullnames to the file."""
+        if not self.path:
+            return
+        atomic_write(self.path, json.dumps(self.pending))
@@ -0,0 +1,412 @@
+import json
+import logging
+import os
+import random
+import string
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tor.helpers.batching import BATCH_LIMIT, ListingPlanner, demultiplex
+from tor.helpers.cursors import MAX_PAGES, ListingCursors
+from tor.helpers.deadlines import CONNECT_TIMEOUT, READ_TIMEOUT, LatencyTracker
+from tor.helpers.oauth import AppOnlyToken
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.rate_limit import CircuitBreaker, RequestBudget
+
+log = logging.getLogger(__name__)
+
+
+def generate_user_agent() -> str:
+    """Generate a new Reddit user agent.
+
+    Reddit routinely blocks / throttles common user agents. The easiest way
+    to deal with that is to (nicely) generate a partially unique user-agent
+    in an easy-to-follow pattern in case they decide that they do want to
+    block us for this.
+    :return: A complete user agent string.
+    """
+    return "0.1.0.ToR.Client.Thread.{}.ID.{} (contact u/itsthejoker)".format(
+        random.randrange(0, 30),
+        "".join([random.choice(string.ascii_lowercase) for _ in range(6)]),
+    )
+
+
+# The first time we look at a subreddit, only its newest posts are of interest
+NEWEST_POSTS = 10
+
+REDDIT_URL = "https://www.reddit.com"
+
+
+class ListingAccess(NamedTuple):
+    """Where the listings are fetched from, and how we identify ourselves there."""
+
+    base_url: str
+    headers: Dict[str, str]
+
+
+ANONYMOUS = ListingAccess(REDDIT_URL, {})
+
+
+def listing_access(
+    token: Optional[AppOnlyToken], session: Optional[requests.Session] = None
+) -> ListingAccess:
+    """Return how the listings of this scan should be fetched.
+
+    Without a token the anonymous JSON listings are used. With one, the listings
+    are fetched from the OAuth API, with a token that is valid for the whole scan.
+    """
+    if token is None:
+        return ANONYMOUS
+    return ListingAccess(token.api_url, {"Authorization": token.authorization(session)})
+
+
+def subreddit_listing_url(
+    subreddits: List[str],
+    before: Optional[str] = None,
+    base_url: str = REDDIT_URL,
+    after: Optional[str] = None,
+    full_page: bool = False,
+) -> str:
+    """Return the URL of the JSON listing of the newest posts of the subreddits.
+
+    Multiple subreddits are combined into a single listing (r/a+b+c). Combined
+    listings, listings of only the posts newer than the `before` cursor, pages
+    of the posts older than the `after` cursor and anything else we ask a
+    `full_page` for are requested with a full page of posts, everything else
+    only with as many posts as we are going to look at.
+    """
+    url = f"{base_url}/r/{'+'.join(subreddits)}/new/.json"
+    params: Dict[str, Any] = {"limit": NEWEST_POSTS}
+    if len(subreddits) > 1 or before or after or full_page:
+        params["limit"] = BATCH_LIMIT
+    if before:
+        params["before"] = before
+    if after:
+        params["after"] = after
+    return url + "?" + urlencode(params)
+
+
+class ListingError(Exception):
+    """Reddit did not give us the listing we asked for."""
+
+    def __init__(self, status: Optional[int], reason: str = "") -> None:
+        """Create the error for the given HTTP (or JSON error) status."""
+        super().__init__(f"{status} {reason}".strip())
+        self.status = status
+
+
+def read_listing(status: int, body: bytes) -> List[PostSummary]:
+    """Decode the body of a listing response into the summaries of its posts.
+
+    Every post is turned into a compact PostSummary right away, so the rest of
+    the decoded listing can be thrown away immediately. Next to HTTP errors,
+    Reddit sometimes answers with an error state in the JSON itself, which looks
+    like this: {'message': 'Too Many Requests', 'error': 429}. In both cases a
+    ListingError is raised.
+    """
+    try:
+        result = json.loads(body)
+    except ValueError:
+        raise ListingError(status, "invalid JSON")
+    if isinstance(result, dict) and result.get("error", None):
+        raise ListingError(int(result["error"]), str(result.get("message", "")))
+    if status >= 400:
+        raise ListingError(status)
+    # there are only two top level keys for every child; kind (comment / post) and
+    # data. No reason to keep the kind because we're only pulling posts.
+    return [PostSummary.from_listing(child["data"]) for child in result["data"]["children"]]
+
+
+def handle_listing_error(
+    error: ListingError,
+    subreddits: List[str],
+    budget: RequestBudget,
+    breaker: CircuitBreaker,
+    token: Optional[AppOnlyToken] = None,
+) -> bool:
+    """Deal with a failed listing request.
+
+    A 429 means that we are out of requests, so the shared budget is drained
+    until Reddit lets us send requests again. A 401 means that our OAuth token
+    was refused, so a new one is minted for the next scan. Any other error is
+    attributed to the subreddit; if it was part of a combined listing, True is
+    returned to signal that the subreddits have to be fetched one by one to find
+    out which of them is failing.
+    """
+    log.warning("hit error state {} for {}".format(error, "+".join(subreddits)))
+    if error.status == 429:
+        budget.exhausted()
+        return False
+    if error.status == 401 and token is not None:
+        token.invalidate()
+        return False
+    if len(subreddits) > 1:
+        return True
+    breaker.failure(subreddits[0])
+    return False
+
+
+class ListingRequest(object):
+    """The pages that make up one fetch of the listing of a batch of subreddits.
+
+    If we have seen the subreddits before, only the posts newer than their
+    high-water marks are requested. When more than a page of new posts came in
+    since the last scan, we walk forward page by page until we have them all.
+
+    Every now and then the cursor is double-checked with a full listing (see
+    `ListingCursors.cursor`). For subreddits we know, that walks back page by
+    page until it reaches what we had already seen, so a burst is never cut off
+    at the first page. An empty page from a cursor that might point at a removed
+    post is double-checked the same way right away.
+    """
+
+    def __init__(
+        self, subreddits: List[str], cursors: ListingCursors, base_url: str = REDDIT_URL
+    ) -> None:
+        """Prepare the fetch of the given subreddits."""
+        self.subreddits = subreddits
+        self.base_url = base_url
+        self.cursor = cursors.cursor(subreddits)
+        # How far back a full listing has to page; None for subreddits we don't know yet
+        self.floor = cursors.refresh_floor(subreddits)
+        self.reached_floor = False
+        self.posts: List[PostSummary] = []
+        self.pages = 0
+        self._recheck = self.cursor is not None and cursors.suspect_empty(subreddits)
+        self._before = self.cursor
+        self._after: Optional[str] = None
+        self._done = False
+
+    def next_url(self) -> Optional[str]:
+        """Return the URL of the next page to fetch, or None if we're done."""
+        if self._done:
+            return None
+        return subreddit_listing_url(
+            self.subreddits,
+            before=self._before,
+            base_url=self.base_url,
+            after=self._after,
+            full_page=self.floor is not None,
+        )
+
+    def add_page(self, page: List[PostSummary]) -> None:
+        """Add a page that was fetched from the URL returned by `next_url`."""
+        self.pages += 1
+        if self.cursor is None:
+            self._add_full_page(page)
+            return
+
+        # Pages further forward hold newer posts; keep the newest first
+        self.posts = page + self.posts
+        if not page and self.pages == 1 and self._recheck:
+            log.info(f"Double-checking the empty listing of {'+'.join(self.subreddits)}")
+            self.cursor = self._before = None
+        elif len(page) < BATCH_LIMIT:
+            self._done = True
+        elif self.pages >= MAX_PAGES:
+            log.warning(f"Stopped paging through {'+'.join(self.subreddits)} after {self.pages}")
+            self._done = True
+        else:
+            self._before = page[0].name
+
+    def _add_full_page(self, page: List[PostSummary]) -> None:
+        # Pages further back hold older posts
+        self.posts = self.posts + page
+        if self.floor is None:
+            self._done = True
+        elif len(page) < BATCH_LIMIT or page[-1].created_utc <= self.floor:
+            self.reached_floor = True
+            self._done = True
+        elif self.pages >= MAX_PAGES:
+            log.warning(
+                f"Stopped paging back through {'+'.join(self.subreddits)} after {self.pages}"
+            )
+            self._done = True
+        else:
+            self._after = page[-1].name
+
+
+def posts_from_listing(
+    request: ListingRequest, planner: ListingPlanner, cursors: ListingCursors
+) -> Optional[List[PostSummary]]:
+    """Return the new posts of a (possibly combined) listing that we could work on.
+
+    Combined listings are split back up per subreddit, and only the posts newer
+    than the high-water mark of a subreddit are kept. If a combined full listing
+    is saturated, None is returned: the subreddits then have to be fetched one by
+    one.
+    """
+    subreddits = request.subreddits
+    incremental = request.cursor is not None
+    if (
+        not incremental
+        and not request.reached_floor
+        and len(subreddits) > 1
+        and planner.is_saturated(request.posts, subreddits)
+    ):
+        log.info(f"Combined listing of {len(subreddits)} subreddits is saturated")
+        return None
+    planner.record(request.posts, subreddits, incremental=incremental)
+
+    new_posts: List[PostSummary] = []
+    for sub, posts in demultiplex(request.posts, subreddits).items():
+        known = sub in cursors.marks
+        posts = cursors.new_posts(sub, posts)
+        cursors.advance(sub, posts, full_listing=not incremental)
+        # The first time we see a subreddit, only its newest posts are of interest.
+        # After that, everything that is newer than the high-water mark is new.
+        if not known:
+            posts = posts[:NEWEST_POSTS]
+        new_posts += [post for post in posts if not post.is_self]
+    return new_posts
+
+
+def default_worker_count() -> int:
+    """Return the default size of the scanner worker pool.
+
+    This mirrors what ThreadPoolExecutor used to pick for us when it was
+    created on every scan (the CPU count multiplied by 5), but with the same
+    upper bound Python applies nowadays so we don't open a silly amount of
+    connections on big machines.
+    """
+    return min(32, (os.cpu_count() or 1) * 5)
+
+
+class ScannerEngine(object):
+    """The long-lived worker pool and HTTP session used by the subreddit scanner.
+
+    Creating a new thread pool and a new TCP + TLS connection for every subreddit
+    on every scan means that the handshakes end up dominating the scan time. This
+    keeps both around for the whole lifetime of the bot instead:
+
+    - the worker pool persists across scan cycles
+    - the connection pool of the session is sized to the amount of workers, so
+      that every worker can keep its own connection alive
+    - gzip is negotiated explicitly to keep the listing payloads small
+
+    Every request has a connect and a read deadline, so a hung connection can't
+    stall a worker for good. Requests that take longer than most recent ones
+    are hedged with a second request for the same URL.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+    ) -> None:
+        """Create the worker pool and the pooled HTTP session."""
+        self.max_workers = max_workers or default_worker_count()
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="scanner"
+        )
+        # The requests themselves run here when they might have to be hedged, so
+        # the workers can wait for whichever of the two answers first
+        self.hedge_executor = ThreadPoolExecutor(
+            max_workers=self.max_workers * 2, thread_name_prefix="scanner-hedge"
+        )
+        self.timeout = (connect_timeout, read_timeout)
+        self.latency = LatencyTracker()
+        self.hedged = 0
+        # The subreddits that are still being fetched after their scan cycle ended,
+        # and the posts of those that came in late
+        self.in_flight: Set[str] = set()
+        self.late_posts: List[PostSummary] = []
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip"
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def get(
+        self, url: str, budget: Optional[RequestBudget] = None, **kwargs: Any
+    ) -> requests.Response:
+        """Perform a GET request over the pooled session.
+
+        If the request takes longer than the 95th percentile of the recent ones,
+        a second request is sent (if the rate limit `budget` allows for it), and
+        the response that arrives first is returned.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        hedge_after = self.latency.hedge_after()
+        if hedge_after is None:
+            return self._timed_get(url, **kwargs)
+
+        first = self.hedge_executor.submit(self._timed_get, url, **kwargs)
+        try:
+            return first.result(timeout=hedge_after)
+        except FutureTimeoutError:
+            pass
+        if budget is not None and not budget.try_reserve():
+            return first.result()
+
+        with self._lock:
+            self.hedged += 1
+        second = self.hedge_executor.submit(self._timed_get, url, **kwargs)
+        for request in as_completed([first, second]):
+            if request.exception() is None:
+                return request.result()
+        # Both failed
+        return first.result()
+
+    def _timed_get(self, url: str, **kwargs: Any) -> requests.Response:
+        started = time.monotonic()
+        response = self.session.get(url, **kwargs)
+        self.latency.add(time.monotonic() - started)
+        return response
+
+    def carry_over(self, job: Future, subreddits: List[str]) -> None:
+        """Keep the posts of a listing that is still loading after its scan cycle ended.
+
+        They are handed over at the start of the next scan, see `take_late_posts`.
+        """
+        with self._lock:
+            self.in_flight.update(subreddits)
+
+        def done(job: Future) -> None:
+            with self._lock:
+                self.in_flight.difference_update(subreddits)
+                if not job.cancelled() and job.exception() is None:
+                    self.late_posts += job.result()
+
+        job.add_done_callback(done)
+
+    def take_late_posts(self) -> List[PostSummary]:
+        """Return the posts that came in after their scan cycle ended."""
+        with self._lock:
+            posts, self.late_posts = self.late_posts, []
+        return posts
+
+    def connection_stats(self) -> Dict[str, Dict[str, int]]:
+        """Return how well the keep-alive connections are being reused, per host.
+
+        `requests` is the amount of requests sent to the host, `connections`
+        the amount of connections that had to be opened for them. Everything
+        else was served over an already established connection.
+        """
+        stats = {}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened = pool.num_connections
+            sent = pool.num_requests
+            stats[str(pool.host)] = {
+                "requests": sent,
+                "connections": opened,
+                "reused": max(sent - opened, 0),
+            }
+        return stats
+
+    def close(self) -> None:
+        """Shut down the worker pool and close all pooled connections."""
+        self.executor.shutdown(wait=False)
+        self.hedge_executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,190 @@
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tor.helpers.files import atomic_write, file_lock
+
+log = logging.getLogger(__name__)
+
+# Forget about posts after two weeks; they won't show up in any listing by then
+DEFAULT_MAX_AGE = 14 * 24 * 60 * 60
+
+# Up to this many new posts are inserted in place, more are merged in one go
+INSERT_LIMIT = 64
+
+_HEADER = struct.Struct("<4sI")
+_MAGIC = b"SEEN"
+
+
+def fullname_to_int(fullname: str) -> int:
+    """Convert a Reddit fullname like t3_8swl2n to the integer behind its base36 ID."""
+    return int(fullname[fullname.index("_") + 1 :], 36)
+
+
+class SeenPostIndex(object):
+    """A compact set of the partner posts that we know are already taken care of.
+
+    Every post we've either put into the queue ourselves or that Blossom told
+    us it already knows about ends up here, so it doesn't need to be sent to
+    Blossom's bulkcheck again on every scan.
+
+    The base36 IDs of the posts are stored as integers in a sorted array, next
+    to a parallel array of when we have seen them, which allows us to evict old
+    posts. That's 12 bytes per post, and the whole thing can be written to disk
+    as-is to survive restarts.
+
+    The file is shared with `tor backfill`, which may run next to the bot. If
+    another process wrote the file since we last read or wrote it, its posts
+    are merged in before ours are written, so neither process loses the other's.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_age: float = DEFAULT_MAX_AGE) -> None:
+        """Create the index, loading it from the given file if it exists."""
+        self.path = path
+        self.max_age = max_age
+        self.ids = array("Q")
+        self.seen_at = array("I")
+        # Posts added since the last merge, with when we have seen them
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        # The modification time and size of the file when we last read or wrote it
+        self._stamp: Optional[Tuple[int, int]] = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        self.merge()
+        return len(self.ids)
+
+    def __contains__(self, fullname: object) -> bool:
+        post_id = fullname_to_int(str(fullname))
+        with self._lock:
+            if post_id in self._pending:
+                return True
+            index = bisect_left(self.ids, post_id)
+            return index < len(self.ids) and self.ids[index] == post_id
+
+    def add(self, fullnames: Iterable[str], now: Optional[float] = None) -> None:
+        """Mark the given posts as seen.
+
+        The posts go into a small buffer first, which is merged into the arrays
+        once per scan (see `merge`), so adding a post never has to wait for the
+        whole index to be rebuilt.
+        """
+        timestamp = int(time.time() if now is None else now)
+        new_ids = {fullname_to_int(name) for name in fullnames}
+        if not new_ids:
+            return
+
+        with self._lock:
+            for post_id in new_ids:
+                self._pending[post_id] = max(timestamp, self._pending.get(post_id, 0))
+            self._dirty = True
+
+    def merge(self) -> None:
+        """Merge the posts that were added since the last merge into the arrays."""
+        with self._lock:
+            if not self._pending:
+                return
+            fresh: List[Tuple[int, int]] = []
+            for post_id, timestamp in self._pending.items():
+                index = bisect_left(self.ids, post_id)
+                if index < len(self.ids) and self.ids[index] == post_id:
+                    # Already known, keep it around for longer
+                    self.seen_at[index] = max(self.seen_at[index], timestamp)
+                else:
+                    fresh.append((post_id, timestamp))
+            self._pending = {}
+            if len(fresh) <= INSERT_LIMIT:
+                for post_id, timestamp in fresh:
+                    index = bisect_left(self.ids, post_id)
+                    self.ids.insert(index, post_id)
+                    self.seen_at.insert(index, timestamp)
+                return
+            # Both runs are sorted already, which is what sorted() is fastest at
+            merged = sorted(chain(zip(self.ids, self.seen_at), sorted(fresh)))
+            self.ids = array("Q", (post_id for post_id, _ in merged))
+            self.seen_at = array("I", (timestamp for _, timestamp in merged))
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Forget about all posts that we have seen longer ago than the maximum age."""
+        self.merge()
+        cutoff = (time.time() if now is None else now) - self.max_age
+        with self._lock:
+            keep = [index for index, seen in enumerate(self.seen_at) if seen >= cutoff]
+            evicted = len(self.ids) - len(keep)
+            if evicted:
+                self.ids = array("Q", (self.ids[index] for index in keep))
+                self.seen_at = array("I", (self.seen_at[index] for index in keep))
+                self._dirty = True
+        return evicted
+
+    def load(self) -> None:
+        """Load the index from its file."""
+        if not self.path:
+            return
+        stamp = self._file_stamp()
+        arrays = self._read()
+        with self._lock:
+            self._stamp = stamp
+            if arrays is None:
+                return
+            self.ids, self.seen_at = arrays
+            self._pending = {}
+            self._dirty = False
+
+    def save(self) -> None:
+        """Write the index to its file, if anything has changed.
+
+        This happens under a lock on the file, and the posts that another process
+        wrote to it in the meantime are merged in first.
+        """
+        if not self.path or not self._dirty:
+            return
+        with file_lock(self.path):
+            if self._file_stamp() != self._stamp and (arrays := self._read()) is not None:
+                with self._lock:
+                    for post_id, timestamp in zip(*arrays):
+                        self._pending[post_id] = max(timestamp, self._pending.get(post_id, 0))
+            self.merge()
+            with self._lock:
+                data = (
+                    _HEADER.pack(_MAGIC, len(self.ids))
+                    + self.ids.tobytes()
+                    + self.seen_at.tobytes()
+                )
+                self._dirty = False
+            atomic_write(self.path, data)
+            self._stamp = self._file_stamp()
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(str(self.path))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> Optional[Tuple[array, array]]:
+        try:
+            with open(str(self.path), "rb") as index_file:
+                data = index_file.read()
+        except FileNotFoundError:
+            return None
+        magic, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            log.warning(f"Ignoring {self.path}, it is not an index of seen posts")
+            return None
+
+        ids, seen_at = array("Q"), array("I")
+        offset = _HEADER.size
+        ids.frombytes(data[offset : offset + count * ids.itemsize])
+        offset += count * ids.itemsize
+        seen_at.frombytes(data[offset : offset + count * seen_at.itemsize])
+        return ids, seen_at
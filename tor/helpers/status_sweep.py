@@ -0,0 +1,29 @@
+import re
+from typing import Iterator, List, Optional
+
+# How often the partner posts of the open queue are checked for removals and NSFW
+SWEEP_INTERVAL = 5 * 60
+# How many of the newest posts on r/TranscribersOfReddit are looked at per sweep
+SWEEP_SIZE = 1000
+# The most fullnames Reddit accepts in a single /api/info request
+INFO_BATCH_SIZE = 100
+
+_COMMENTS_LINK = re.compile(r"/comments/([a-z0-9]+)", flags=re.IGNORECASE)
+_SHORT_LINK = re.compile(r"^https?://redd\.it/([a-z0-9]+)", flags=re.IGNORECASE)
+
+
+def partner_fullname(url: str) -> Optional[str]:
+    """Get the fullname (t3_...) of the partner post that a queue post links to.
+
+    Returns None for links that don't point to a Reddit post.
+    """
+    match = _COMMENTS_LINK.search(url) or _SHORT_LINK.search(url)
+    if match is None:
+        return None
+    return f"t3_{match[1].lower()}"
+
+
+def chunked(items: List[str], size: int = INFO_BATCH_SIZE) -> Iterator[List[str]]:
+    """Split the items into lists of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
@@ -1,102 +1,260 @@
 import logging
-import random
-import string
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import as_completed
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 
 import beeline
-import requests
+from prawcore.exceptions import PrawcoreException
 
-from tor.core.config import Config
-from tor.core.posts import PostSummary, process_post
-from tor.strings import translation
+from tor.core.config import DATA_DIRECTORY, Config
+from tor.core.posts import PostSummary, accept_post, process_post, should_process_post
+from tor.helpers.backfill import (
+    BACKFILL_RATE,
+    MAX_PAGE_ATTEMPTS,
+    RETRY_DELAY,
+    BackfillCheckpoint,
+)
+from tor.helpers.bulkcheck import DuplicateFilter, posts_by_url, unseen_posts
+from tor.helpers.flair import flair
+from tor.helpers.intake import intake_priority
+from tor.helpers.oauth import TokenError
+from tor.helpers.pipeline import ScanPipeline
+from tor.helpers.rate_limit import RequestBudget
+from tor.helpers.scanner import (
+    ANONYMOUS,
+    ListingAccess,
+    ListingError,
+    ListingRequest,
+    generate_user_agent,
+    handle_listing_error,
+    listing_access,
+    posts_from_listing,
+    read_listing,
+    subreddit_listing_url,
+)
 
 log = logging.getLogger()
-i18n = translation()
 
 # The time when no more posts should be pulled into the queue
 # 2023-07-01T00:00:00Z
 END_TIME = datetime(2023, 7, 1, 0, 0, 0, 0, tzinfo=timezone.utc)
 
+# How many of the newest posts on r/TranscribersOfReddit are looked at to estimate
+# the backlog of the queue. A bigger backlog than this is all the same to us.
+BACKLOG_SAMPLE_SIZE = 300
 
-def check_domain_filter(item: Dict, cfg: Config) -> bool:
+
+def check_domain_filter(item: PostSummary, cfg: Config) -> bool:
     """Validate that a given post is actually one that we can (or should) work on.
 
-    We check the domain of the post against our filters.
+    We check the domain of the post against our filters. The content type that
+    the domain stands for is stored on the post, so it doesn't have to be looked
+    up again when the post is put into the queue.
 
-    :param item: a dict which has the post information in it.
+    :param item: the summary of the post.
     :param cfg: the config object.
     :return: True if we can work on it, False otherwise.
     """
-    if item["domain"] in cfg.image_domains:
-        return True
-    if item["domain"] in cfg.audio_domains:
+    item.content_type = cfg.domain_index.content_type(item.domain)
+    if item.content_type is not None:
         return True
-    if item["domain"] in cfg.video_domains:
-        return True
-    if item["subreddit"] in cfg.subreddits_domain_filter_bypass:
+    if item.subreddit in cfg.subreddits_domain_filter_bypass:
         return True
 
     return False
 
 
+def select_candidates(
+    posts: List[PostSummary], duplicate_filter: DuplicateFilter, cfg: Config
+) -> List[PostSummary]:
+    """Pick the posts that pass the domain filter and that we haven't seen yet."""
+    # Only ask Blossom about the posts we don't already know to be taken care of
+    candidates = [
+        post for post in posts if check_domain_filter(post, cfg) and post.name not in cfg.seen_posts
+    ]
+    candidates, duplicates = duplicate_filter.split(candidates)
+    # Crossposts of posts we took care of before never have to be checked again. The
+    # other duplicates only once the post they duplicate is taken care of.
+    cfg.seen_posts.add(
+        post.name
+        for post in duplicates
+        if post.crosspost_parent is not None
+        and post.crosspost_parent in duplicate_filter.seen_posts
+    )
+    return candidates
+
+
+def bulkcheck_candidates(
+    candidates: List[PostSummary], cfg: Config, duplicate_filter: Optional[DuplicateFilter] = None
+) -> List[PostSummary]:
+    """Ask Blossom which of the candidates it doesn't know about yet, in one request."""
+    candidate_urls = posts_by_url(candidates)
+    unseen_post_urls = cfg.blossom.post(
+        "/submission/bulkcheck/", data={"urls": list(candidate_urls)}
+    ).json()
+    new_posts = unseen_posts(candidate_urls, unseen_post_urls)
+    # Everything Blossom already knows about never has to be checked again
+    unseen_names = {post.name for post in new_posts}
+    known = [post.name for post in candidates if post.name not in unseen_names]
+    cfg.seen_posts.add(duplicate_filter.release(known) if duplicate_filter else known)
+    return new_posts
+
+
 @beeline.traced_thread
-def get_subreddit_posts(sub: str) -> List[PostSummary]:
-    """Get new posts from the given subreddit."""
-    def generate_user_agent() -> str:
-        """Generate a new Reddit user agent.
-
-        Reddit routinely blocks / throttles common user agents. The easiest way
-        to deal with that is to (nicely) generate a partially unique user-agent
-        in an easy-to-follow pattern in case they decide that they do want to
-        block us for this.
-        :return: A complete user agent string.
-        """
-        return "0.1.0.ToR.Client.Thread.{}.ID.{} (contact u/itsthejoker)".format(
-            random.randrange(0, 30),
-            "".join([random.choice(string.ascii_lowercase) for _ in range(6)]),
+def get_subreddit_posts(
+    subreddits: List[str], cfg: Config, access: ListingAccess = ANONYMOUS
+) -> List[PostSummary]:
+    """Get new posts from the given subreddits.
+
+    The subreddits are fetched as one combined listing over the pooled session
+    of the scanner, so the connection to Reddit is kept alive between requests
+    and between scans. Only the posts newer than what we saw during the last
+    scan are requested, and every request is paced by the shared rate limit
+    budget. If a combined full listing is saturated or fails, we fall back to
+    fetching the subreddits one by one.
+    """
+    with beeline.tracer(name="get_subreddit_posts"):
+        beeline.add_context({"subreddit": "+".join(subreddits)})
+
+        headers = {"User-Agent": generate_user_agent(), **access.headers}
+        request = ListingRequest(subreddits, cfg.listing_cursors, base_url=access.base_url)
+        try:
+            while url := request.next_url():
+                cfg.request_budget.wait()
+                try:
+                    response = cfg.scanner.get(url, cfg.request_budget, headers=headers)
+                except OSError as e:
+                    raise ListingError(None, str(e))
+                cfg.request_budget.update(response.headers)
+                request.add_page(read_listing(response.status_code, response.content))
+        except ListingError as e:
+            retry_separately = handle_listing_error(
+                e, subreddits, cfg.request_budget, cfg.subreddit_breaker, cfg.scanner_token
+            )
+            posts: Optional[List[PostSummary]] = None if retry_separately else []
+        else:
+            beeline.add_context({"pages": request.pages, "incremental": request.cursor is not None})
+            cfg.subreddit_breaker.success(subreddits)
+            posts = posts_from_listing(request, cfg.listing_planner, cfg.listing_cursors)
+
+        if posts is None:
+            posts = []
+            for sub in subreddits:
+                posts += get_subreddit_posts([sub], cfg, access)
+        return posts
+
+
+def fetch_subreddit_posts(
+    subreddits: List[str], cfg: Config, on_posts: Callable[[List[PostSummary]], None]
+) -> None:
+    """Fetch the new posts of all given subreddits with the configured scanner.
+
+    Quiet subreddits are grouped into combined listings by the listing planner.
+    In the default "threaded" mode the subreddits are fanned out over the worker
+    pool of the scanner, in "asyncio" mode they are all fetched on one event loop.
+    Either way, `on_posts` is called with the posts of every listing as soon as
+    it is in, while the other listings are still loading.
+
+    The scan is given up on after the scan budget. The subreddits that aren't in
+    by then are reported and left for the next scan, so one hung subreddit can't
+    hold up the bot (and with it, the inbox).
+    """
+    batches = cfg.listing_planner.plan(subreddits)
+    beeline.add_context({"subreddits": len(subreddits), "listing_requests": len(batches)})
+
+    # With OAuth, one token is shared by all requests of the scan
+    try:
+        access = listing_access(cfg.scanner_token, cfg.scanner.session)
+    except (TokenError, OSError) as e:
+        log.warning(f"Could not get an OAuth token, scanning anonymously: {e}")
+        access = ANONYMOUS
+
+    if cfg.scanner_mode == "asyncio":
+        cfg.async_scanner.scan(
+            batches, cfg, on_posts=on_posts, deadline=cfg.scan_budget, access=access
+        )
+        missed = cfg.async_scanner.missed_subreddits
+        connection_stats: Dict = cfg.async_scanner.connection_stats()
+    else:
+        # The posts of listings that came in after the previous scan had ended
+        if late_posts := cfg.scanner.take_late_posts():
+            on_posts(late_posts)
+        # The worker pool lives as long as the bot does, so we don't pay for
+        # spinning up threads and opening new connections on every scan.
+        executor = cfg.scanner.executor
+        jobs = {
+            executor.submit(get_subreddit_posts, batch, cfg, access): batch for batch in batches
+        }
+        try:
+            for f in as_completed(jobs, timeout=cfg.scan_budget):
+                try:
+                    data: List[PostSummary] = f.result()
+                except Exception as exc:
+                    log.warning("an exception was generated: {}".format(exc))
+                else:
+                    on_posts(data)
+        except FutureTimeoutError:
+            pass
+        # Don't hold up the scan for the stragglers; their posts are handed over
+        # during the next one
+        missed = []
+        for f, batch in jobs.items():
+            if not f.done():
+                cfg.scanner.carry_over(f, batch)
+                missed += batch
+        connection_stats = cfg.scanner.connection_stats()
+
+    if missed:
+        cfg.deadline_misses.update(missed)
+        log.warning(
+            "Scan budget exceeded, carrying over: "
+            + ", ".join(f"r/{sub} ({cfg.deadline_misses[sub]} misses)" for sub in missed)
         )
+    budget = cfg.request_budget.report()
+    beeline.add_context(
+        {
+            "scanner_mode": cfg.scanner_mode,
+            "scanner_connections": connection_stats,
+            "deadline_missed": missed,
+            "ratelimit_remaining": budget["remaining"],
+            "ratelimit_throttled": budget["throttled"],
+        }
+    )
+    log.debug(f"Scanner connection reuse: {connection_stats}")
+    log.info(f"Scanner rate limit budget: {budget}")
 
-    def parse_json_posts(posts: Dict) -> List[PostSummary]:
-        trimmed_links: List[PostSummary] = []
-        for item in posts["data"]["children"][:10]:  # last 10 posts
-            # there are only two top level keys here; kind (comment / post) and
-            # data. No reason to keep the kind because we're only pulling posts.
-            item = item["data"]
-            if not item["is_self"]:
-                trimmed_links.append(
-                    {
-                        "subreddit": item["subreddit"],
-                        "name": item["name"],  # remember, this is the ID: t3_8swl2n
-                        "title": item["title"],
-                        "permalink": item["permalink"],
-                        "is_nsfw": item["over_18"],
-                        "is_gallery": "is_gallery" in item,
-                        "domain": item["domain"],
-                        "ups": item["ups"],
-                        "locked": item["locked"],
-                        "archived": item["archived"],
-                        "author": item.get("author", None),
-                        "url": item["url"],
-                    }
-                )
-        return trimmed_links
 
-    with beeline.tracer(name="get_subreddit_posts"):
-        beeline.add_context({"subreddit": sub})
+def count_unclaimed_posts(cfg: Config, limit: int = BACKLOG_SAMPLE_SIZE) -> int:
+    """Count the unclaimed posts among the newest posts on r/TranscribersOfReddit."""
+    return sum(
+        1
+        for submission in cfg.tor.new(limit=limit)
+        if getattr(submission, "link_flair_template_id", None) == flair.unclaimed
+    )
+
 
-        headers = {"User-Agent": generate_user_agent()}
-        url = f"https://www.reddit.com/r/{sub}/new/.json"
-        result = requests.get(url, headers=headers).json()
-        # we have two states here: one has the data we want and the other is an
-        # error state. The error state looks like this:
-        # {'message': 'Too Many Requests', 'error': 429}
+def adjust_intake(cfg: Config, now: float) -> None:
+    """Decide how many new posts may go into the queue during this scan.
 
-        if result.get("error", None):
-            log.warning("hit error state for {}".format(sub))
-            return []
-        return parse_json_posts(result)
+    The intake controller looks at how many unclaimed posts are waiting in the
+    queue every few minutes and lets in fewer new posts when the volunteers
+    can't keep up, and more when they are running out of work.
+    """
+    controller = cfg.intake_controller
+    if controller.due(now):
+        try:
+            controller.update(count_unclaimed_posts(cfg), now)
+        except PrawcoreException as e:
+            # Keep the current limit and try again during the next scan
+            log.warning(f"Could not count the unclaimed posts in the queue: {e}")
+    cfg.intake.start_cycle(controller.admit)
+
+    decision = controller.report()
+    beeline.add_context({f"intake_{key}": value for key, value in decision.items()})
+    log.info(f"Intake: {decision}")
 
 
 def is_time_to_scan(cfg: Config) -> bool:
@@ -129,35 +287,164 @@ def threaded_check_submissions(cfg: Config) -> None:
         return
 
     cfg.last_post_scan_time = datetime.now(tz=timezone.utc)
+    scan_started = cfg.last_post_scan_time.timestamp()
+
+    # Quiet subreddits are polled less often than busy ones, and subreddits that
+    # keep failing are left alone for a while
+    subreddits = [
+        sub
+        for sub in cfg.poll_scheduler.due(cfg.subreddits_to_check, now=scan_started)
+        if cfg.subreddit_breaker.allow(sub, now=scan_started) and sub not in cfg.scanner.in_flight
+    ]
+    beeline.add_context({"due_subreddits": len(subreddits)})
+    log.debug(f"{len(subreddits)} of {len(cfg.subreddits_to_check)} subreddits are due")
+    adjust_intake(cfg, now=scan_started)
+
+    seen_posts = cfg.seen_posts
+    duplicate_filter = DuplicateFilter(seen_posts)
+
+    def select(posts: List[PostSummary]) -> List[PostSummary]:
+        return select_candidates(posts, duplicate_filter, cfg)
+
+    def check(candidates: List[PostSummary]) -> List[PostSummary]:
+        # Only the posts that can go into the queue right away get a share of the intake
+        return [
+            post
+            for post in bulkcheck_candidates(candidates, cfg, duplicate_filter)
+            if accept_post(post, cfg)
+        ]
+
+    def publish(post: PostSummary) -> bool:
+        # Every publish worker talks to Reddit through a client of its own
+        if published := process_post(post, cfg.for_thread()):
+            seen_posts.add(duplicate_filter.release([post.name]))
+        return published
+
+    cfg.prepare_workers()
+    # The posts of every listing go on to the bulkcheck and into the queue while
+    # the other listings are still loading. Every partner gets its fair share of
+    # the intake that the queue can take, the rest is carried over to the next scans.
+    pipeline = ScanPipeline(
+        select,
+        check,
+        publish,
+        publish_workers=cfg.posting_workers,
+        schedule=cfg.intake.schedule,
+        priority=lambda post: -intake_priority(post, scan_started),
+    ).start()
+    try:
+        fetch_subreddit_posts(subreddits, cfg, on_posts=pipeline.put)
+    finally:
+        stats = pipeline.close()
+    cfg.poll_scheduler.reschedule(subreddits, cfg.listing_planner, since=scan_started)
+    intake = cfg.intake.report()
+    beeline.add_context({f"pipeline_{key}": value for key, value in stats.items()})
+    beeline.add_context({"intake_backlog": intake["backlog"], "intake_dropped": intake["dropped"]})
+    log.info(f"Scan pipeline: {stats}")
+    log.info(f"Intake backlog: {intake}")
+
+    seen_posts.evict()
+    seen_posts.save()
+
+
+@beeline.traced(name="backfill_subreddit")
+def backfill_subreddit(
+    subreddit: str, since: float, cfg: Config, rate: float = BACKFILL_RATE
+) -> BackfillCheckpoint:
+    """Put the posts of a partner subreddit since the given time into the queue.
+
+    The regular scan only looks at the newest posts of every subreddit, so the
+    posts from before a new partner joined or from during an outage are never
+    picked up. This pages backwards through the listing of the subreddit and
+    streams every page through the same stages as a scan: the domain filter,
+    the checks of `should_process_post`, the bulkcheck and finally the queue,
+    at most `rate` posts per second so the queue isn't flooded.
 
-    subreddits = cfg.subreddits_to_check
+    After every page a checkpoint is written, so an interrupted backfill can be
+    started again with the same arguments and continues where it stopped. Note
+    that Reddit only serves about the last 1000 posts of a listing.
 
-    total_posts: List[PostSummary] = []
-    # by not specifying a maximum number of threads, ThreadPoolExecutor will
-    # grab the CPU count of the current machine and multiply it by 5, allowing
-    # us to keep sane limits wherever we're running.
+    A page that fails is tried again after a while, waiting for the rate limit
+    after a 429. The backfill stops early, with the checkpoint left where it
+    is, once the same page keeps failing or when the bot stops pulling posts
+    into the queue at `END_TIME`.
+    """
+    checkpoint = BackfillCheckpoint(
+        os.path.join(DATA_DIRECTORY, "backfill", f"{subreddit.lower()}.json"), subreddit, since
+    )
+    if checkpoint.resumed:
+        log.info(f"Resuming the backfill of r/{subreddit} after {checkpoint.pages} pages")
+
+    posting_budget = RequestBudget(rate=rate, burst=1, reserve=0)
+    duplicate_filter = DuplicateFilter(cfg.seen_posts)
+
+    def select(posts: List[PostSummary]) -> List[PostSummary]:
+        # The upvotes of older posts won't change much anymore, so posts below the
+        # threshold are skipped instead of watched
+        return [
+            post
+            for post in select_candidates(posts, duplicate_filter, cfg)
+            if not post.is_self and should_process_post(post, cfg)
+        ]
+
+    def publish(post: PostSummary) -> bool:
+        posting_budget.wait()
+        if published := process_post(post, cfg.for_thread()):
+            cfg.seen_posts.add(duplicate_filter.release([post.name]))
+        return published
 
-    with ThreadPoolExecutor() as executor:
-        jobs = list()
-        for sub in subreddits:
-            jobs.append(executor.submit(get_subreddit_posts, sub))
-        for f in as_completed(jobs):
+    cfg.prepare_workers()
+    failures = 0
+    while not checkpoint.done:
+        if datetime.now(tz=timezone.utc) >= END_TIME:
+            log.warning(f"Stopping the backfill of r/{subreddit}, the queue is closed")
+            break
+
+        # With OAuth, the token is looked up for every page as a backfill can
+        # take longer than the token is valid
+        try:
+            access = listing_access(cfg.scanner_token, cfg.scanner.session)
+        except (TokenError, OSError) as e:
+            log.warning(f"Could not get an OAuth token, backfilling anonymously: {e}")
+            access = ANONYMOUS
+        headers = {"User-Agent": generate_user_agent(), **access.headers}
+        url = subreddit_listing_url([subreddit], base_url=access.base_url, after=checkpoint.after)
+        cfg.request_budget.wait()
+        try:
             try:
-                data: List[PostSummary] = f.result()
-                total_posts += data
-            except Exception as exc:
-                log.warning("an exception was generated: {}".format(exc))
-    total_posts = [post for post in total_posts if check_domain_filter(post, cfg)]
-    unseen_post_urls = cfg.blossom.post(
-        "/submission/bulkcheck/",
-        data={
-            "urls": [i18n["urls"]["reddit_url"].format(post["permalink"]) for post in total_posts]
-        },
-    ).json()
-    unseen_posts = [
-        post
-        for post in total_posts
-        if i18n["urls"]["reddit_url"].format(post["permalink"]) in unseen_post_urls
-    ]
-    for item in unseen_posts:
-        process_post(item, cfg)
+                response = cfg.scanner.get(url, cfg.request_budget, headers=headers)
+            except OSError as e:
+                raise ListingError(None, str(e))
+            cfg.request_budget.update(response.headers)
+            page = read_listing(response.status_code, response.content)
+        except ListingError as e:
+            failures += 1
+            log.warning(f"Page {checkpoint.pages + 1} of r/{subreddit} failed: {e}")
+            if failures >= MAX_PAGE_ATTEMPTS:
+                log.error(f"Stopping the backfill of r/{subreddit} after {failures} failures")
+                break
+            if e.status == 429:
+                cfg.request_budget.exhausted()
+            elif e.status == 401 and cfg.scanner_token is not None:
+                cfg.scanner_token.invalidate()
+            else:
+                time.sleep(RETRY_DELAY * failures)
+            continue
+
+        failures = 0
+        posts, after, last = checkpoint.read_page(page)
+        pipeline = ScanPipeline(
+            select, lambda batch: bulkcheck_candidates(batch, cfg, duplicate_filter), publish
+        )
+        pipeline.start().put(posts)
+        stats = pipeline.close()
+
+        # The posts of the page are taken care of before the checkpoint moves past it
+        cfg.seen_posts.save()
+        checkpoint.advance(after, last, published=int(stats["published"]))
+        log.info(
+            f"Backfill of r/{subreddit}: page {checkpoint.pages}, {len(posts)} posts,"
+            f" {int(stats['published'])} put into the queue"
+        )
+
+    return checkpoint
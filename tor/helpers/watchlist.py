@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tor.helpers.post_summary import PostSummary
+
+# How many posts are watched at most; when full, the ones closest to expiring make room
+MAX_WATCHED = 2000
+# How long a post is watched before we give up on it reaching the threshold
+WATCH_EXPIRY = 24 * 60 * 60
+# How often the watched posts are looked up again, in seconds
+RECHECK_INTERVAL = 10 * 60
+
+
+class UpvoteWatchlist(object):
+    """The partner posts that didn't have enough upvotes yet when we first saw them.
+
+    Some partners only want posts with a minimum amount of upvotes in the
+    queue. A fresh post rarely has them, and the scanner only sees every post
+    once, right after it was posted. So instead of forgetting such a post, we
+    watch it: every `interval` seconds all watched posts are looked up again
+    in bulk (100 per /api/info request) and the ones that made it go into the
+    queue. Posts that don't make it within `expiry` seconds are forgotten.
+    """
+
+    def __init__(
+        self,
+        max_size: int = MAX_WATCHED,
+        expiry: float = WATCH_EXPIRY,
+        interval: float = RECHECK_INTERVAL,
+    ) -> None:
+        """Create an empty watchlist."""
+        self.max_size = max_size
+        self.expiry = expiry
+        self.interval = interval
+        self.checked_at: Optional[float] = None
+        # The watched posts and when to stop watching them, by fullname
+        self._posts: Dict[str, Tuple[PostSummary, float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._posts
+
+    def add(self, post: PostSummary, now: Optional[float] = None) -> None:
+        """Start watching the given post, unless it is watched already."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if post.name in self._posts:
+                return
+            if len(self._posts) >= self.max_size:
+                oldest = min(self._posts, key=lambda name: self._posts[name][1])
+                del self._posts[oldest]
+            self._posts[post.name] = (post, now + self.expiry)
+
+    def get(self, name: str) -> Optional[PostSummary]:
+        """Return the watched post with the given fullname."""
+        with self._lock:
+            entry = self._posts.get(name)
+        return None if entry is None else entry[0]
+
+    def remove(self, name: str) -> None:
+        """Stop watching the given post."""
+        with self._lock:
+            self._posts.pop(name, None)
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """Check whether it is time to look up the watched posts again."""
+        now = time.time() if now is None else now
+        return self.checked_at is None or now >= self.checked_at + self.interval
+
+    def start_recheck(self, now: Optional[float] = None) -> List[str]:
+        """Forget the expired posts and return the fullnames of the ones to look up."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.checked_at = now
+            self._posts = {name: entry for name, entry in self._posts.items() if entry[1] > now}
+            return list(self._posts)
@@ -1,4 +1,16 @@
-from tor.core.helpers import cleanup_post_title
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional
+from unittest.mock import MagicMock, patch
+
+from blossom_wrapper import BlossomStatus
+
+from tor.core.helpers import (
+    cleanup_post_title,
+    flair,
+    sweep_partner_status,
+    sync_partner_status,
+)
+from tor.helpers.status_sweep import SWEEP_INTERVAL
 
 
 def test_cleanup_post_title() -> None:
@@ -7,3 +19,110 @@ def test_cleanup_post_title() -> None:
     expected = "Test & other stuff <3 1 > 2 abc"
     actual = cleanup_post_title(title)
     assert actual == expected
+
+
+def make_queue_post(partner_url: str, **attributes: Any) -> MagicMock:
+    r_submission = MagicMock()
+    r_submission.url = partner_url
+    r_submission.fullname = f"t3_tor_{partner_url.rstrip('/').split('/')[-1]}"
+    r_submission.link_flair_template_id = flair.unclaimed
+    r_submission.removed_by_category = None
+    r_submission.over_18 = False
+    for name, value in attributes.items():
+        setattr(r_submission, name, value)
+    return r_submission
+
+
+def make_partner_post(fullname: str, over_18: bool = False, removed: Optional[str] = None) -> Any:
+    return MagicMock(fullname=fullname, over_18=over_18, removed_by_category=removed)
+
+
+def make_sweep_config(queue: List[MagicMock], partner_posts: List[Any]) -> MagicMock:
+    cfg = MagicMock()
+    cfg.last_status_sweep_time = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    cfg.tor.new.return_value = queue
+    cfg.r.info.return_value = partner_posts
+    return cfg
+
+
+@patch("tor.core.helpers.send_to_modchat")
+def test_sweep_partner_status_syncs_nsfw_and_removals(mock_modchat: MagicMock) -> None:
+    nsfw = make_queue_post("https://www.reddit.com/r/pics/comments/aaa/")
+    removed = make_queue_post("https://www.reddit.com/r/pics/comments/bbb/")
+    unknown = make_queue_post("https://www.reddit.com/r/pics/comments/ccc/")
+    unchanged = make_queue_post("https://www.reddit.com/r/pics/comments/ddd/")
+    claimed = make_queue_post(
+        "https://www.reddit.com/r/pics/comments/eee/", link_flair_template_id="in progress"
+    )
+    gone = make_queue_post(
+        "https://www.reddit.com/r/pics/comments/fff/", removed_by_category="moderator"
+    )
+    not_reddit = make_queue_post("https://i.imgur.com/ggg.png")
+    cfg = make_sweep_config(
+        [nsfw, removed, unknown, unchanged, claimed, gone, not_reddit],
+        [
+            make_partner_post("t3_aaa", over_18=True),
+            make_partner_post("t3_bbb", removed="moderator"),
+            make_partner_post("t3_ccc", removed="deleted"),
+            make_partner_post("t3_ddd"),
+        ],
+    )
+    blossom_ids = {nsfw.url: 1, removed.url: 2}
+
+    def get_submission(url: str) -> MagicMock:
+        if url not in blossom_ids:
+            return MagicMock(status=BlossomStatus.not_found)
+        return MagicMock(
+            status=BlossomStatus.ok, data=[{"id": blossom_ids[url], "tor_url": "tor_url"}]
+        )
+
+    cfg.blossom.get_submission.side_effect = get_submission
+
+    sweep_partner_status(cfg)
+
+    cfg.r.info.assert_called_once_with(fullnames=["t3_aaa", "t3_bbb", "t3_ccc", "t3_ddd"])
+    nsfw.mod.nsfw.assert_called_once()
+    nsfw.mod.remove.assert_not_called()
+    removed.mod.remove.assert_called_once()
+    assert [call.args[0] for call in cfg.blossom.patch.call_args_list] == [
+        "submission/1/nsfw",
+        "submission/2/remove",
+    ]
+    mock_modchat.assert_called_once()
+    # Blossom doesn't know this one, so it's left alone
+    unknown.mod.remove.assert_not_called()
+    # Only the posts that need a change are looked up in Blossom
+    assert cfg.blossom.get_submission.call_count == 3
+    unchanged.mod.nsfw.assert_not_called()
+    unchanged.mod.remove.assert_not_called()
+
+
+def test_sweep_partner_status_waits_for_its_interval() -> None:
+    cfg = make_sweep_config([], [])
+    cfg.last_status_sweep_time = datetime.now(tz=timezone.utc) - timedelta(seconds=10)
+
+    sweep_partner_status(cfg)
+
+    cfg.tor.new.assert_not_called()
+
+    cfg.last_status_sweep_time -= timedelta(seconds=SWEEP_INTERVAL)
+    sweep_partner_status(cfg)
+
+    cfg.tor.new.assert_called_once()
+    assert cfg.last_status_sweep_time > datetime.now(tz=timezone.utc) - timedelta(seconds=10)
+
+
+@patch("tor.core.helpers.send_to_modchat")
+def test_sync_partner_status_leaves_synced_posts_alone(mock_modchat: MagicMock) -> None:
+    cfg = MagicMock()
+    r_submission = make_queue_post(
+        "https://www.reddit.com/r/pics/comments/aaa/", over_18=True, removed_by_category="deleted"
+    )
+    partner = make_partner_post("t3_aaa", over_18=True, removed="moderator")
+
+    assert sync_partner_status(cfg, r_submission, partner, {"id": 1, "tor_url": ""}) is False
+
+    r_submission.mod.nsfw.assert_not_called()
+    r_submission.mod.remove.assert_not_called()
+    cfg.blossom.patch.assert_not_called()
+    mock_modchat.assert_not_called()
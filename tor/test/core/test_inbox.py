@@ -0,0 +1,239 @@
+import time
+from typing import Any, Dict, List, Optional
+from unittest.mock import MagicMock, patch
+
+import pytest
+from praw import Reddit
+from praw.models import Comment, Message
+
+from tor.core.inbox import (
+    check_inbox,
+    classify_inbox_item,
+    consume_inbox_item,
+    fetch_inbox_page,
+    parse_inbox_item,
+    process_reply,
+)
+from tor.helpers.inbox_priority import COMMAND, MOD_SUPPORT, OTHER
+from tor.helpers.inbox_stream import InboxCheckpoint
+from tor.helpers.journal import DONE, FLAIR, HANDLED, REPLY
+
+reddit = Reddit(client_id="id", client_secret="secret", user_agent="test")
+
+
+def make_cfg(steps: Dict[str, Any]) -> MagicMock:
+    cfg = MagicMock()
+    cfg.inbox_journal.steps.return_value = steps
+    cfg.read_marker.__contains__.return_value = False
+    return cfg
+
+
+def recorded_steps(cfg: MagicMock) -> list:
+    return [call.args[1] for call in cfg.inbox_journal.record.call_args_list]
+
+
+@patch("tor.core.inbox.flair_post")
+@patch("tor.core.inbox.send_reddit_reply")
+@patch("tor.core.inbox.respond_to_reply", return_value=("Thanks!", "Completed!"))
+def test_process_reply_records_every_step(
+    respond: MagicMock, send_reply: MagicMock, set_flair: MagicMock
+) -> None:
+    cfg = make_cfg({})
+    reply = MagicMock(fullname="t1_a")
+
+    process_reply(reply, cfg)
+
+    respond.assert_called_once_with(reply, cfg)
+    send_reply.assert_called_once_with(reply, "Thanks!")
+    set_flair.assert_called_once_with(reply.submission, "Completed!")
+    cfg.inbox_journal.record.assert_any_call("t1_a", HANDLED, ["Thanks!", "Completed!"])
+    assert recorded_steps(cfg) == [HANDLED, REPLY, FLAIR]
+
+
+@patch("tor.core.inbox.flair_post")
+@patch("tor.core.inbox.send_reddit_reply")
+@patch("tor.core.inbox.respond_to_reply")
+def test_process_reply_replays_a_handled_reply(
+    respond: MagicMock, send_reply: MagicMock, set_flair: MagicMock
+) -> None:
+    cfg = make_cfg({HANDLED: ["Thanks!", "Completed!"]})
+    reply = MagicMock(fullname="t1_a")
+
+    process_reply(reply, cfg)
+
+    # Blossom isn't asked again, the recorded result is used instead
+    respond.assert_not_called()
+    send_reply.assert_called_once_with(reply, "Thanks!")
+    set_flair.assert_called_once_with(reply.submission, "Completed!")
+    assert recorded_steps(cfg) == [REPLY, FLAIR]
+
+
+@patch("tor.core.inbox.flair_post")
+@patch("tor.core.inbox.send_reddit_reply")
+@patch("tor.core.inbox.respond_to_reply")
+def test_process_reply_doesnt_reply_twice(
+    respond: MagicMock, send_reply: MagicMock, set_flair: MagicMock
+) -> None:
+    cfg = make_cfg({HANDLED: ["Thanks!", "Completed!"], REPLY: True})
+    reply = MagicMock(fullname="t1_a")
+
+    process_reply(reply, cfg)
+
+    respond.assert_not_called()
+    send_reply.assert_not_called()
+    set_flair.assert_called_once_with(reply.submission, "Completed!")
+    assert recorded_steps(cfg) == [FLAIR]
+
+
+@patch("tor.core.inbox.handle_inbox_item")
+def test_consume_inbox_item_handles_new_items(handle: MagicMock) -> None:
+    cfg = make_cfg({})
+    item = MagicMock(fullname="t1_a", new=True)
+
+    assert consume_inbox_item(item, cfg) is True
+
+    handle.assert_called_once_with(item, cfg)
+    cfg.inbox_journal.record.assert_called_once_with("t1_a", DONE)
+    cfg.read_marker.add.assert_called_once_with("t1_a")
+
+
+@patch("tor.core.inbox.handle_inbox_item")
+def test_consume_inbox_item_skips_done_items(handle: MagicMock) -> None:
+    cfg = make_cfg({HANDLED: ["Thanks!", None], REPLY: True, DONE: True})
+    item = MagicMock(fullname="t1_a", new=True)
+
+    assert consume_inbox_item(item, cfg) is False
+
+    handle.assert_not_called()
+    cfg.inbox_journal.record.assert_not_called()
+    # It still has to be marked as read
+    cfg.read_marker.add.assert_called_once_with("t1_a")
+
+
+@patch("tor.core.inbox.handle_inbox_item")
+def test_consume_inbox_item_leaves_read_items_alone(handle: MagicMock) -> None:
+    cfg = make_cfg({})
+    item = MagicMock(fullname="t1_a", new=False)
+
+    assert consume_inbox_item(item, cfg) is False
+
+    handle.assert_not_called()
+    cfg.read_marker.add.assert_not_called()
+
+
+def test_parse_inbox_item_binds_the_item_to_the_given_client() -> None:
+    data: Dict[str, Any] = {
+        "kind": "t1",
+        "data": {
+            "name": "t1_a",
+            "id": "a",
+            "author": "someone",
+            "body": "done",
+            "context": "/r/TranscribersOfReddit/comments/b/title/a/?context=3",
+            "new": True,
+            "created_utc": 100.0,
+        },
+    }
+    worker = Reddit(client_id="id", client_secret="secret", user_agent="test")
+
+    item = parse_inbox_item(data, reddit)
+    copy = parse_inbox_item(data, worker)
+
+    assert isinstance(copy, Comment)
+    assert (copy.fullname, copy.new) == ("t1_a", True)
+    assert item._reddit is reddit and item.author._reddit is reddit
+    assert copy._reddit is worker and copy.author._reddit is worker
+    # The JSON is left as it was for the next client
+    assert data["data"]["author"] == "someone"
+
+
+@pytest.mark.parametrize(
+    "subject,priority_class",
+    [("!override", MOD_SUPPORT), ("!ping", MOD_SUPPORT), ("Hello", OTHER), ("help", OTHER)],
+)
+def test_classify_message(subject: str, priority_class: int) -> None:
+    message = Message(reddit, _data={"id": "a", "subject": subject, "body": "claim"})
+
+    assert classify_inbox_item(message) == priority_class
+
+
+@pytest.mark.parametrize(
+    "body,priority_class",
+    [
+        # Transcriptions are answered with a pointer to the post, whatever they say
+        ("Image Transcription: help, I'm done", OTHER),
+        # Calls for help go first, even when they are thankful or contain a command
+        ("help, I can't get this done", MOD_SUPPORT),
+        ("undo that claim please", MOD_SUPPORT),
+        ("Thanks for the help!", MOD_SUPPORT),
+        # Thanks go before commands
+        ("done, thank you", OTHER),
+        ("claim", COMMAND),
+        ("dibs", COMMAND),
+        ("unclaim", COMMAND),
+        ("done", COMMAND),
+        ("I accept", COMMAND),
+        ("!override", COMMAND),
+        ("Nice post", OTHER),
+    ],
+)
+def test_classify_reply(body: str, priority_class: int) -> None:
+    reply = Comment(reddit, _data={"id": "a", "body": body, "type": "comment_reply"})
+
+    assert classify_inbox_item(reply) == priority_class
+
+
+def test_classify_username_mention() -> None:
+    mention = Comment(reddit, _data={"id": "a", "body": "help, claim", "type": "username_mention"})
+
+    assert classify_inbox_item(mention) == OTHER
+
+
+def test_classify_unknown_item() -> None:
+    assert classify_inbox_item(MagicMock(body="claim", subject="!override")) == OTHER
+
+
+def make_listing(names: List[str], after: Optional[str]) -> Dict[str, Any]:
+    children = [{"kind": "t1", "data": {"name": name}} for name in names]
+    return {"data": {"children": children, "after": after}}
+
+
+def test_fetch_inbox_page_without_a_checkpoint_walks_all_unread_items() -> None:
+    cfg = MagicMock()
+    cfg.r.request.side_effect = [
+        make_listing(["t1_c", "t1_b"], after="t1_b"),
+        make_listing(["t1_a"], after=None),
+    ]
+
+    items = fetch_inbox_page(None, cfg)
+
+    # Down to the oldest unread item, so nothing is skipped
+    assert [item["data"]["name"] for item in items] == ["t1_c", "t1_b", "t1_a"]
+    assert cfg.r.request.call_args.kwargs["params"]["after"] == "t1_b"
+
+
+def test_fetch_inbox_page_after_the_checkpoint() -> None:
+    cfg = MagicMock()
+    cfg.r.request.return_value = make_listing(["t1_c"], after=None)
+
+    assert [item["data"]["name"] for item in fetch_inbox_page("t1_b", cfg)] == ["t1_c"]
+    assert cfg.r.request.call_args.kwargs["params"]["before"] == "t1_b"
+
+
+def check_empty_inbox(newest_unread_created: float) -> InboxCheckpoint:
+    cfg = MagicMock()
+    cfg.inbox_checkpoint = InboxCheckpoint()
+    cfg.inbox_checkpoint.advance("t1_a", 100)
+    cfg.r.request.return_value = make_listing([], after=None)
+    cfg.r.inbox.unread.return_value = [MagicMock(created_utc=newest_unread_created)]
+
+    check_inbox(cfg)
+    return cfg.inbox_checkpoint
+
+
+def test_check_inbox_resets_a_stale_checkpoint() -> None:
+    assert check_empty_inbox(newest_unread_created=200).fullname is None
+
+
+def test_check_inbox_keeps_the_checkpoint_for_items_that_came_in_during_the_loop() -> None:
+    assert check_empty_inbox(newest_unread_created=time.time() + 5).fullname == "t1_a"
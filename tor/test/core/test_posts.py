@@ -0,0 +1,65 @@
+from typing import Optional
+from unittest.mock import MagicMock
+
+from tor.core.posts import accept_post, recheck_upvote_watchlist
+from tor.helpers.intake import IntakeScheduler
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.watchlist import UpvoteWatchlist
+
+
+def make_submission(fullname: str, ups: int, removed: Optional[str] = None) -> MagicMock:
+    submission = MagicMock(fullname=fullname, ups=ups, archived=False, removed_by_category=removed)
+    submission.author.name = "someone"
+    return submission
+
+
+def test_recheck_upvote_watchlist() -> None:
+    cfg = MagicMock()
+    cfg.upvote_filter_subs = {"pics": 100}
+    cfg.upvote_watchlist = UpvoteWatchlist()
+    cfg.intake = IntakeScheduler()
+    for name in ("t3_qualified", "t3_removed", "t3_missing", "t3_below"):
+        cfg.upvote_watchlist.add(PostSummary(name, subreddit="pics", author="someone", ups=5))
+    cfg.r.info.return_value = [
+        make_submission("t3_qualified", ups=150),
+        make_submission("t3_removed", ups=500, removed="moderator"),
+        make_submission("t3_below", ups=50),
+    ]
+
+    recheck_upvote_watchlist(cfg)
+
+    cfg.r.info.assert_called_once()
+    # Only the qualified post goes on, through the intake of the next scan
+    assert list(cfg.intake.backlog) == ["t3_qualified"]
+    assert cfg.intake.backlog["t3_qualified"].ups == 150
+    # The post that is still below the threshold is watched some more
+    assert "t3_below" in cfg.upvote_watchlist
+    assert cfg.upvote_watchlist.get("t3_below").ups == 50
+    assert len(cfg.upvote_watchlist) == 1
+
+
+def test_recheck_upvote_watchlist_waits_for_its_interval() -> None:
+    cfg = MagicMock()
+    cfg.upvote_watchlist = UpvoteWatchlist(interval=600)
+    cfg.upvote_watchlist.add(PostSummary("t3_a", subreddit="pics"))
+    cfg.upvote_watchlist.start_recheck()
+
+    recheck_upvote_watchlist(cfg)
+
+    cfg.r.info.assert_not_called()
+
+
+def test_accept_post_watches_posts_that_lack_upvotes() -> None:
+    cfg = MagicMock()
+    cfg.upvote_filter_subs = {"pics": 100}
+    cfg.upvote_watchlist = UpvoteWatchlist()
+    fine = PostSummary("t3_fine", subreddit="pics", author="someone", ups=150)
+    below = PostSummary("t3_below", subreddit="pics", author="someone", ups=5)
+    archived = PostSummary("t3_archived", subreddit="pics", author="someone", ups=5, archived=True)
+    deleted = PostSummary("t3_deleted", subreddit="pics", author=None, ups=500)
+
+    assert [post.name for post in (fine, below, archived, deleted) if accept_post(post, cfg)] == [
+        "t3_fine"
+    ]
+    assert "t3_below" in cfg.upvote_watchlist
+    assert "t3_deleted" not in cfg.upvote_watchlist
@@ -0,0 +1,209 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+from tor.helpers.async_scanner import AsyncScanner
+from tor.helpers.batching import ListingPlanner
+from tor.helpers.cursors import ListingCursors
+from tor.helpers.rate_limit import CircuitBreaker, RequestBudget
+
+
+def make_post(sub: str, post_id: str, is_self: bool = False) -> Dict:
+    return {
+        "kind": "t3",
+        "data": {
+            "subreddit": sub,
+            "name": f"t3_{post_id}",
+            "title": "A title",
+            "permalink": f"/r/{sub}/comments/{post_id}/a_title/",
+            "over_18": False,
+            "domain": "i.redd.it",
+            "ups": 1,
+            "locked": False,
+            "archived": False,
+            "author": "someone",
+            "url": f"https://i.redd.it/{post_id}.png",
+            "is_self": is_self,
+            "created_utc": 1600000000,
+        },
+    }
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stragglers = 0
+
+    def do_GET(self) -> None:
+        subs = self.path.split("/")[2].split("+")
+        if "hung" in subs:
+            time.sleep(1)
+        if "straggler" in subs:
+            # Only the first request is slow
+            ListingHandler.stragglers += 1
+            if ListingHandler.stragglers == 1:
+                time.sleep(1)
+        if "ratelimited" in subs:
+            listing: Dict = {"message": "Too Many Requests", "error": 429}
+        elif "private" in subs:
+            listing = {"reason": "private", "message": "Forbidden", "error": 403}
+        else:
+            children = []
+            for sub in subs:
+                children += [make_post(sub, f"{sub}1"), make_post(sub, f"{sub}x", True)]
+            listing = {"data": {"children": children}}
+        body = json.dumps(listing).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Ratelimit-Remaining", "95")
+        self.send_header("X-Ratelimit-Reset", "300")
+        if subs == ["chunked"]:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in (body[:10], body[10:]):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def make_state() -> Any:
+    return SimpleNamespace(
+        listing_planner=ListingPlanner(),
+        listing_cursors=ListingCursors(),
+        request_budget=RequestBudget(),
+        subreddit_breaker=CircuitBreaker(),
+        scanner_token=None,
+    )
+
+
+@pytest.fixture
+def scanner(monkeypatch: pytest.MonkeyPatch) -> Iterator[AsyncScanner]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ListingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(
+        "tor.helpers.scanner.subreddit_listing_url",
+        lambda subs, before=None, **kwargs: f"{base_url}/r/{'+'.join(subs)}/new/.json",
+    )
+    scanner = AsyncScanner(concurrency=2)
+    yield scanner
+    scanner.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_scan_returns_post_summaries(scanner: AsyncScanner) -> None:
+    posts = scanner.scan([["one"], ["two"], ["three"]], make_state())
+
+    assert sorted(post.name for post in posts) == ["t3_one1", "t3_three1", "t3_two1"]
+    assert posts[0].domain == "i.redd.it"
+
+
+def test_scan_splits_combined_listings(scanner: AsyncScanner) -> None:
+    state = make_state()
+    posts = scanner.scan([["one", "two"], ["three"]], state)
+
+    assert sorted(post.name for post in posts) == ["t3_one1", "t3_three1", "t3_two1"]
+    assert scanner.connection_stats()["requests"] == 2
+    assert set(state.listing_planner.rates) == {"one", "two", "three"}
+
+
+def test_scan_reuses_connections(scanner: AsyncScanner) -> None:
+    batches = [["one"], ["two"], ["three"], ["four"]]
+    scanner.scan(batches, make_state())
+    scanner.scan(batches, make_state())
+
+    stats = scanner.connection_stats()
+    assert stats["requests"] == 8
+    assert stats["connections"] <= 2
+
+
+def test_scan_handles_chunked_responses(scanner: AsyncScanner) -> None:
+    posts = scanner.scan([["chunked"]], make_state())
+    assert [post.name for post in posts] == ["t3_chunked1"]
+
+
+def test_scan_skips_error_states(scanner: AsyncScanner) -> None:
+    posts = scanner.scan([["ratelimited"], ["one"]], make_state())
+    assert [post.name for post in posts] == ["t3_one1"]
+
+
+def test_scan_only_returns_posts_newer_than_last_scan(scanner: AsyncScanner) -> None:
+    state = make_state()
+    assert len(scanner.scan([["one"]], state)) == 1
+    assert "one" in state.listing_cursors.marks
+
+    assert scanner.scan([["one"]], state) == []
+
+
+def test_scan_reads_rate_limit_headers(scanner: AsyncScanner) -> None:
+    state = make_state()
+    scanner.scan([["one"]], state)
+
+    assert state.request_budget.remaining == 95
+    assert state.request_budget.rate == (95 - 5) / 300
+
+
+def test_failing_subreddit_is_isolated_from_its_batch(scanner: AsyncScanner) -> None:
+    state = make_state()
+    posts = scanner.scan([["one", "private"]], state)
+
+    assert [post.name for post in posts] == ["t3_one1"]
+    assert state.subreddit_breaker.failures == {"private": 1}
+
+
+def test_scan_hands_over_every_batch_as_it_is_done(scanner: AsyncScanner) -> None:
+    handed_over: List[List[str]] = []
+    posts = scanner.scan(
+        [["one", "two"], ["three"]],
+        make_state(),
+        on_posts=lambda batch: handed_over.append(sorted(post.name for post in batch)),
+    )
+
+    assert sorted(handed_over) == [["t3_one1", "t3_two1"], ["t3_three1"]]
+    assert len(posts) == 3
+
+
+def test_scan_gives_up_on_subreddits_past_the_deadline(scanner: AsyncScanner) -> None:
+    state = make_state()
+    posts = scanner.scan([["one"], ["hung"]], state, deadline=0.3)
+
+    assert [post.name for post in posts] == ["t3_one1"]
+    assert scanner.missed_subreddits == ["hung"]
+    # Nothing was recorded, so it's fetched again during the next scan
+    assert "hung" not in state.listing_planner.last_fetched
+
+
+def test_requests_have_a_read_deadline(scanner: AsyncScanner) -> None:
+    scanner.read_timeout = 0.1
+    state = make_state()
+
+    assert scanner.scan([["hung"]], state) == []
+    assert state.subreddit_breaker.failures == {"hung": 1}
+
+
+def test_stragglers_are_hedged(scanner: AsyncScanner) -> None:
+    for _ in range(20):
+        scanner.latency.add(0.01)
+
+    started = time.monotonic()
+    posts = scanner.scan([["straggler"]], make_state())
+
+    assert [post.name for post in posts] == ["t3_straggler1"]
+    assert time.monotonic() - started < 0.9
+    assert scanner.hedged == 1
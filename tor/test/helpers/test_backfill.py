@@ -0,0 +1,47 @@
+import os
+from typing import List
+
+from tor.helpers.backfill import BackfillCheckpoint
+from tor.helpers.post_summary import PostSummary
+
+
+def make_page(newest: int, count: int) -> List[PostSummary]:
+    return [
+        PostSummary(f"t3_{age}", created_utc=1000 - age) for age in range(newest, newest + count)
+    ]
+
+
+def test_pages_are_read_until_the_start_of_the_window() -> None:
+    checkpoint = BackfillCheckpoint(None, "pics", since=850)
+
+    posts, after, last = checkpoint.read_page(make_page(0, 100))
+    assert len(posts) == 100
+    assert (after, last) == ("t3_99", False)
+
+    posts, after, last = checkpoint.read_page(make_page(100, 100))
+    assert [post.name for post in posts] == [f"t3_{age}" for age in range(100, 151)]
+    assert (after, last) == (None, True)
+
+
+def test_a_short_page_is_the_end_of_the_listing() -> None:
+    checkpoint = BackfillCheckpoint(None, "pics", since=0)
+
+    posts, after, last = checkpoint.read_page(make_page(0, 30))
+    assert len(posts) == 30
+    assert (after, last) == (None, True)
+
+
+def test_an_interrupted_backfill_resumes_from_its_checkpoint(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "backfill", "pics.json")
+    checkpoint = BackfillCheckpoint(path, "pics", since=850)
+    assert not checkpoint.resumed
+    checkpoint.advance("t3_99", done=False, published=7)
+
+    resumed = BackfillCheckpoint(path, "pics", since=850)
+    assert resumed.resumed
+    assert (resumed.after, resumed.done, resumed.published) == ("t3_99", False, 7)
+
+    # A different window is a new backfill
+    other = BackfillCheckpoint(path, "pics", since=500)
+    assert not other.resumed
+    assert other.after is None
@@ -0,0 +1,81 @@
+from typing import List
+
+from tor.helpers.batching import BATCH_LIMIT, MAX_SUBREDDITS_PER_BATCH, ListingPlanner, demultiplex
+from tor.helpers.post_summary import PostSummary
+
+
+def make_listing(posts: List[tuple]) -> List[PostSummary]:
+    return [
+        PostSummary(f"t3_{i}", subreddit=sub, created_utc=created)
+        for i, (sub, created) in enumerate(posts)
+    ]
+
+
+def test_demultiplex() -> None:
+    listing = make_listing(
+        [
+            ("Pics", 3),
+            ("funny", 2),
+            ("pics", 1),
+            ("unrelated", 0),
+        ]
+    )
+    split = demultiplex(listing, ["pics", "funny", "quiet"])
+
+    assert [len(split[sub]) for sub in ["pics", "funny", "quiet"]] == [2, 1, 0]
+
+
+def test_unknown_subreddits_are_fetched_alone() -> None:
+    assert ListingPlanner().plan(["a", "b"]) == [["a"], ["b"]]
+
+
+def test_quiet_subreddits_share_a_batch() -> None:
+    planner = ListingPlanner(interval=45)
+    planner.rates = {"quiet": 0.001, "calm": 0.002, "busy": 2}
+
+    assert planner.plan(["busy", "quiet", "calm"]) == [["busy"], ["quiet", "calm"]]
+
+
+def test_batches_are_sized_by_post_rate() -> None:
+    planner = ListingPlanner(interval=45)
+    # Every subreddit is expected to get 20 posts per scan, so only two fit
+    planner.rates = {sub: 20 / 45 for sub in "abcde"}
+
+    assert planner.plan(list("abcde")) == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_batches_are_capped_in_size() -> None:
+    planner = ListingPlanner()
+    subs = [f"sub{i}" for i in range(MAX_SUBREDDITS_PER_BATCH + 1)]
+    planner.rates = {sub: 0 for sub in subs}
+
+    assert [len(batch) for batch in planner.plan(subs)] == [MAX_SUBREDDITS_PER_BATCH, 1]
+
+
+def test_full_listing_is_saturated_if_it_does_not_reach_back() -> None:
+    planner = ListingPlanner()
+    planner.last_fetched = {"a": 1000, "b": 1000}
+    listing = make_listing([("a", 1010)] * BATCH_LIMIT)
+
+    assert planner.is_saturated(listing, ["a", "b"])
+
+
+def test_full_listing_reaching_back_is_not_saturated() -> None:
+    planner = ListingPlanner()
+    planner.last_fetched = {"a": 1000, "b": 1000}
+    listing = make_listing([("a", 900)] * BATCH_LIMIT)
+
+    assert not planner.is_saturated(listing, ["a", "b"])
+    assert not planner.is_saturated(make_listing([]), ["a", "new"])
+
+
+def test_record_learns_rates() -> None:
+    planner = ListingPlanner(interval=45, smoothing=0.5)
+    listing = make_listing([("a", 900)] * 10)
+
+    planner.record(listing, ["a", "b"], now=1000)
+    assert planner.rates == {"a": 0.1, "b": 0}
+    assert planner.last_fetched == {"a": 1000, "b": 1000}
+
+    planner.record(make_listing([]), ["a"], now=1100)
+    assert planner.rates["a"] == 0.05
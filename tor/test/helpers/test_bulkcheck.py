@@ -0,0 +1,83 @@
+from typing import Optional
+
+from tor.helpers.bulkcheck import (
+    DuplicateFilter,
+    content_key,
+    post_url,
+    posts_by_url,
+    unseen_posts,
+)
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.seen_index import SeenPostIndex
+
+
+def make_post(
+    name: str, url: str, created_utc: float, crosspost_parent: Optional[str] = None
+) -> PostSummary:
+    return PostSummary(
+        name,
+        permalink=f"/r/sub/comments/{name[3:]}/title/",
+        url=url,
+        created_utc=created_utc,
+        crosspost_parent=crosspost_parent,
+    )
+
+
+def test_content_key() -> None:
+    assert content_key("https://i.imgur.com/abc.png") == "i.imgur.com/abc.png"
+    assert content_key("http://www.YouTube.com/watch?v=abc") == "youtube.com/watch?v=abc"
+    assert content_key("https://v.redd.it/abc/") == "v.redd.it/abc"
+
+
+def test_duplicate_filter_keeps_the_oldest_post_per_media() -> None:
+    first = make_post("t3_a", "https://i.redd.it/cat.png", 10)
+    repost = make_post("t3_b", "http://i.redd.it/cat.png/", 20)
+    other = make_post("t3_c", "https://i.redd.it/dog.png", 15)
+
+    unique, duplicates = DuplicateFilter(seen_posts=SeenPostIndex()).split([repost, other, first])
+
+    assert unique == [first, other]
+    assert duplicates == [repost]
+
+
+def test_duplicate_filter_drops_crossposts() -> None:
+    original = make_post("t3_a", "https://i.redd.it/cat.png", 10)
+    crosspost = make_post("t3_b", "", 20, crosspost_parent="t3_a")
+    earlier_crosspost = make_post("t3_c", "", 30, crosspost_parent="t3_old")
+    unrelated = make_post("t3_d", "", 40, crosspost_parent="t3_unknown")
+
+    seen_posts = SeenPostIndex()
+    seen_posts.add(["t3_old"])
+
+    unique, duplicates = DuplicateFilter(seen_posts).split(
+        [original, crosspost, earlier_crosspost, unrelated]
+    )
+
+    assert unique == [original, unrelated]
+    assert duplicates == [crosspost, earlier_crosspost]
+
+
+def test_duplicates_are_held_until_their_post_is_taken_care_of() -> None:
+    first = make_post("t3_a", "https://i.redd.it/cat.png", 10)
+    repost = make_post("t3_b", "https://i.redd.it/cat.png", 20)
+    crosspost = make_post("t3_c", "", 30, crosspost_parent="t3_b")
+    duplicate_filter = DuplicateFilter(seen_posts=SeenPostIndex())
+
+    duplicate_filter.split([first, repost])
+    duplicate_filter.split([crosspost])
+
+    assert duplicate_filter.held == {"t3_a": ["t3_b", "t3_c"]}
+    assert duplicate_filter.release(["t3_a", "t3_x"]) == ["t3_a", "t3_b", "t3_c", "t3_x"]
+    assert duplicate_filter.release(["t3_a"]) == ["t3_a"]
+
+
+def test_unseen_posts() -> None:
+    posts = [make_post(f"t3_{i}", f"https://i.redd.it/{i}.png", i) for i in range(5)]
+    by_url = posts_by_url(posts)
+
+    assert list(by_url) == [post_url(post) for post in posts]
+    assert unseen_posts(by_url, [post_url(posts[3]), post_url(posts[1]), "https://x"]) == [
+        posts[1],
+        posts[3],
+    ]
+    assert unseen_posts(by_url, []) == []
@@ -0,0 +1,72 @@
+from typing import List
+
+from tor.helpers.cursors import REFRESH_OVERLAP, HighWaterMark, ListingCursors
+from tor.helpers.post_summary import PostSummary
+
+
+def make_posts(*posts: tuple) -> List[PostSummary]:
+    return [PostSummary(name, created_utc=created) for name, created in posts]
+
+
+def test_no_cursor_for_unknown_subreddits() -> None:
+    cursors = ListingCursors()
+    cursors.marks = {"a": HighWaterMark("t3_a", 100)}
+    cursors.verified = {"a": 100}
+
+    assert cursors.cursor(["a", "b"], now=110) is None
+    assert cursors.cursor([], now=110) is None
+
+
+def test_cursor_is_oldest_mark_of_batch() -> None:
+    cursors = ListingCursors()
+    cursors.marks = {"a": HighWaterMark("t3_a", 100), "b": HighWaterMark("t3_b", 50)}
+    cursors.verified = {"a": 100, "b": 100}
+
+    assert cursors.cursor(["a", "b"], now=110) == "t3_b"
+
+
+def test_cursor_is_refreshed_with_full_listing() -> None:
+    cursors = ListingCursors(refresh_after=60)
+    cursors.marks = {"a": HighWaterMark("t3_a", 100)}
+    cursors.verified = {"a": 100}
+
+    assert cursors.cursor(["a"], now=200) is None
+
+
+def test_new_posts_and_advance() -> None:
+    cursors = ListingCursors()
+    posts = make_posts(("t3_c", 30), ("t3_b", 20), ("t3_a", 10))
+
+    assert cursors.new_posts("sub", posts) == posts
+    cursors.advance("sub", posts, full_listing=True, now=40)
+    assert cursors.marks["sub"] == HighWaterMark("t3_c", 30)
+    assert cursors.verified["sub"] == 40
+
+    newer = make_posts(("t3_d", 40), ("t3_c", 30))
+    assert cursors.new_posts("sub", newer) == newer[:1]
+
+    cursors.advance("sub", [], full_listing=False, now=50)
+    assert cursors.marks["sub"] == HighWaterMark("t3_c", 30)
+    assert cursors.verified["sub"] == 40
+
+
+def test_refresh_floor_is_the_oldest_unseen_point_of_the_batch() -> None:
+    cursors = ListingCursors()
+    cursors.marks = {"a": HighWaterMark("t3_a", 100), "b": HighWaterMark("t3_b", 50)}
+    cursors.verified = {"a": 1000, "b": 500}
+
+    assert cursors.refresh_floor(["a", "b"]) == 500 - REFRESH_OVERLAP
+    cursors.verified = {}
+    assert cursors.refresh_floor(["a", "b"]) == 50
+    assert cursors.refresh_floor(["a", "c"]) is None
+
+
+def test_empty_page_is_suspect_for_old_cursor() -> None:
+    cursors = ListingCursors(recheck_after=60)
+    cursors.marks = {"a": HighWaterMark("t3_a", 100)}
+    cursors.verified = {"a": 100}
+
+    assert not cursors.suspect_empty(["a"], now=150)
+    assert cursors.suspect_empty(["a"], now=200)
+    cursors.verified = {"a": 190}
+    assert not cursors.suspect_empty(["a"], now=200)
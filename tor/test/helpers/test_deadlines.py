@@ -0,0 +1,27 @@
+from tor.helpers.deadlines import LatencyTracker
+
+
+def test_no_hedging_without_enough_samples() -> None:
+    tracker = LatencyTracker(min_samples=5)
+    for _ in range(4):
+        tracker.add(1)
+    assert tracker.hedge_after() is None
+
+    tracker.add(1)
+    assert tracker.hedge_after() == 1
+
+
+def test_hedge_after_the_95th_percentile() -> None:
+    tracker = LatencyTracker(window=100, min_samples=1)
+    for sample in range(100):
+        tracker.add(sample / 100)
+    assert tracker.hedge_after() == 0.95
+
+
+def test_only_recent_samples_count() -> None:
+    tracker = LatencyTracker(window=10, min_samples=1)
+    for _ in range(10):
+        tracker.add(5)
+    for _ in range(10):
+        tracker.add(0.1)
+    assert tracker.hedge_after() == 0.1
@@ -0,0 +1,52 @@
+from typing import Optional
+
+import pytest
+
+from tor.helpers.domains import DomainIndex
+
+INDEX = DomainIndex(
+    {
+        "image": ["i.redd.it", "imgur.com", "*.imgur.com", "*.staticflickr.com"],
+        "audio": ["soundcloud.com", "imgur.com"],
+        "video": ["v.redd.it", "youtube.com", "*.youtube.com", "youtu.be"],
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "domain,content_type",
+    [
+        ("i.redd.it", "image"),
+        ("I.Redd.It", "image"),
+        ("imgur.com", "image"),
+        ("i.imgur.com", "image"),
+        ("live.staticflickr.com", "image"),
+        ("farm1.static.staticflickr.com", "image"),
+        ("soundcloud.com", "audio"),
+        ("m.youtube.com", "video"),
+        ("youtu.be", "video"),
+        ("staticflickr.com", None),
+        ("redd.it", None),
+        ("notimgur.com", None),
+        ("imgur.com.evil.example", None),
+        ("self.pics", None),
+        ("", None),
+    ],
+)
+def test_content_type(domain: str, content_type: Optional[str]) -> None:
+    assert INDEX.content_type(domain) == content_type
+    assert (domain in INDEX) == (content_type is not None)
+
+
+def test_most_specific_wildcard_wins() -> None:
+    index = DomainIndex({"image": ["*.example.com"], "video": ["*.video.example.com"]})
+
+    assert index.content_type("img.example.com") == "image"
+    assert index.content_type("cdn.video.example.com") == "video"
+
+
+def test_empty_index() -> None:
+    index = DomainIndex()
+
+    assert len(index) == 0
+    assert index.content_type("i.redd.it") is None
@@ -0,0 +1,21 @@
+import os
+
+from tor.helpers.files import atomic_write
+
+
+def test_atomic_write_replaces_the_file(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "state", "file.json")
+    atomic_write(path, "old")
+    atomic_write(path, "new")
+
+    with open(path) as written:
+        assert written.read() == "new"
+    assert os.listdir(os.path.dirname(path)) == ["file.json"]
+
+
+def test_atomic_write_writes_bytes(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "file.idx")
+    atomic_write(path, b"\x00\x01")
+
+    with open(path, "rb") as written:
+        assert written.read() == b"\x00\x01"
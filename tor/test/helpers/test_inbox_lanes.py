@@ -0,0 +1,62 @@
+import threading
+import time
+from typing import List
+
+import pytest
+
+from tor.helpers.inbox_lanes import LaneExecutor
+
+
+def test_tasks_of_a_lane_run_in_order() -> None:
+    lanes = LaneExecutor(max_workers=4)
+    handled: List[int] = []
+
+    def handle(number: int) -> int:
+        # The earlier tasks take longer, so they'd finish last if they ran in parallel
+        time.sleep((10 - number) / 1000)
+        handled.append(number)
+        return number
+
+    futures = [lanes.submit("t3_post", handle, number) for number in range(10)]
+
+    assert [future.result(timeout=5) for future in futures] == list(range(10))
+    assert handled == list(range(10))
+    lanes.shutdown()
+
+
+def test_a_slow_lane_does_not_hold_up_the_others() -> None:
+    lanes = LaneExecutor(max_workers=2)
+    slow_started = threading.Event()
+    release = threading.Event()
+
+    def slow() -> None:
+        slow_started.set()
+        release.wait(timeout=5)
+
+    slow_task = lanes.submit("t3_slow", slow)
+    assert slow_started.wait(timeout=5)
+    queued_behind_slow = lanes.submit("t3_slow", lambda: "after")
+
+    # Another post is handled while the slow one is still busy
+    assert lanes.submit("t3_fast", lambda: "fast").result(timeout=5) == "fast"
+    assert not queued_behind_slow.done()
+
+    release.set()
+    slow_task.result(timeout=5)
+    assert queued_behind_slow.result(timeout=5) == "after"
+    lanes.shutdown()
+
+
+def test_an_error_does_not_stop_the_lane() -> None:
+    lanes = LaneExecutor(max_workers=1)
+
+    def fail() -> None:
+        raise ValueError("Blossom is down")
+
+    failed = lanes.submit("messages", fail)
+    after = lanes.submit("messages", lambda: "still handled")
+
+    with pytest.raises(ValueError):
+        failed.result(timeout=5)
+    assert after.result(timeout=5) == "still handled"
+    lanes.shutdown()
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+from typing import Any, List
+
+from tor.helpers.inbox_priority import (
+    COMMAND,
+    MOD_SUPPORT,
+    OTHER,
+    InboxLatency,
+    effective_class,
+    prioritize,
+)
+
+
+def make_items(*specs: str) -> List[Any]:
+    """Create inbox items from "<name>:<class>:<lane>" specs, oldest first."""
+    items = []
+    for spec in specs:
+        name, priority_class, lane = spec.split(":")
+        items.append(SimpleNamespace(name=name, priority_class=int(priority_class), lane=lane))
+    return items
+
+
+def order(items: List[Any], waiting: float = 0) -> List[str]:
+    ordered = prioritize(
+        items,
+        classify=lambda item: item.priority_class,
+        lane=lambda item: item.lane,
+        waiting=lambda item: waiting,
+    )
+    return [item.name for item in ordered]
+
+
+def test_claims_and_dones_go_before_thanks_and_messages() -> None:
+    items = make_items("thanks:2:a", "dm:2:messages", "help:1:b", "claim:0:c", "done:0:d")
+
+    assert order(items) == ["claim", "done", "help", "thanks", "dm"]
+
+
+def test_the_order_within_a_lane_is_kept() -> None:
+    # The "thanks" on post a came in before the "done" on the same post
+    items = make_items("thanks:2:a", "mention:2:messages", "claim:0:b", "done:0:a")
+
+    assert order(items) == ["thanks", "claim", "done", "mention"]
+
+
+def test_waiting_items_are_promoted() -> None:
+    assert effective_class(OTHER, waiting=0) == OTHER
+    assert effective_class(OTHER, waiting=120) == MOD_SUPPORT
+    assert effective_class(OTHER, waiting=600) == COMMAND
+    assert effective_class(COMMAND, waiting=600) == COMMAND
+
+    items = make_items("thanks:2:a", "claim:0:b")
+    assert order(items, waiting=240) == ["thanks", "claim"]
+
+
+def test_latency_is_reported_per_class() -> None:
+    latency = InboxLatency()
+    for seconds in range(1, 101):
+        latency.add(COMMAND, seconds)
+    latency.add(OTHER, 30)
+
+    assert latency.report() == {
+        "command_p50": 51,
+        "command_p95": 96,
+        "other_p50": 30,
+        "other_p95": 30,
+    }
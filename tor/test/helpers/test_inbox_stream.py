@@ -0,0 +1,98 @@
+import os
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+from tor.helpers.inbox_stream import InboxCheckpoint, InboxStream
+
+
+def make_inbox(count: int) -> List[Any]:
+    """Create an inbox of the given size, newest first like Reddit lists it."""
+    return [SimpleNamespace(fullname=f"t1_{i}", created_utc=float(i)) for i in range(count, 0, -1)]
+
+
+class FakeInbox(object):
+    def __init__(self, count: int, page_size: int = 3) -> None:
+        self.items = make_inbox(count)
+        self.page_size = page_size
+        self.requests: List[Optional[str]] = []
+
+    def fetch_page(self, before: Optional[str]) -> List[Any]:
+        self.requests.append(before)
+        if before is None:
+            return self.items[-self.page_size :]
+        position = [item.fullname for item in self.items].index(before)
+        return self.items[max(position - self.page_size, 0) : position]
+
+
+def consume(stream: InboxStream) -> List[str]:
+    handled = []
+    for item in stream:
+        handled.append(item.fullname)
+        stream.checkpoint.advance(item.fullname, item.created_utc)
+    return handled
+
+
+def test_items_are_streamed_oldest_first_page_by_page() -> None:
+    inbox = FakeInbox(7)
+    stream = InboxStream(inbox.fetch_page, InboxCheckpoint())
+
+    assert consume(stream) == [f"t1_{i}" for i in range(1, 8)]
+    assert inbox.requests == [None, "t1_3", "t1_6", "t1_7"]
+    assert stream.page_backlog == 0
+    assert stream.oldest_pending_age() == 0
+
+
+def test_the_items_per_loop_are_capped() -> None:
+    inbox = FakeInbox(7)
+    checkpoint = InboxCheckpoint()
+    stream = InboxStream(inbox.fetch_page, checkpoint, max_items=4)
+
+    assert consume(stream) == ["t1_1", "t1_2", "t1_3", "t1_4"]
+    assert stream.page_backlog == 2
+    assert stream.oldest_pending == 5
+    assert stream.oldest_pending_age(now=65) == 60
+
+    # The next loop continues after the checkpoint
+    assert consume(InboxStream(inbox.fetch_page, checkpoint, max_items=4)) == [
+        "t1_5",
+        "t1_6",
+        "t1_7",
+    ]
+
+
+def test_a_page_is_not_fetched_again_when_the_checkpoint_did_not_move() -> None:
+    inbox = FakeInbox(7)
+    stream = InboxStream(inbox.fetch_page, InboxCheckpoint())
+
+    assert [item.fullname for item in stream] == ["t1_1", "t1_2", "t1_3"]
+    assert inbox.requests == [None]
+
+
+def test_the_consumer_can_catch_up_at_the_end_of_every_page() -> None:
+    inbox = FakeInbox(7)
+    checkpoint = InboxCheckpoint()
+    in_flight: List[Any] = []
+
+    def on_page_end() -> None:
+        # Everything handed out so far is done now
+        for item in in_flight:
+            checkpoint.advance(item.fullname, item.created_utc)
+        in_flight.clear()
+
+    stream = InboxStream(inbox.fetch_page, checkpoint, on_page_end=on_page_end)
+    for item in stream:
+        in_flight.append(item)
+
+    assert stream.handed_out == 7
+    assert inbox.requests == [None, "t1_3", "t1_6", "t1_7"]
+
+
+def test_the_checkpoint_survives_a_restart(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "inbox_checkpoint.json")
+    InboxCheckpoint(path).advance("t1_5", 5.0)
+
+    checkpoint = InboxCheckpoint(path)
+    assert (checkpoint.fullname, checkpoint.created_utc) == ("t1_5", 5.0)
+
+    checkpoint.reset()
+    assert InboxCheckpoint(path).fullname is None
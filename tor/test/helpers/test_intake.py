@@ -0,0 +1,105 @@
+from typing import List
+
+from tor.helpers.intake import IntakeController, IntakeScheduler, intake_priority
+from tor.helpers.post_summary import PostSummary
+
+
+def make_posts(sub: str, count: int, created_utc: float = 0, ups: int = 0) -> List[PostSummary]:
+    return [
+        PostSummary(f"t3_{sub}{i}", subreddit=sub, created_utc=created_utc, ups=ups)
+        for i in range(count)
+    ]
+
+
+def names(posts: List[PostSummary]) -> List[str]:
+    return [post.name for post in posts]
+
+
+def test_older_and_more_upvoted_posts_go_first() -> None:
+    now = 10_000.0
+    fresh = PostSummary("t3_fresh", created_utc=now)
+    old = PostSummary("t3_old", created_utc=now - 60 * 60)
+    popular = PostSummary("t3_popular", created_utc=now, ups=999)
+
+    assert intake_priority(old, now) > intake_priority(popular, now) > intake_priority(fresh, now)
+
+
+def test_a_flooding_subreddit_does_not_push_out_small_ones() -> None:
+    scheduler = IntakeScheduler(quota=3, window=600)
+
+    admitted = scheduler.schedule(make_posts("big", 20, created_utc=0) + make_posts("small", 2, 50))
+
+    assert sorted(names(admitted)) == ["t3_big0", "t3_big1", "t3_big2", "t3_small0", "t3_small1"]
+    assert len(scheduler) == 17
+
+
+def test_leftovers_are_carried_over_until_the_window_has_room() -> None:
+    scheduler = IntakeScheduler(quota=2, window=600)
+    scheduler.schedule(make_posts("big", 5), now=1000)
+
+    # Still the same window: nothing new from r/big, not even when asked again
+    assert scheduler.schedule([], now=1300) == []
+    later = [PostSummary("t3_later", subreddit="big", created_utc=1300)]
+    assert scheduler.schedule(later, now=1300) == []
+    assert len(scheduler) == 4
+
+    assert len(scheduler.schedule([], now=1600)) == 2
+    assert names(scheduler.schedule([], now=2200)) == ["t3_big4", "t3_later"]
+    assert len(scheduler) == 0
+
+
+def test_the_backlog_drops_the_least_urgent_posts_when_full() -> None:
+    scheduler = IntakeScheduler(quota=1, window=600, max_backlog=2)
+    posts = [
+        PostSummary(f"t3_{age}", subreddit="big", created_utc=1000 - age * 60)
+        for age in (1, 5, 3, 9)
+    ]
+
+    assert names(scheduler.schedule(posts, now=1000)) == ["t3_9"]
+    assert sorted(scheduler.backlog) == ["t3_3", "t3_5"]
+    assert scheduler.report()["dropped"] == 1
+
+
+def test_the_scan_limit_caps_the_intake_over_all_subreddits() -> None:
+    scheduler = IntakeScheduler(quota=10)
+    scheduler.start_cycle(3)
+
+    assert len(scheduler.schedule(make_posts("a", 2) + make_posts("b", 2))) == 3
+    assert scheduler.schedule(make_posts("c", 2)) == []
+    assert len(scheduler) == 3
+
+    scheduler.start_cycle(None)
+    assert len(scheduler.schedule([])) == 3
+
+
+def test_the_intake_shrinks_when_the_queue_fills_up_and_grows_when_it_empties() -> None:
+    controller = IntakeController(target=100, min_limit=1, max_limit=30, gain=0.5)
+    assert controller.admit == 16
+
+    assert controller.update(400, now=0) == 8
+    assert controller.update(2000, now=300) == 2
+    assert controller.update(5000, now=600) == 1
+    # Right on target, the intake stays where it is
+    assert controller.update(100, now=900) == 1
+    assert controller.update(25, now=1200) == 2
+    assert controller.update(0, now=1500) == 20
+    assert controller.update(0, now=1800) == 30
+    assert controller.report() == {"backlog": 0, "target": 100, "admit": 30}
+
+
+def test_the_backlog_is_sampled_once_per_interval() -> None:
+    controller = IntakeController(interval=300)
+
+    assert controller.due(now=0)
+    controller.update(100, now=0)
+    assert not controller.due(now=299)
+    assert controller.due(now=300)
+
+
+def test_deferred_posts_wait_for_the_next_scan() -> None:
+    scheduler = IntakeScheduler(quota=1, window=100)
+    scheduler.defer(make_posts("pics", 2))
+    assert len(scheduler) == 2
+
+    assert names(scheduler.schedule([], now=10)) == ["t3_pics0"]
+    assert len(scheduler) == 1
@@ -0,0 +1,71 @@
+import os
+
+from tor.helpers.journal import DONE, FLAIR, HANDLED, REPLY, InboxJournal
+
+
+def test_a_replay_knows_which_steps_are_done(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "inbox_journal.log")
+    journal = InboxJournal(path)
+    journal.record("t1_a", HANDLED, ["Claimed!", "in-progress"])
+    journal.record("t1_a", REPLY)
+    journal.record("t1_b", HANDLED, [None, None])
+    journal.record("t1_b", DONE)
+
+    replayed = InboxJournal(path)
+    assert replayed.steps("t1_a") == {HANDLED: ["Claimed!", "in-progress"], REPLY: True}
+    assert FLAIR not in replayed.steps("t1_a")
+    assert DONE in replayed.steps("t1_b")
+    assert replayed.steps("t1_c") == {}
+
+
+def test_a_cut_off_record_is_skipped(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "inbox_journal.log")
+    InboxJournal(path).record("t1_a", HANDLED, ["Done!", None])
+    with open(path, "a") as journal_file:
+        journal_file.write('{"item": "t1_a", "st')
+
+    assert InboxJournal(path).steps("t1_a") == {HANDLED: ["Done!", None]}
+
+
+def test_items_that_are_marked_as_read_are_forgotten(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "inbox_journal.log")
+    journal = InboxJournal(path)
+    journal.record("t1_a", DONE)
+    journal.record("t1_b", DONE)
+
+    journal.forget(["t1_a", "t1_unknown"])
+
+    assert "t1_a" not in journal
+    assert "t1_a" not in InboxJournal(path)
+    assert "t1_b" in InboxJournal(path)
+
+
+def test_compaction_keeps_only_what_is_still_needed(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "inbox_journal.log")
+    journal = InboxJournal(path, max_age=100)
+    for i in range(10):
+        journal.record(f"t1_{i}", HANDLED, [None, None], now=1000)
+        journal.record(f"t1_{i}", DONE, now=1000)
+    journal.forget(f"t1_{i}" for i in range(8))
+    journal.record("t1_new", HANDLED, [None, None], now=1090)
+
+    journal.compact(now=1100)
+
+    with open(path) as journal_file:
+        assert len(journal_file.readlines()) == 1
+    assert list(InboxJournal(path).entries) == ["t1_new"]
+
+
+def test_compaction_runs_in_the_background(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "inbox_journal.log")
+    journal = InboxJournal(path, compact_after=5)
+    for i in range(3):
+        journal.record(f"t1_{i}", DONE)
+
+    journal.forget(["t1_0", "t1_1", "t1_2"])
+    if compaction := journal.compaction:
+        compaction.join(timeout=5)
+
+    assert journal.compaction is None
+    with open(path) as journal_file:
+        assert journal_file.read() == ""
@@ -0,0 +1,179 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List
+from urllib.parse import parse_qs
+
+import pytest
+
+from tor.helpers.async_scanner import AsyncScanner
+from tor.helpers.batching import ListingPlanner
+from tor.helpers.cursors import ListingCursors
+from tor.helpers.oauth import USER_AGENT, AppOnlyToken, TokenError
+from tor.helpers.rate_limit import CircuitBreaker, RequestBudget
+from tor.helpers.scanner import (
+    ListingError,
+    ListingRequest,
+    ScannerEngine,
+    handle_listing_error,
+    listing_access,
+    read_listing,
+)
+
+
+class RedditStandIn(BaseHTTPRequestHandler):
+    """Just enough of Reddit's token endpoint and OAuth API for the scanner."""
+
+    protocol_version = "HTTP/1.1"
+    minted: List[Dict] = []
+    user_agents: List[str] = []
+    valid_tokens = {"token-1", "token-2"}
+
+    def do_POST(self) -> None:
+        length = int(self.headers["Content-Length"])
+        form = parse_qs(self.rfile.read(length).decode())
+        credentials = base64.b64decode(self.headers["Authorization"].split()[1]).decode()
+        if credentials != "client:secret":
+            self.respond(401, {"message": "Unauthorized", "error": 401})
+            return
+        RedditStandIn.minted.append(form)
+        RedditStandIn.user_agents.append(self.headers["User-Agent"])
+        self.respond(
+            200,
+            {
+                "access_token": f"token-{len(RedditStandIn.minted)}",
+                "token_type": "bearer",
+                "expires_in": 3600,
+            },
+        )
+
+    def do_GET(self) -> None:
+        token = self.headers.get("Authorization", "").replace("bearer ", "")
+        if token not in self.valid_tokens:
+            self.respond(401, {"message": "Unauthorized", "error": 401})
+            return
+        sub = self.path.split("/")[2]
+        post = {
+            "subreddit": sub,
+            "name": f"t3_{sub}1",
+            "title": "A title",
+            "permalink": f"/r/{sub}/comments/{sub}1/a_title/",
+            "over_18": False,
+            "domain": "i.redd.it",
+            "ups": 1,
+            "locked": False,
+            "archived": False,
+            "author": "someone",
+            "url": f"https://i.redd.it/{sub}1.png",
+            "is_self": False,
+            "created_utc": 1600000000,
+        }
+        self.respond(200, {"data": {"children": [{"kind": "t3", "data": post}]}})
+
+    def respond(self, status: int, data: Dict) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+    RedditStandIn.minted = []
+    RedditStandIn.user_agents = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RedditStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def make_token(server_url: str, secret: str = "secret") -> AppOnlyToken:
+    return AppOnlyToken(
+        "client", secret, token_url=f"{server_url}/api/v1/access_token", api_url=server_url
+    )
+
+
+def test_token_is_minted_once_and_refreshed_before_expiry(server_url: str) -> None:
+    token = make_token(server_url)
+
+    assert token.authorization(now=0) == "bearer token-1"
+    assert token.authorization(now=3000) == "bearer token-1"
+    assert RedditStandIn.minted == [{"grant_type": ["client_credentials"]}]
+    assert RedditStandIn.user_agents == [USER_AGENT]
+    # Less than five minutes left
+    assert token.authorization(now=3400) == "bearer token-2"
+    assert token.minted == 2
+
+
+def test_invalidated_token_is_replaced(server_url: str) -> None:
+    token = make_token(server_url)
+    token.authorization(now=0)
+    token.invalidate()
+
+    assert token.authorization(now=1) == "bearer token-2"
+
+
+def test_refused_credentials(server_url: str) -> None:
+    with pytest.raises(TokenError):
+        make_token(server_url, secret="wrong").authorization()
+
+
+def test_threaded_scanner_uses_the_oauth_api(server_url: str) -> None:
+    engine = ScannerEngine(max_workers=1)
+    token = make_token(server_url)
+    access = listing_access(token, engine.session)
+    assert access.base_url == server_url
+
+    request = ListingRequest(["pics"], ListingCursors(), base_url=access.base_url)
+    url = request.next_url()
+    assert url is not None and url.startswith(f"{server_url}/r/pics/new/.json")
+    response = engine.get(url, headers=access.headers)
+    assert [post.name for post in read_listing(response.status_code, response.content)] == [
+        "t3_pics1"
+    ]
+    engine.close()
+
+
+def test_refused_token_is_not_blamed_on_the_subreddit(server_url: str) -> None:
+    engine = ScannerEngine(max_workers=1)
+    token = make_token(server_url)
+    token.authorization()
+    token.access_token = "expired"
+    breaker = CircuitBreaker(threshold=1)
+
+    response = engine.get(f"{server_url}/r/pics/new/.json", headers=listing_access(token).headers)
+    with pytest.raises(ListingError) as exc_info:
+        read_listing(response.status_code, response.content)
+    retry = handle_listing_error(exc_info.value, ["a", "b"], RequestBudget(), breaker, token)
+
+    assert not retry
+    assert breaker.failures == {}
+    assert token.access_token is None
+    engine.close()
+
+
+def test_async_scanner_uses_the_oauth_api(server_url: str) -> None:
+    token = make_token(server_url)
+    state: Any = SimpleNamespace(
+        listing_planner=ListingPlanner(),
+        listing_cursors=ListingCursors(),
+        request_budget=RequestBudget(),
+        subreddit_breaker=CircuitBreaker(),
+        scanner_token=token,
+    )
+    scanner = AsyncScanner(concurrency=2)
+
+    posts = scanner.scan([["one"], ["two"]], state, access=listing_access(token))
+
+    assert sorted(post.name for post in posts) == ["t3_one1", "t3_two1"]
+    assert token.minted == 1
+    scanner.close()
@@ -0,0 +1,100 @@
+import os
+
+from tor.helpers.outbox import BLOSSOM, REPLY, SUBMIT, Outbox
+from tor.helpers.post_summary import PostSummary
+
+
+def make_post(name: str, created_utc: float = 0) -> PostSummary:
+    return PostSummary(name, subreddit="pics", title="A title", created_utc=created_utc)
+
+
+def test_jobs_survive_a_restart(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "data", "outbox.json")
+    outbox = Outbox(path)
+    job = outbox.add(make_post("t3_a"), "image")
+    outbox.complete(job, SUBMIT, "t3_tor")
+    outbox.complete(job, REPLY)
+
+    reloaded = Outbox(path)
+    [resumed] = reloaded.due()
+    assert resumed.post == make_post("t3_a")
+    assert resumed.content_type == "image"
+    assert resumed.completed == {SUBMIT: "t3_tor", REPLY: True}
+    assert BLOSSOM not in resumed.completed
+
+    reloaded.finish(resumed)
+    assert len(Outbox(path)) == 0
+
+
+def test_adding_a_post_twice_returns_the_same_job() -> None:
+    outbox = Outbox()
+    job = outbox.add(make_post("t3_a"), "image")
+    outbox.complete(job, SUBMIT, "t3_tor")
+
+    assert outbox.add(make_post("t3_a"), "image") is job
+    assert "t3_a" in outbox
+    assert len(outbox) == 1
+
+
+def test_failed_jobs_back_off_exponentially() -> None:
+    outbox = Outbox(base_backoff=10, max_backoff=35)
+    job = outbox.add(make_post("t3_a"), "image")
+
+    delays = []
+    for _ in range(4):
+        outbox.fail(job, ValueError("503"), now=1000)
+        delays.append(job.next_attempt - 1000)
+    assert delays == [10, 20, 35, 35]
+    assert job.last_error == "ValueError: 503"
+    assert outbox.due(now=1000) == []
+    assert outbox.due(now=1035) == [job]
+
+
+def test_due_jobs_are_ordered_oldest_first() -> None:
+    outbox = Outbox()
+    new = outbox.add(make_post("t3_new", created_utc=20), "image")
+    old = outbox.add(make_post("t3_old", created_utc=10), "image")
+
+    assert outbox.due() == [old, new]
+
+
+def test_jobs_that_keep_failing_become_dead_letters(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "outbox.json")
+    outbox = Outbox(path, max_attempts=2)
+    job = outbox.add(make_post("t3_a"), "image")
+
+    assert not outbox.fail(job, ValueError("503"))
+    assert outbox.fail(job, ValueError("403"))
+    assert "t3_a" not in outbox
+    assert [dead.name for dead in Outbox(path).dead_letters] == ["t3_a"]
+
+    outbox.requeue_dead_letters()
+    assert outbox.dead_letters == []
+    [requeued] = outbox.due()
+    assert requeued.name == "t3_a"
+    assert requeued.attempts == 0
+
+
+def test_changes_of_other_processes_are_not_overwritten(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "outbox.json")
+    bot = Outbox(path, max_attempts=1)
+    bot.fail(bot.add(make_post("t3_dead"), "image"), ValueError("403"))
+    bot.add(make_post("t3_a"), "image")
+
+    # `tor outbox --requeue` and `tor backfill` work on the same file
+    Outbox(path).requeue_dead_letters()
+    Outbox(path).add(make_post("t3_backfilled"), "image")
+    bot.finish(bot.add(make_post("t3_a"), "image"))
+
+    assert sorted(job.name for job in Outbox(path).due()) == ["t3_backfilled", "t3_dead"]
+
+
+def test_jobs_of_other_live_processes_are_not_due(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "outbox.json")
+    outbox = Outbox(path)
+    outbox.add(make_post("t3_a"), "image")
+    assert [due.name for due in outbox.due()] == ["t3_a"]
+
+    outbox.jobs["t3_a"].owner = os.getppid()
+    outbox.save()
+    assert outbox.due() == []
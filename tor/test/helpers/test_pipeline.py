@@ -0,0 +1,180 @@
+import threading
+from typing import List
+
+from tor.helpers.pipeline import ScanPipeline
+from tor.helpers.post_summary import PostSummary
+
+
+def make_posts(prefix: str, count: int) -> List[PostSummary]:
+    return [PostSummary(f"t3_{prefix}{i}") for i in range(count)]
+
+
+def test_all_posts_go_through_every_stage() -> None:
+    batches: List[List[str]] = []
+    published: List[str] = []
+
+    def check(posts: List[PostSummary]) -> List[PostSummary]:
+        batches.append([post.name for post in posts])
+        # Blossom already knows about every other post
+        return posts[::2]
+
+    def publish(post: PostSummary) -> bool:
+        published.append(post.name)
+        return True
+
+    pipeline = ScanPipeline(
+        select=lambda posts: [post for post in posts if not post.name.endswith("9")],
+        check=check,
+        publish=publish,
+        batch_size=4,
+    ).start()
+    pipeline.put(make_posts("a", 10))
+    pipeline.put(make_posts("b", 3))
+    stats = pipeline.close()
+
+    assert all(len(batch) <= 4 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 12
+    assert len(published) == 6
+    assert stats["fetched"] == 13
+    assert stats["selected"] == 12
+    assert stats["unseen"] == stats["published"] == 6
+    assert stats["first_published_after"] <= stats["duration"]
+
+
+def test_posts_are_published_while_the_scan_is_still_running() -> None:
+    first_published = threading.Event()
+
+    def publish(post: PostSummary) -> bool:
+        first_published.set()
+        return True
+
+    pipeline = ScanPipeline(
+        select=lambda posts: posts, check=lambda posts: posts, publish=publish, max_wait=0.01
+    ).start()
+    pipeline.put(make_posts("fast", 1))
+    # The slow subreddit hasn't come in yet, the fast one is already published
+    assert first_published.wait(timeout=5)
+    pipeline.put(make_posts("slow", 1))
+
+    assert pipeline.close()["published"] == 2
+
+
+def test_failing_stages_do_not_stop_the_pipeline() -> None:
+    published: List[str] = []
+
+    def check(posts: List[PostSummary]) -> List[PostSummary]:
+        if posts[0].name == "t3_bad0":
+            raise ValueError("Blossom is down")
+        return posts
+
+    def publish(post: PostSummary) -> bool:
+        if post.name == "t3_good1":
+            raise ValueError("Reddit is down")
+        published.append(post.name)
+        return True
+
+    pipeline = ScanPipeline(
+        select=lambda posts: posts, check=check, publish=publish, batch_size=2
+    ).start()
+    pipeline.put(make_posts("bad", 2))
+    pipeline.put(make_posts("good", 2))
+    stats = pipeline.close()
+
+    assert published == ["t3_good0"]
+    assert stats["errors"] == 2
+
+
+def test_posts_are_published_concurrently() -> None:
+    # Only passes if all three posts are being published at the same time
+    barrier = threading.Barrier(3, timeout=5)
+
+    def publish(post: PostSummary) -> bool:
+        barrier.wait()
+        return True
+
+    pipeline = ScanPipeline(
+        select=lambda posts: posts,
+        check=lambda posts: posts,
+        publish=publish,
+        publish_workers=3,
+    ).start()
+    pipeline.put(make_posts("a", 3))
+    stats = pipeline.close()
+
+    assert stats["published"] == 3
+    assert stats["errors"] == 0
+
+
+def test_oldest_posts_are_published_first() -> None:
+    released = threading.Event()
+    published: List[float] = []
+
+    def publish(post: PostSummary) -> bool:
+        released.wait(timeout=5)
+        published.append(post.created_utc)
+        return True
+
+    posts = [PostSummary(f"t3_{i}", created_utc=i) for i in range(10)]
+    pipeline = ScanPipeline(
+        select=lambda posts: posts,
+        # Listings are ordered newest first
+        check=lambda posts: sorted(posts, key=lambda post: -post.created_utc),
+        publish=publish,
+        batch_size=10,
+    ).start()
+    pipeline.put(posts)
+    threading.Timer(0.2, released.set).start()
+    pipeline.close()
+
+    # The first post might have been picked up before the others were checked
+    assert published[1:] == sorted(published[1:])
+    assert len(published) == 10
+
+
+def test_the_schedule_stage_decides_what_is_published_and_in_which_order() -> None:
+    carried_over = PostSummary("t3_carried_over")
+    published: List[str] = []
+
+    def publish(post: PostSummary) -> bool:
+        published.append(post.name)
+        return True
+
+    def schedule(posts: List[PostSummary]) -> List[PostSummary]:
+        # Hold back the posts of the scan, let in the one from before at the end
+        return [] if posts else [carried_over]
+
+    pipeline = ScanPipeline(
+        select=lambda posts: posts,
+        check=lambda posts: posts,
+        publish=publish,
+        schedule=schedule,
+    ).start()
+    pipeline.put(make_posts("a", 3))
+    stats = pipeline.close()
+
+    assert published == ["t3_carried_over"]
+    assert stats["unseen"] == 3
+    assert stats["scheduled"] == stats["published"] == 1
+
+
+def test_the_posts_with_the_lowest_priority_are_published_first() -> None:
+    published: List[str] = []
+    posts = [PostSummary(f"t3_{ups}", ups=ups) for ups in (1, 30, 7)]
+
+    def publish(post: PostSummary) -> bool:
+        published.append(post.name)
+        return True
+
+    pipeline = ScanPipeline(
+        select=lambda posts: posts,
+        check=lambda posts: posts,
+        publish=publish,
+        priority=lambda post: -post.ups,
+        batch_size=3,
+    )
+    # Fill the queue before the publishing starts, so the order isn't down to timing
+    pipeline._enqueue(pipeline.check(posts))
+    pipeline.start()
+    assert pipeline.close()["published"] == 3
+
+    assert published == ["t3_30", "t3_7", "t3_1"]
@@ -0,0 +1,40 @@
+from tor.helpers.batching import ListingPlanner
+from tor.helpers.poll_scheduler import PollScheduler
+
+
+def test_unknown_subreddits_are_due() -> None:
+    assert PollScheduler().due(["a", "b"], now=0) == ["a", "b"]
+
+
+def test_interval_is_bounded() -> None:
+    scheduler = PollScheduler(min_interval=45, max_interval=900)
+
+    assert scheduler.interval(None) == 900
+    assert scheduler.interval(0) == 900
+    assert scheduler.interval(1 / 3600) == 900
+    assert scheduler.interval(1 / 120) == 120
+    assert scheduler.interval(10) == 45
+
+
+def test_reschedule_by_rate() -> None:
+    scheduler = PollScheduler(min_interval=45, max_interval=900, jitter=0)
+    planner = ListingPlanner()
+    planner.rates = {"busy": 1, "quiet": 1 / 300, "failed": 1}
+    planner.last_fetched = {"busy": 1000, "quiet": 1000, "failed": 500}
+
+    scheduler.reschedule(["busy", "quiet", "failed"], planner, since=1000)
+
+    assert scheduler.next_due == {"busy": 1045, "quiet": 1300}
+    assert scheduler.due(["busy", "quiet", "failed"], now=1050) == ["busy", "failed"]
+    assert scheduler.due(["busy", "quiet", "failed"], now=1300) == ["busy", "quiet", "failed"]
+
+
+def test_jitter_stays_within_bounds() -> None:
+    scheduler = PollScheduler(min_interval=45, max_interval=900, jitter=0.5)
+    planner = ListingPlanner()
+    planner.rates = {"busy": 1}
+    planner.last_fetched = {"busy": 0}
+
+    for _ in range(20):
+        scheduler.reschedule(["busy"], planner, since=0)
+        assert scheduler.next_due["busy"] >= 45
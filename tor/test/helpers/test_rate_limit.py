@@ -0,0 +1,67 @@
+import pytest
+
+from tor.helpers.rate_limit import CircuitBreaker, RequestBudget
+
+
+def test_budget_allows_bursts() -> None:
+    budget = RequestBudget(rate=1, burst=3)
+
+    assert [budget.reserve_request(now=budget._updated) for _ in range(3)] == [0, 0, 0]
+    assert budget.reserve_request(now=budget._updated) == 1
+    assert budget.reserve_request(now=budget._updated) == 2
+
+
+def test_budget_spreads_remaining_requests_over_window() -> None:
+    budget = RequestBudget(rate=1, burst=10, reserve=5)
+    now = budget._updated
+
+    budget.update({"x-ratelimit-remaining": "15", "x-ratelimit-reset": "100"}, now=now)
+
+    assert budget.rate == pytest.approx(0.1)
+    assert budget.remaining == 15
+    # 10 tokens left in the bucket, after that one request every 10 seconds
+    delays = [budget.reserve_request(now=now) for _ in range(11)]
+    assert delays[-1] == pytest.approx(10)
+
+
+def test_optional_requests_never_wait() -> None:
+    budget = RequestBudget(rate=1, burst=2)
+    assert budget.try_reserve(now=budget._updated)
+    assert budget.try_reserve(now=budget._updated)
+    assert not budget.try_reserve(now=budget._updated)
+    assert budget.try_reserve(now=budget._updated + 1)
+
+
+def test_budget_ignores_missing_headers() -> None:
+    budget = RequestBudget(rate=1)
+    budget.update({})
+    assert budget.remaining is None
+    assert budget.rate == 1
+
+
+def test_budget_waits_for_reset_after_429() -> None:
+    budget = RequestBudget(rate=1, burst=10)
+    now = budget._updated
+
+    budget.exhausted(retry_after=30, now=now)
+
+    assert budget.reserve_request(now=now + 10) == pytest.approx(20)
+    # After the reset, we can continue as usual
+    assert budget.reserve_request(now=now + 31) == 0
+
+
+def test_circuit_breaker_opens_after_threshold() -> None:
+    breaker = CircuitBreaker(threshold=2, base_backoff=60, max_backoff=100)
+
+    breaker.failure("sub", now=0)
+    assert breaker.allow("sub", now=0)
+    breaker.failure("sub", now=0)
+    assert not breaker.allow("sub", now=59)
+    assert breaker.allow("sub", now=60)
+
+    breaker.failure("sub", now=60)
+    assert breaker.open_until["sub"] == 160  # capped at max_backoff
+
+    breaker.success(["sub"])
+    assert breaker.allow("sub", now=60)
+    assert breaker.failures == {}
@@ -0,0 +1,45 @@
+import os
+from typing import List
+
+import pytest
+
+from tor.helpers.read_marker import ReadMarker
+
+
+def test_items_are_marked_as_read_in_batches() -> None:
+    marker = ReadMarker(batch_size=25)
+    for i in range(60):
+        marker.add(f"t1_{i}")
+    marker.add("t1_0")
+    requests: List[List[str]] = []
+
+    assert marker.flush(requests.append) == 60
+
+    assert [len(batch) for batch in requests] == [25, 25, 10]
+    assert requests[0][0] == "t1_0"
+    assert len(marker) == 0
+    assert marker.flush(requests.append) == 0
+    assert len(requests) == 3
+
+
+def test_pending_items_survive_a_crash(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "pending_reads.json")
+    marker = ReadMarker(path, batch_size=2)
+    for i in range(5):
+        marker.add(f"t1_{i}")
+    calls = 0
+
+    def mark_read(fullnames: List[str]) -> None:
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise ConnectionError("Reddit is down")
+
+    with pytest.raises(ConnectionError):
+        marker.flush(mark_read)
+
+    # Only the batch that Reddit confirmed is gone
+    restarted = ReadMarker(path, batch_size=2)
+    assert restarted.pending == ["t1_2", "t1_3", "t1_4"]
+    assert "t1_2" in restarted
+    assert "t1_0" not in restarted
@@ -0,0 +1,265 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+
+import pytest
+import requests
+
+from tor.helpers.batching import BATCH_LIMIT
+from tor.helpers.cursors import ListingCursors
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.rate_limit import RequestBudget
+from tor.helpers.scanner import (
+    ListingError,
+    ListingRequest,
+    ScannerEngine,
+    read_listing,
+    subreddit_listing_url,
+)
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stragglers = 0
+
+    def do_GET(self) -> None:
+        if self.path == "/hung":
+            time.sleep(1)
+        if self.path == "/straggler":
+            # Only the first request is slow
+            ListingHandler.stragglers += 1
+            if ListingHandler.stragglers == 1:
+                time.sleep(1)
+        body = json.dumps(
+            {
+                "data": {"children": []},
+                "encoding": self.headers.get("Accept-Encoding"),
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ListingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused(server_url: str) -> None:
+    engine = ScannerEngine(max_workers=2)
+    for _ in range(5):
+        assert engine.get(f"{server_url}/r/test/new/.json").ok
+
+    stats = engine.connection_stats()["127.0.0.1"]
+    assert stats == {"requests": 5, "connections": 1, "reused": 4}
+    engine.close()
+
+
+def test_gzip_is_negotiated(server_url: str) -> None:
+    engine = ScannerEngine(max_workers=1)
+    assert engine.get(server_url).json()["encoding"] == "gzip"
+    engine.close()
+
+
+def test_worker_pool_persists() -> None:
+    engine = ScannerEngine(max_workers=3)
+    executor = engine.executor
+    assert engine.executor.submit(sum, [1, 2]).result() == 3
+    assert engine.executor is executor
+    assert engine.adapter.poolmanager.connection_pool_kw["maxsize"] == 3
+    engine.close()
+
+
+def test_requests_have_a_read_deadline(server_url: str) -> None:
+    engine = ScannerEngine(max_workers=1, read_timeout=0.1)
+    with pytest.raises(requests.Timeout):
+        engine.get(f"{server_url}/hung")
+    engine.close()
+
+
+def test_stragglers_are_hedged(server_url: str) -> None:
+    engine = ScannerEngine(max_workers=2)
+    for _ in range(20):
+        engine.latency.add(0.01)
+
+    started = time.monotonic()
+    assert engine.get(f"{server_url}/straggler", RequestBudget()).ok
+    assert time.monotonic() - started < 0.9
+    assert engine.hedged == 1
+    engine.close()
+
+
+def test_stragglers_are_not_hedged_without_budget(server_url: str) -> None:
+    engine = ScannerEngine(max_workers=2)
+    for _ in range(20):
+        engine.latency.add(0.01)
+    budget = RequestBudget(burst=1)
+    budget.reserve_request()
+
+    assert engine.get(f"{server_url}/hung", budget).ok
+    assert engine.hedged == 0
+    engine.close()
+
+
+def test_late_listings_are_carried_over() -> None:
+    engine = ScannerEngine(max_workers=1)
+    job: Future = Future()
+    engine.carry_over(job, ["slow"])
+    assert engine.in_flight == {"slow"}
+    assert engine.take_late_posts() == []
+
+    posts = [PostSummary("t3_late")]
+    job.set_result(posts)
+    assert engine.in_flight == set()
+    assert engine.take_late_posts() == posts
+    assert engine.take_late_posts() == []
+    engine.close()
+
+
+def make_page(start: int, count: int) -> List[PostSummary]:
+    # Listings are ordered newest first
+    ids = range(start + count - 1, start - 1, -1)
+    return [PostSummary(f"t3_{i}", created_utc=i) for i in ids]
+
+
+def test_listing_request_without_cursor_fetches_one_page() -> None:
+    request = ListingRequest(["a", "b"], ListingCursors())
+    assert request.next_url() == "https://www.reddit.com/r/a+b/new/.json?limit=100"
+
+    request.add_page(make_page(0, BATCH_LIMIT))
+    assert request.next_url() is None
+
+
+def test_listing_request_only_asks_for_newest_posts_of_new_subreddit() -> None:
+    request = ListingRequest(["a"], ListingCursors())
+    assert request.next_url() == "https://www.reddit.com/r/a/new/.json?limit=10"
+
+    request.add_page(make_page(0, BATCH_LIMIT))
+    assert request.next_url() is None
+
+
+def test_listing_request_pages_forward_from_cursor() -> None:
+    cursors = ListingCursors()
+    cursors.advance("a", make_page(0, 1), full_listing=True)
+    request = ListingRequest(["a"], cursors)
+    assert request.next_url() == "https://www.reddit.com/r/a/new/.json?limit=100&before=t3_0"
+
+    request.add_page(make_page(1, BATCH_LIMIT))
+    assert request.next_url() == "https://www.reddit.com/r/a/new/.json?limit=100&before=t3_100"
+
+    request.add_page(make_page(101, 5))
+    assert request.next_url() is None
+    names = [post.name for post in request.posts]
+    assert names == [f"t3_{i}" for i in range(105, 0, -1)]
+
+
+def test_listing_request_refresh_pages_back_to_high_water_mark() -> None:
+    cursors = ListingCursors()
+    cursors.advance("a", make_page(60, 1), full_listing=True, now=0)
+    request = ListingRequest(["a"], cursors)
+    assert request.cursor is None
+    assert request.next_url() == "https://www.reddit.com/r/a/new/.json?limit=100"
+
+    request.add_page(make_page(150, BATCH_LIMIT))
+    assert request.next_url() == "https://www.reddit.com/r/a/new/.json?limit=100&after=t3_150"
+
+    request.add_page(make_page(50, BATCH_LIMIT))
+    assert request.next_url() is None
+    assert request.reached_floor
+    names = [post.name for post in request.posts]
+    assert names == [f"t3_{i}" for i in range(249, 49, -1)]
+
+
+def test_listing_request_double_checks_suspicious_empty_page() -> None:
+    cursors = ListingCursors(recheck_after=60)
+    cursors.advance("a", make_page(0, 1), full_listing=True, now=time.time() - 120)
+    request = ListingRequest(["a"], cursors)
+    assert request.next_url() == "https://www.reddit.com/r/a/new/.json?limit=100&before=t3_0"
+
+    request.add_page([])
+    assert request.cursor is None
+    assert request.next_url() == "https://www.reddit.com/r/a/new/.json?limit=100"
+
+    request.add_page(make_page(1, 3))
+    assert request.next_url() is None
+
+
+def test_listing_url_pages_backwards_from_after_cursor() -> None:
+    assert (
+        subreddit_listing_url(["a"], after="t3_0")
+        == "https://www.reddit.com/r/a/new/.json?limit=100&after=t3_0"
+    )
+
+
+def test_read_listing_decodes_post_summaries() -> None:
+    body = json.dumps(
+        {
+            "data": {
+                "children": [
+                    {
+                        "kind": "t3",
+                        "data": {
+                            "subreddit": "pics",
+                            "name": "t3_abc",
+                            "title": "Title",
+                            "permalink": "/r/pics/comments/abc/title/",
+                            "over_18": False,
+                            "is_gallery": True,
+                            "is_self": False,
+                            "domain": "reddit.com",
+                            "ups": 12,
+                            "locked": False,
+                            "archived": False,
+                            "author": "someone",
+                            "url": "https://www.reddit.com/gallery/abc",
+                            "created_utc": 1600000000.0,
+                            "selftext_html": "many more fields that we drop",
+                        },
+                    }
+                ]
+            }
+        }
+    ).encode()
+
+    [post] = read_listing(200, body)
+    assert post == PostSummary(
+        "t3_abc",
+        subreddit="pics",
+        title="Title",
+        permalink="/r/pics/comments/abc/title/",
+        is_gallery=True,
+        domain="reddit.com",
+        ups=12,
+        author="someone",
+        url="https://www.reddit.com/gallery/abc",
+        created_utc=1600000000.0,
+    )
+    assert not hasattr(post, "__dict__")
+
+
+@pytest.mark.parametrize(
+    "status,body,error",
+    [
+        (200, b'{"message": "Too Many Requests", "error": 429}', 429),
+        (503, b"<html>Service Unavailable</html>", 503),
+        (500, b'{"data": {"children": []}}', 500),
+    ],
+)
+def test_read_listing_error_states(status: int, body: bytes, error: int) -> None:
+    with pytest.raises(ListingError) as exc_info:
+        read_listing(status, body)
+    assert exc_info.value.status == error
@@ -0,0 +1,74 @@
+import os
+
+from tor.helpers.seen_index import SeenPostIndex, fullname_to_int
+
+
+def test_fullname_to_int() -> None:
+    assert fullname_to_int("t3_8swl2n") == int("8swl2n", 36)
+    assert fullname_to_int("t3_z") == 35
+
+
+def test_add_and_contains() -> None:
+    index = SeenPostIndex()
+    index.add(["t3_c", "t3_a"], now=100)
+    index.add(["t3_b", "t3_a"], now=200)
+    assert "t3_b" in index
+
+    assert len(index) == 3
+    assert list(index.ids) == [10, 11, 12]
+    assert list(index.seen_at) == [200, 200, 100]
+    assert "t3_a" in index
+    assert "t3_d" not in index
+
+
+def test_evict_old_posts() -> None:
+    index = SeenPostIndex(max_age=50)
+    index.add(["t3_a"], now=100)
+    index.add(["t3_b"], now=160)
+
+    assert index.evict(now=170) == 1
+    assert "t3_a" not in index
+    assert "t3_b" in index
+
+
+def test_persisted_across_restarts(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "state", "seen_posts.idx")
+    index = SeenPostIndex(path)
+    index.add(["t3_8swl2n", "t3_abc"], now=100)
+    index.save()
+
+    restored = SeenPostIndex(path)
+    assert list(restored.ids) == list(index.ids)
+    assert list(restored.seen_at) == [100, 100]
+    assert "t3_8swl2n" in restored
+
+
+def test_additions_are_merged_in_batches() -> None:
+    index = SeenPostIndex()
+    index.add(["t3_a", "t3_c"], now=100)
+    index.merge()
+    index.add(["t3_b"], now=200)
+    index.add(["t3_c"], now=300)
+
+    assert list(index.ids) == [10, 12]
+    assert "t3_b" in index
+    index.merge()
+    assert list(index.ids) == [10, 11, 12]
+    assert list(index.seen_at) == [100, 200, 300]
+
+
+def test_saving_keeps_what_another_process_saved(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "seen_posts.idx")
+    bot = SeenPostIndex(path)
+    backfill = SeenPostIndex(path)
+
+    bot.add(["t3_a"], now=100)
+    bot.save()
+    backfill.add(["t3_b"], now=200)
+    backfill.save()
+    bot.add(["t3_c", "t3_a"], now=300)
+    bot.save()
+
+    index = SeenPostIndex(path)
+    assert list(index.ids) == [10, 11, 12]
+    assert list(index.seen_at) == [300, 200, 300]
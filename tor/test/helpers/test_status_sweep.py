@@ -0,0 +1,19 @@
+from tor.helpers.status_sweep import chunked, partner_fullname
+
+
+def test_partner_fullname() -> None:
+    assert partner_fullname("https://www.reddit.com/r/pics/comments/8swl2n/a_title/") == "t3_8swl2n"
+    assert partner_fullname("https://reddit.com/r/pics/comments/8SWL2N") == "t3_8swl2n"
+    assert partner_fullname("https://redd.it/8swl2n") == "t3_8swl2n"
+    assert partner_fullname("https://i.redd.it/8swl2n.png") is None
+    assert partner_fullname("https://imgur.com/a/8swl2n") is None
+
+
+def test_chunked() -> None:
+    names = [f"t3_{i}" for i in range(250)]
+
+    chunks = list(chunked(names))
+
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    assert sum(chunks, []) == names
+    assert list(chunked([])) == []
@@ -0,0 +1,23 @@
+from unittest.mock import MagicMock
+
+from tor.helpers.bulkcheck import DuplicateFilter
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.seen_index import SeenPostIndex
+from tor.helpers.threaded_worker import select_candidates
+
+
+def test_select_candidates_holds_reposts_of_the_same_media() -> None:
+    cfg = MagicMock()
+    cfg.seen_posts = SeenPostIndex()
+    cfg.seen_posts.add(["t3_old"])
+    first = PostSummary("t3_a", url="https://i.redd.it/1.png", domain="i.redd.it", created_utc=10)
+    repost = PostSummary("t3_b", url="https://i.redd.it/1.png", domain="i.redd.it", created_utc=20)
+    crosspost = PostSummary("t3_c", domain="i.redd.it", crosspost_parent="t3_old")
+    duplicate_filter = DuplicateFilter(cfg.seen_posts)
+
+    assert select_candidates([repost, first, crosspost], duplicate_filter, cfg) == [first]
+
+    # The repost waits for the first post, the crosspost of a known post is done with
+    assert duplicate_filter.held == {"t3_a": ["t3_b"]}
+    assert "t3_c" in cfg.seen_posts
+    assert "t3_b" not in cfg.seen_posts
@@ -0,0 +1,37 @@
+from tor.helpers.post_summary import PostSummary
+from tor.helpers.watchlist import UpvoteWatchlist
+
+
+def test_posts_are_watched_until_they_expire() -> None:
+    watchlist = UpvoteWatchlist(expiry=100)
+    watchlist.add(PostSummary("t3_a"), now=0)
+    watchlist.add(PostSummary("t3_b"), now=50)
+    # Seeing a watched post again doesn't extend its expiry
+    watchlist.add(PostSummary("t3_a"), now=90)
+
+    assert watchlist.start_recheck(now=99) == ["t3_a", "t3_b"]
+    assert watchlist.start_recheck(now=100) == ["t3_b"]
+    assert "t3_a" not in watchlist
+    assert watchlist.get("t3_b") == PostSummary("t3_b")
+
+
+def test_a_full_watchlist_drops_the_post_closest_to_expiring() -> None:
+    watchlist = UpvoteWatchlist(max_size=2)
+    for i in range(3):
+        watchlist.add(PostSummary(f"t3_{i}"), now=i)
+
+    assert len(watchlist) == 2
+    assert "t3_0" not in watchlist
+
+
+def test_the_watched_posts_are_rechecked_once_per_interval() -> None:
+    watchlist = UpvoteWatchlist(interval=600)
+
+    assert watchlist.due(now=0)
+    watchlist.start_recheck(now=0)
+    assert not watchlist.due(now=599)
+    assert watchlist.due(now=600)
+
+    watchlist.add(PostSummary("t3_a"))
+    watchlist.remove("t3_a")
+    assert len(watchlist) == 0